@@ -1,444 +1,738 @@
 import os
-import xml.etree.ElementTree as ET
-from flask import Flask, request, render_template, redirect, flash, jsonify
-from openai import OpenAI
+import threading
+from flask import Blueprint, Flask, Response, current_app, g, request, render_template, redirect, flash, jsonify, url_for
 from dotenv import load_dotenv
 from werkzeug.utils import secure_filename
 import time
-from openai import RateLimitError
 import logging
 import traceback
 from datetime import datetime
-import hashlib
 import json
-from functools import lru_cache
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
-
-# Set up logging
-logging.basicConfig(
-    filename='app.log',
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
+import re
+from watcher import IngestPipeline, PipelineEventHandler
+from ttml_parser import (
+    hash_and_extract_segments, render_transcript
 )
+from upload_stream import HashingRequest
+from metrics import (
+    CACHE_LOOKUP_SECONDS, CACHE_REQUESTS, CHUNK_COUNT, PARSE_SECONDS, PRESUMMARIZE_SECONDS, PRESUMMARIZE_TOKENS,
+    REQUEST_SECONDS, TraceIdFilter, new_trace_id, render as render_metrics, trace_id_var
+)
+from rate_limiter import RateLimiter
+from summarizer import is_complete, map_reduce_summarize, PROMPT_VERSION
+from chunking import chunk_transcript, chunk_stats, log_chunk_stats
+from jobs import JobQueue, SharedJobQueue
+from cache_store import SQLiteCacheStore, MemoryLRUCache, TieredCacheStore, migrate_json_cache, variant_key
 
-# Create a console handler for immediate feedback during development
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO)
-console_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-console_handler.setFormatter(console_formatter)
-logging.getLogger().addHandler(console_handler)
+# Importing this module is cheap: logging, directories and the cache database are
+# set up by create_app(), and the OpenAI client is only built for the first summary.
 
-# Load environment variables
+# Load environment variables; the settings below are read from them
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-if not OPENAI_API_KEY:
-    logging.error("OpenAI API key not found. Please check your .env file.")
-    raise ValueError("OpenAI API key not found. Please check your .env file.")
-
-# Initialize OpenAI client
-try:
-    client = OpenAI(api_key=OPENAI_API_KEY)
-    logging.info("OpenAI client initialized successfully")
-except Exception as e:
-    logging.error(f"Failed to initialize OpenAI client: {str(e)}")
-    raise
-
-# Initialize Flask app
-app = Flask(__name__)
-app.secret_key = os.getenv("SECRET_KEY", 'supersecretkey')
-app.config['UPLOAD_FOLDER'] = os.getenv("UPLOAD_FOLDER", './uploads')
-app.config['ALLOWED_EXTENSIONS'] = {'ttml'}
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # Limit upload size to 16MB
-
-# Create upload directory if it doesn't exist
-if not os.path.exists(app.config['UPLOAD_FOLDER']):
-    try:
-        os.makedirs(app.config['UPLOAD_FOLDER'])
-        logging.info(f"Created upload directory: {app.config['UPLOAD_FOLDER']}")
-    except Exception as e:
-        logging.error(f"Failed to create upload directory: {str(e)}")
-        raise
+# Summarization settings
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+SUMMARY_MAX_WORKERS = int(os.getenv("SUMMARY_MAX_WORKERS", 4))
+# Stream completions token by token to the results page instead of per chunk
+SUMMARY_STREAM_TOKENS = os.getenv("SUMMARY_STREAM_TOKENS", "false").lower() in ("1", "true", "yes")
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", 3000))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", 100))
+# Local pre-pass (needs numpy) that drops boilerplate and keeps this fraction of a
+# transcript's tokens, the most salient segments, before chunking; 0 turns it off
+PRESUMMARIZE_RATIO = float(os.getenv("PRESUMMARIZE_RATIO", 0))
+# Segments repeated in this many other recent episodes are dropped as boilerplate
+BOILERPLATE_MIN_EPISODES = int(os.getenv("BOILERPLATE_MIN_EPISODES", 2))
+BOILERPLATE_HISTORY = int(os.getenv("BOILERPLATE_HISTORY", 500))
+
+# Shared rate limiter so concurrent uploads stay within one API budget
+rate_limiter = RateLimiter(
+    requests_per_minute=int(os.getenv("OPENAI_REQUESTS_PER_MINUTE", 60)),
+    tokens_per_minute=int(os.getenv("OPENAI_TOKENS_PER_MINUTE", 90000))
+)
 
-# Set up cache directory
+UPLOAD_FOLDER = os.getenv("UPLOAD_FOLDER", './uploads')
+
+# Background workers for uploads; each job summarizes its chunks on its own pool
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+# "memory" runs jobs in this process; "shared" queues them in JOBS_DB_PATH for the
+# single job runner started by serve.py, so several web workers can share them
+JOB_QUEUE = os.getenv("JOB_QUEUE", "memory")
+
+# OpenAI HTTP client: every summary worker of every job shares one keep-alive pool,
+# sized so each of them can hold a connection
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+OPENAI_HTTP2 = os.getenv("OPENAI_HTTP2", "false").lower() in ("1", "true", "yes")
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", JOB_WORKERS * SUMMARY_MAX_WORKERS))
+OPENAI_KEEPALIVE_SECONDS = float(os.getenv("OPENAI_KEEPALIVE_SECONDS", 30))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", 10))
+OPENAI_READ_TIMEOUT = float(os.getenv("OPENAI_READ_TIMEOUT", 120))
+
+# Uploads directory watcher: files must be unchanged this long before they are read
+WATCHER_WORKERS = int(os.getenv("WATCHER_WORKERS", 2))
+WATCHER_SETTLE_SECONDS = float(os.getenv("WATCHER_SETTLE_SECONDS", 2))
+# Extra directories watched recursively and processed in place, e.g. the Podcasts
+# TTML cache, so files never need to be copied into the uploads folder
+INGEST_DIRS = [os.path.expanduser(d) for d in os.getenv("INGEST_DIRS", "").split(os.pathsep) if d]
+
+# Transcripts, summaries and chunk summaries share one SQLite database
 CACHE_DIR = os.path.join(os.path.dirname(__file__), 'cache')
-if not os.path.exists(CACHE_DIR):
-    try:
-        os.makedirs(CACHE_DIR)
-        logging.info(f"Created cache directory: {CACHE_DIR}")
-    except Exception as e:
-        logging.error(f"Failed to create cache directory: {str(e)}")
-        raise
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", os.path.join(CACHE_DIR, 'cache.db'))
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", os.path.join(CACHE_DIR, 'jobs.db'))
+BOILERPLATE_DB_PATH = os.getenv("BOILERPLATE_DB_PATH", os.path.join(CACHE_DIR, 'boilerplate.db'))
+CACHE_TTL_DAYS = float(os.getenv("CACHE_TTL_DAYS", 30))
+CACHE_MAX_MB = float(os.getenv("CACHE_MAX_MB", 1024))
+MEMORY_CACHE_MB = float(os.getenv("MEMORY_CACHE_MB", 64))
+MEMORY_CACHE_TTL_SECONDS = float(os.getenv("MEMORY_CACHE_TTL_SECONDS", 60 * 60))
+
+# Most files returned by one /search request
+SEARCH_MAX_RESULTS = 100
+
+bp = Blueprint('main', __name__)
+
+_client = None
+_cache_store = None
+_job_queue = None
+_boilerplate_index = None
+_init_lock = threading.Lock()
+_logging_configured = False
+
+def configure_logging():
+    """Log to app.log and the console, prefixing lines with their trace id. Safe to call repeatedly."""
+    global _logging_configured
+    with _init_lock:
+        if _logging_configured:
+            return
+        logging.basicConfig(
+            filename='app.log',
+            level=logging.INFO,
+            format='%(asctime)s - %(levelname)s - %(trace_prefix)s%(message)s',
+            datefmt='%Y-%m-%d %H:%M:%S'
+        )
+
+        # Create a console handler for immediate feedback during development
+        console_handler = logging.StreamHandler()
+        console_handler.setLevel(logging.INFO)
+        console_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(trace_prefix)s%(message)s')
+        console_handler.setFormatter(console_formatter)
+        logging.getLogger().addHandler(console_handler)
+
+        # Prefix log lines with the trace id of the upload they belong to
+        for handler in logging.getLogger().handlers:
+            handler.addFilter(TraceIdFilter())
+        _logging_configured = True
+
+def ensure_directory(path):
+    """Create a directory if it doesn't exist."""
+    if not os.path.exists(path):
+        try:
+            os.makedirs(path)
+            logging.info(f"Created directory: {path}")
+        except Exception as e:
+            logging.error(f"Failed to create directory {path}: {str(e)}")
+            raise
+
+def get_client():
+    """The OpenAI client, created (and the openai package imported) on first use."""
+    global _client
+    if _client is None:
+        with _init_lock:
+            if _client is None:
+                if not OPENAI_API_KEY:
+                    logging.error("OpenAI API key not found. Please check your .env file.")
+                    raise ValueError("OpenAI API key not found. Please check your .env file.")
+                from openai_client import create_client
+                _client = create_client(
+                    OPENAI_API_KEY,
+                    base_url=OPENAI_BASE_URL,
+                    max_connections=OPENAI_MAX_CONNECTIONS,
+                    keepalive_expiry=OPENAI_KEEPALIVE_SECONDS,
+                    http2=OPENAI_HTTP2,
+                    connect_timeout=OPENAI_CONNECT_TIMEOUT,
+                    read_timeout=OPENAI_READ_TIMEOUT
+                )
+                logging.info("OpenAI client initialized successfully")
+    return _client
+
+def get_cache_store():
+    """The shared cache, opened (and migrated) on first use."""
+    global _cache_store
+    if _cache_store is None:
+        with _init_lock:
+            if _cache_store is None:
+                ensure_directory(CACHE_DIR)
+                ensure_directory(os.path.dirname(os.path.abspath(CACHE_DB_PATH)))
+                # Hot entries are served from an in-memory LRU in front of the database
+                store = TieredCacheStore(
+                    SQLiteCacheStore(
+                        CACHE_DB_PATH,
+                        ttl_seconds=CACHE_TTL_DAYS * 24 * 60 * 60,
+                        max_bytes=int(CACHE_MAX_MB * 1024 * 1024) if CACHE_MAX_MB else None
+                    ),
+                    MemoryLRUCache(
+                        max_bytes=int(MEMORY_CACHE_MB * 1024 * 1024),
+                        ttl_seconds=MEMORY_CACHE_TTL_SECONDS
+                    )
+                )
+                # One-off import of caches written by earlier versions (cache/<hash>.json)
+                migrate_json_cache(store, CACHE_DIR)
+                _cache_store = store
+    return _cache_store
+
+def get_job_queue():
+    """The job queue selected by JOB_QUEUE, created on first use."""
+    global _job_queue
+    if _job_queue is None:
+        with _init_lock:
+            if _job_queue is None:
+                if JOB_QUEUE == "shared":
+                    _job_queue = SharedJobQueue(JOBS_DB_PATH, handlers=[process_upload_job], max_workers=JOB_WORKERS)
+                else:
+                    _job_queue = JobQueue(max_workers=JOB_WORKERS)
+    return _job_queue
+
+def get_boilerplate_index():
+    """Fingerprints of recent episodes for the pre-summarization pass, opened on first use."""
+    global _boilerplate_index
+    if _boilerplate_index is None:
+        with _init_lock:
+            if _boilerplate_index is None:
+                # Loads numpy; only imported when PRESUMMARIZE_RATIO is set
+                from presummarize import BoilerplateIndex
+                _boilerplate_index = BoilerplateIndex(BOILERPLATE_DB_PATH, history=BOILERPLATE_HISTORY)
+    return _boilerplate_index
+
+def create_app():
+    """
+    Application factory used by `python app.py` and WSGI servers (`gunicorn "app:create_app()"`).
+
+    Opens the cache up front so the first request doesn't pay for it. The
+    OpenAI client is still created lazily, so a cache-only deployment can
+    serve cached results without an API key.
+    """
+    configure_logging()
+    if not OPENAI_API_KEY:
+        logging.warning("OpenAI API key not found; only cached results can be served.")
+
+    app = Flask(__name__)
+    # Uploaded files are hashed while the request body is received
+    app.request_class = HashingRequest
+    app.secret_key = os.getenv("SECRET_KEY", 'supersecretkey')
+    app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+    app.config['ALLOWED_EXTENSIONS'] = {'ttml'}
+    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # Limit upload size to 16MB
+
+    ensure_directory(UPLOAD_FOLDER)
+    get_cache_store()
+    get_job_queue()
+    app.register_blueprint(bp)
+    return app
 
 def allowed_file(filename):
     """Check if the file has an allowed extension."""
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
-
-def format_timestamp(seconds):
-    """Format seconds into HH:MM:SS format."""
-    try:
-        h = int(seconds // 3600)
-        m = int((seconds % 3600) // 60)
-        s = int(seconds % 60)
-        return f"{h:02}:{m:02}:{s:02}"
-    except Exception as e:
-        logging.error(f"Error formatting timestamp {seconds}: {str(e)}")
-        return "00:00:00"  # Return default on error
-
-def extract_transcript(ttml_content, include_timestamps=False):
-    """Extract transcript from TTML content."""
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']
+
+def presummarize_transcript(transcript, file_hash=None):
+    """
+    Trim boilerplate, repeats and the least salient segments locally before chunking (see presummarize.py).
+
+    Episodes are remembered under file_hash so boilerplate shared with later
+    episodes of the same show can be recognized. Returns the transcript
+    unchanged if numpy is not installed.
+    """
+    from presummarize import np, presummarize
+    if np is None:
+        logging.warning("PRESUMMARIZE_RATIO is set but numpy is not installed; summarizing the full transcript")
+        return transcript
     try:
-        root = ET.fromstring(ttml_content)
-        transcript = []
-
-        # Find all <p> elements in the TTML file
-        paragraphs = root.findall(".//{http://www.w3.org/ns/ttml}p")
-        logging.info(f"Found {len(paragraphs)} paragraphs in TTML content")
-
-        for paragraph in paragraphs:
-            paragraph_text = ""
-            for span in paragraph.findall(".//{http://www.w3.org/ns/ttml}span"):
-                if span.text:
-                    paragraph_text += span.text.strip() + " "
-
-            paragraph_text = paragraph_text.strip()
-            if paragraph_text:
-                if include_timestamps and "begin" in paragraph.attrib:
-                    try:
-                        timestamp = format_timestamp(float(paragraph.attrib["begin"].replace("s", "")))
-                        transcript.append(f"[{timestamp}] {paragraph_text}")
-                    except ValueError:
-                        logging.warning(f"Invalid timestamp format: {paragraph.attrib['begin']}")
-                        transcript.append(paragraph_text)
-                else:
-                    transcript.append(paragraph_text)
-
-        result = "\n\n".join(transcript)
-        logging.info(f"Successfully extracted transcript with {len(transcript)} segments")
-        return result
-
-    except ET.ParseError as e:
-        error_msg = f"Error parsing TTML file: {e}"
-        logging.error(error_msg)
-        return error_msg
+        with PRESUMMARIZE_SECONDS.time():
+            trimmed, stats = presummarize(
+                transcript,
+                keep_ratio=PRESUMMARIZE_RATIO,
+                boilerplate=get_boilerplate_index(),
+                file_hash=file_hash,
+                min_episodes=BOILERPLATE_MIN_EPISODES,
+                min_tokens=CHUNK_MAX_TOKENS,
+                model=OPENAI_MODEL
+            )
     except Exception as e:
-        error_msg = f"Unexpected error extracting transcript: {str(e)}"
-        logging.error(error_msg)
-        logging.error(traceback.format_exc())
-        return f"Error processing transcript: {str(e)}"
-
-def summarize_transcript(transcript):
-    """Summarize transcript using OpenAI API with chunking and retry logic."""
+        logging.error(f"Pre-summarization failed, summarizing the full transcript: {str(e)}")
+        return transcript
+    PRESUMMARIZE_TOKENS.inc(stats["tokens_after"], result="kept")
+    PRESUMMARIZE_TOKENS.inc(stats["tokens_before"] - stats["tokens_after"], result="removed")
+    return trimmed
+
+def summarize_transcript(transcript, progress=None, delta=None, file_hash=None):
+    """
+    Summarize transcript using OpenAI API with chunking and concurrent, rate-limited requests.
+
+    `progress`, if given, is called as progress(stage, index, total, summary) when each chunk completes;
+    `delta`, if given, streams completions and is called as delta(stage, index, text) as text arrives.
+    `file_hash` identifies the episode to the pre-summarization pass, if enabled.
+    """
     logging.info(f"Starting transcript summarization (length: {len(transcript)} characters)")
-
-    # Use fewer, larger chunks with a more efficient strategy
-    max_chunk_size = 4000  # Larger chunks mean fewer API calls
-    transcript_chunks = [transcript[i:i + max_chunk_size] for i in range(0, len(transcript), max_chunk_size)]
+    if PRESUMMARIZE_RATIO > 0:
+        transcript = presummarize_transcript(transcript, file_hash)
+
+    # Pack whole paragraphs into chunks sized by the model's token budget
+    transcript_chunks = chunk_transcript(
+        transcript,
+        max_tokens=CHUNK_MAX_TOKENS,
+        overlap_tokens=CHUNK_OVERLAP_TOKENS,
+        model=OPENAI_MODEL
+    )
     logging.info(f"Split transcript into {len(transcript_chunks)} chunks")
-
-    # Add a delay between initial requests to avoid hitting rate limits immediately
-    summaries = []
-
-    for i, chunk in enumerate(transcript_chunks):
-        chunk_start_time = time.time()
-        logging.info(f"Processing chunk {i+1}/{len(transcript_chunks)} (size: {len(chunk)} characters)")
-
-        # Add initial delay between chunks to avoid immediate rate limiting
-        if i > 0:
-            time.sleep(3)  # Wait 3 seconds between initial requests
-
-        retry_count = 0
-        max_retries = 8  # Increase max retries
-        success = False
-
-        while retry_count < max_retries and not success:
-            try:
-                response = client.chat.completions.create(
-                    model="gpt-3.5-turbo",  # Consider using a model with higher rate limits
-                    messages=[
-                        {"role": "system", "content": "You are a helpful assistant that summarizes podcast transcripts."},
-                        {"role": "user", "content": f"Summarize the following podcast transcript in bullet points:\n\n{chunk}"}
-                    ],
-                    max_tokens=300
-                )
-                summary_text = response.choices[0].message.content.strip()
-                summaries.append(summary_text)
-                success = True
-                logging.info(f"Successfully summarized chunk {i+1} (took {time.time() - chunk_start_time:.2f}s)")
-            except RateLimitError as e:
-                retry_count += 1
-                wait_time = min(60, 2 ** retry_count)  # Cap at 60 seconds max wait
-                logging.warning(f"Rate limit exceeded. Retrying in {wait_time} seconds... (Attempt {retry_count}/{max_retries})")
-                time.sleep(wait_time)
-            except Exception as e:
-                error_msg = f"Error summarizing chunk {i+1}: {str(e)}"
-                logging.error(error_msg)
-                logging.error(traceback.format_exc())
-                break
-
-        # If we've exhausted retries, add a placeholder
-        if not success:
-            error_msg = f"Failed to summarize chunk {i+1} after {max_retries} attempts"
-            logging.error(error_msg)
-            summaries.append("*[This section could not be summarized due to API limitations]*")
-
-    result = "\n\n".join(summaries)
-    logging.info(f"Completed transcript summarization with {len(summaries)} summary sections")
+    CHUNK_COUNT.observe(len(transcript_chunks))
+    log_chunk_stats(chunk_stats(transcript_chunks, CHUNK_MAX_TOKENS, OPENAI_MODEL))
+
+    # Chunks are summarized in parallel (map), then merged into one summary (reduce);
+    # the shared limiter keeps us inside the API quota and unchanged chunks come from cache
+    result = map_reduce_summarize(
+        get_client(),
+        transcript_chunks,
+        rate_limiter,
+        max_workers=SUMMARY_MAX_WORKERS,
+        cache_get=get_chunk_summary_from_cache,
+        cache_save=save_chunk_summary_to_cache,
+        model=OPENAI_MODEL,
+        max_tokens=300,
+        reduce_input_tokens=CHUNK_MAX_TOKENS,
+        progress=progress,
+        delta=delta
+    )
+
+    logging.info(f"Completed transcript summarization of {len(transcript_chunks)} chunks")
     return result
 
 # Caching functions
-def get_file_hash(content):
-    """Generate a unique hash for file content."""
-    return hashlib.md5(content.encode('utf-8')).hexdigest()
-
-def get_cache_path(file_hash):
-    """Get the path to the cache file for a given hash."""
-    return os.path.join(CACHE_DIR, f"{file_hash}.json")
-
-def save_to_cache(file_hash, transcript, summary, include_timestamps=False):
-    """Save processing results to cache."""
+def get_processing_options(include_timestamps=False):
+    """Every setting that changes the summary of a file; all of them are part of its cache key."""
+    options = {
+        'include_timestamps': bool(include_timestamps),
+        'model': OPENAI_MODEL,
+        'prompt_version': PROMPT_VERSION,
+        'chunk_max_tokens': CHUNK_MAX_TOKENS,
+        'chunk_overlap_tokens': CHUNK_OVERLAP_TOKENS
+    }
+    # Only part of the key when enabled, so summaries cached without the pre-pass stay valid
+    if PRESUMMARIZE_RATIO > 0:
+        options['presummarize_ratio'] = PRESUMMARIZE_RATIO
+    return options
+
+def get_cache_key(file_hash, include_timestamps=False):
+    """Composite cache key for the summary of a file processed with the current options."""
+    return variant_key(file_hash, get_processing_options(include_timestamps))
+
+def save_to_cache(file_hash, summary, include_timestamps=False):
+    """Save the summary of a file to the cache; its transcript is cached when it is extracted."""
+    if not is_complete(summary):
+        # Partial summaries are shown but not cached, so the file is summarized again next time
+        logging.warning(f"Not caching summary for hash {file_hash}: some chunks could not be summarized")
+        return False
     try:
-        cache_data = {
-            'transcript': transcript,
-            'summary': summary,
-            'timestamp': time.time(),
-            'include_timestamps': include_timestamps
-        }
-
-        with open(get_cache_path(file_hash), 'w', encoding='utf-8') as f:
-            json.dump(cache_data, f)
-
-        logging.info(f"Saved results to cache for hash: {file_hash}")
+        get_cache_store().put(
+            get_cache_key(file_hash, include_timestamps),
+            file_hash,
+            summary,
+            get_processing_options(include_timestamps)
+        )
+        logging.info(f"Saved results to cache for hash: {file_hash} (timestamps: {include_timestamps})")
         return True
     except Exception as e:
         logging.error(f"Failed to save to cache: {str(e)}")
         return False
 
-def get_from_cache(file_hash):
-    """Retrieve processing results from cache if available."""
-    cache_path = get_cache_path(file_hash)
-
-    if not os.path.exists(cache_path):
-        logging.info(f"No cache found for hash: {file_hash}")
-        return None
+def timed_cache_lookup(kind, lookup, *args):
+    """Run a cache read, recording its latency and whether it hit."""
+    with CACHE_LOOKUP_SECONDS.time(kind=kind):
+        value = lookup(*args)
+    CACHE_REQUESTS.inc(kind=kind, result="miss" if value is None else "hit")
+    return value
 
+def get_from_cache(file_hash, include_timestamps=False):
+    """Retrieve the cached summary for a file and timestamp setting if available."""
     try:
-        with open(cache_path, 'r', encoding='utf-8') as f:
-            cache_data = json.load(f)
-
-        # Optional: Check if cache is too old (e.g., older than 30 days)
-        cache_age = time.time() - cache_data.get('timestamp', 0)
-        if cache_age > 30 * 24 * 60 * 60:  # 30 days in seconds
-            logging.info(f"Cache expired for hash: {file_hash}")
+        cache_data = timed_cache_lookup("summary", get_cache_store().get, get_cache_key(file_hash, include_timestamps))
+        if cache_data is None:
+            logging.info(f"No cache found for hash: {file_hash} (timestamps: {include_timestamps})")
             return None
 
-        logging.info(f"Retrieved results from cache for hash: {file_hash}")
+        logging.info(f"Retrieved results from cache for hash: {file_hash} (timestamps: {include_timestamps})")
         return cache_data
     except Exception as e:
         logging.error(f"Failed to read from cache: {str(e)}")
         return None
 
-# Memory-based cache for frequently accessed results
-@lru_cache(maxsize=50)
-def get_cached_summary_memory(file_hash):
-    """In-memory cache for the most recently accessed summaries."""
-    cache_data = get_from_cache(file_hash)
-    if cache_data:
-        return cache_data.get('summary')
-    return None
-
-# File watcher for the uploads directory
-class UploadsHandler(FileSystemEventHandler):
-    def on_created(self, event):
-        if event.is_directory:
-            return
-        if event.src_path.endswith(".ttml"):
-            logging.info(f"New file detected in uploads: {event.src_path}")
-            self.process_file(event.src_path)
-
-    def process_file(self, file_path):
-        try:
-            filename = os.path.basename(file_path)
-            logging.info(f"Processing file: {filename}")
+def get_transcript_from_cache(file_hash, include_timestamps=False):
+    """Retrieve a previously extracted transcript, or None."""
+    try:
+        return timed_cache_lookup("transcript", get_cache_store().get_transcript, file_hash, include_timestamps)
+    except Exception as e:
+        logging.error(f"Failed to read transcript from cache: {str(e)}")
+        return None
 
-            # Read file content
-            with open(file_path, 'r', encoding='utf-8') as f:
-                ttml_content = f.read()
+def save_transcript_to_cache(file_hash, segments):
+    """Save the (begin, text) segments of a file, from which both transcript renderings are served."""
+    try:
+        get_cache_store().put_segments(file_hash, segments)
+        return True
+    except Exception as e:
+        logging.error(f"Failed to save transcript to cache: {str(e)}")
+        return False
 
-            # Generate hash for caching
-            file_hash = get_file_hash(ttml_content)
-            logging.info(f"File hash: {file_hash}")
+def extract_upload(file_hash, upload):
+    """
+    Return (segments, stored): the (begin, text) segments parsed while an upload was received,
+    and whether the cache holds them, saving them if they are new.
+
+    `upload` is the request's HashingUploadStream. Parse errors propagate so
+    they are reported instead of being summarized.
+    """
+    segments = upload.segments()
+    PARSE_SECONDS.observe(upload.parse_seconds, source="upload")
+    stored = get_transcript_from_cache(file_hash) is not None or save_transcript_to_cache(file_hash, segments)
+    return segments, stored
+
+def get_chunk_summary_from_cache(chunk_key):
+    """Retrieve a cached chunk summary by its content key, or None."""
+    try:
+        return timed_cache_lookup("chunk", get_cache_store().get_chunk, chunk_key)
+    except Exception as e:
+        logging.error(f"Failed to read chunk summary from cache: {str(e)}")
+        return None
 
-            # Check if already processed (default without timestamps)
-            cached_data = get_from_cache(file_hash)
-            if cached_data:
-                logging.info(f"File already processed: {filename}")
-                return
+def save_chunk_summary_to_cache(chunk_key, summary):
+    """Save a chunk summary under its content key."""
+    try:
+        get_cache_store().put_chunk(chunk_key, summary)
+        return True
+    except Exception as e:
+        logging.error(f"Failed to save chunk summary to cache: {str(e)}")
+        return False
 
-            # Process file
-            include_timestamps = False  # Default setting
-            transcript = extract_transcript(ttml_content, include_timestamps)
-            summary = summarize_transcript(transcript)
+# File watcher for the uploads directory
+class UploadsHandler(PipelineEventHandler):
+    """Hands TTML files appearing in the uploads directory to the ingest pipeline without blocking."""
 
-            # Save to cache
-            save_to_cache(file_hash, transcript, summary, include_timestamps)
+    def on_created(self, event):
+        if not event.is_directory and event.src_path.endswith(".ttml"):
+            logging.info(f"New file detected in uploads: {event.src_path}")
+        super().on_created(event)
+
+def extract_watched_file(file_path):
+    """Pipeline extract step: hash and parse a settled file in a single read; returns (file_hash, segments)."""
+    with PARSE_SECONDS.time(source="watcher"):
+        return hash_and_extract_segments(file_path)
+
+def process_watched_file(file_path, file_hash, segments):
+    """Pipeline worker: summarize and cache a settled file already extracted by extract_watched_file."""
+    filename = os.path.basename(file_path)
+    logging.info(f"Processing file: {filename} (hash: {file_hash})")
+
+    # Process file (default without timestamps)
+    include_timestamps = False
+    save_transcript_to_cache(file_hash, segments)
+    summary = summarize_transcript(render_transcript(segments, include_timestamps), file_hash=file_hash)
+    if not is_complete(summary):
+        raise RuntimeError(f"Some chunks of {filename} could not be summarized; it will be retried when next seen")
+
+    # Save to cache
+    save_to_cache(file_hash, summary, include_timestamps)
+
+    logging.info(f"Successfully processed file: {filename}")
+
+def is_file_processed(file_hash):
+    """True if the default (no timestamps) variant of a file is already cached."""
+    return get_from_cache(file_hash, False) is not None
+
+# Watched files are settled, de-duplicated by content hash and processed on their own workers
+uploads_pipeline = IngestPipeline(
+    process_watched_file,
+    workers=WATCHER_WORKERS,
+    settle_seconds=WATCHER_SETTLE_SECONDS,
+    is_done=is_file_processed,
+    extract=extract_watched_file,
+    name="uploads"
+)
 
-            logging.info(f"Successfully processed file: {filename}")
-        except Exception as e:
-            error_msg = f"Error processing file {file_path}: {str(e)}"
-            logging.error(error_msg)
-            logging.error(traceback.format_exc())
+def process_upload_job(job, file_hash, include_timestamps, segments=None):
+    """
+    Background job: summarize an extracted upload, publishing each chunk summary as it completes.
 
-@app.route('/')
+    Without `segments` (jobs on the shared queue) the transcript is read from the cache.
+    """
+    job.set_stage("summarizing")
+    if segments is not None:
+        transcript = render_transcript(segments, include_timestamps)
+    else:
+        transcript = get_transcript_from_cache(file_hash, include_timestamps)
+        if transcript is None:
+            raise RuntimeError(f"Transcript {file_hash} is missing from the cache")
+    summary = summarize_transcript(
+        transcript,
+        progress=job.chunk_done,
+        delta=job.chunk_delta if SUMMARY_STREAM_TOKENS else None,
+        file_hash=file_hash
+    )
+
+    save_to_cache(file_hash, summary, include_timestamps)
+    return summary
+
+def wants_json():
+    """True when the client asked for JSON rather than an HTML page."""
+    return request.args.get('format') == 'json' or (
+        request.accept_mimetypes.accept_json and not request.accept_mimetypes.accept_html
+    )
+
+def upload_error(message, status=400):
+    """Report a rejected upload: a JSON error for API clients, otherwise a flash message and redirect."""
+    if wants_json():
+        return jsonify({"error": message}), status
+    flash(message)
+    return redirect(request.url)
+
+@bp.before_app_request
+def start_request_trace():
+    """Time the request and give it a trace id (the client's X-Request-ID, if sent)."""
+    g.request_started = time.perf_counter()
+    client_trace_id = request.headers.get('X-Request-ID', '')
+    # Only accept short, log-safe ids from clients
+    g.trace_id = client_trace_id if re.fullmatch(r'[\w.\-]{1,64}', client_trace_id) else new_trace_id()
+    g.trace_token = trace_id_var.set(g.trace_id)
+
+@bp.after_app_request
+def record_request_metrics(response):
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    REQUEST_SECONDS.observe(
+        time.perf_counter() - g.request_started,
+        method=request.method,
+        endpoint=endpoint,
+        status=response.status_code
+    )
+    response.headers['X-Request-ID'] = g.trace_id
+    return response
+
+@bp.teardown_app_request
+def end_request_trace(error=None):
+    token = g.pop('trace_token', None)
+    if token is not None:
+        trace_id_var.reset(token)
+
+@bp.route('/')
 def index():
     """Render the main page."""
     logging.info("Accessed main page")
     return render_template('index.html')
 
-@app.route('/upload', methods=['POST'])
+@bp.route('/upload', methods=['POST'])
 def upload_file():
-    """Handle file upload from web interface with caching."""
+    """Handle file upload from web interface; serve cached results or queue a background job."""
     logging.info("File upload initiated")
 
     # Check if file part exists in request
     if 'file' not in request.files:
         logging.warning("No file part in request")
-        flash('No file part')
-        return redirect(request.url)
+        return upload_error('No file part')
 
     file = request.files['file']
 
     # Check if filename is empty
     if file.filename == '':
         logging.warning("Empty filename submitted")
-        flash('No selected file')
-        return redirect(request.url)
+        return upload_error('No selected file')
 
     # Process valid file
     if file and allowed_file(file.filename):
         try:
-            # Save file
             filename = secure_filename(file.filename)
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_path)
-            logging.info(f"File saved: {file_path}")
-
-            # Read file content
-            with open(file_path, 'r', encoding='utf-8') as f:
-                ttml_content = f.read()
 
             # Get user preferences
             include_timestamps = 'timestamps' in request.form
 
-            # Generate hash for caching
-            file_hash = get_file_hash(ttml_content)
-            logging.info(f"File hash: {file_hash}")
+            # The hash was computed while the upload was received (see upload_stream);
+            # the file is not written to the uploads folder or read back
+            file_hash = file.stream.hexdigest()
+            logging.info(f"File hash: {file_hash} ({file.stream.size} bytes)")
 
-            # Check cache first
-            cached_data = get_from_cache(file_hash)
+            # Check cache first; each timestamp setting is cached as its own variant
+            cached_data = get_from_cache(file_hash, include_timestamps)
             if cached_data:
                 logging.info(f"Using cached results for {filename}")
-
-                # Check if the cached version matches the timestamp preference
-                cached_timestamps = cached_data.get('include_timestamps', False)
-
-                if include_timestamps == cached_timestamps:
-                    summary = cached_data.get('summary')
-                    return render_template('result.html', transcript=summary, from_cache=True)
-                else:
-                    logging.info(f"Timestamp preference differs from cache, reprocessing")
-
-            # Process file if not in cache or timestamps setting differs
-            logging.info(f"Processing file with timestamps: {include_timestamps}")
-
-            # Extract and summarize transcript
-            transcript = extract_transcript(ttml_content, include_timestamps)
-            summary = summarize_transcript(transcript)
-
-            # Save to cache
-            save_to_cache(file_hash, transcript, summary, include_timestamps)
-
-            logging.info(f"Successfully processed file: {filename}")
-            return render_template('result.html', transcript=summary, from_cache=False)
+                summary = cached_data.get('summary')
+                if wants_json():
+                    return jsonify({"status": "done", "result": summary, "from_cache": True})
+                return render_template('result.html', transcript=summary, from_cache=True)
+
+            # Cache miss: only the summary runs in the background job. Extraction stays in the
+            # request because it already happened while the body was received (see upload_stream),
+            # so it adds no wait, and a malformed upload can be rejected with a 400 instead of
+            # becoming a failed job. Uploads of the same content and options share one job.
+            segments, stored = extract_upload(file_hash, file.stream)
+            if not segments:
+                logging.warning(f"No transcript text in {filename}")
+                return upload_error('No transcript text found in file')
+            queue = get_job_queue()
+            # Jobs on the shared queue are stored as JSON and run in the runner process, which
+            # reads the transcript back from the cache; the in-process queue takes the segments as they are
+            if isinstance(queue, SharedJobQueue):
+                if not stored:
+                    return upload_error('Could not store the transcript, please try again', 503)
+                segment_args = ()
+            else:
+                segment_args = (segments,)
+            logging.info(f"Queueing file with timestamps: {include_timestamps}")
+            job, created = queue.submit(
+                get_cache_key(file_hash, include_timestamps),
+                process_upload_job,
+                file_hash,
+                include_timestamps,
+                *segment_args,
+                filename=filename
+            )
+
+            if wants_json():
+                return jsonify({
+                    "job_id": job.id,
+                    "status": job.status,
+                    "status_url": url_for('main.job_status', job_id=job.id),
+                    "events_url": url_for('main.job_events', job_id=job.id)
+                }), 202
+            return redirect(url_for('main.job_page', job_id=job.id))
 
         except Exception as e:
             error_msg = f"Error processing file {file.filename}: {str(e)}"
             logging.error(error_msg)
             logging.error(traceback.format_exc())
-            flash(f'Error processing file: {str(e)}')
-            return redirect(request.url)
+            return upload_error(f'Error processing file: {str(e)}')
     else:
         logging.warning(f"Invalid file type: {file.filename}")
-        flash('Invalid file type')
-        return redirect(request.url)
+        return upload_error('Invalid file type')
+
+@bp.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Report the status and progress of a background job."""
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+@bp.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Stream job progress as server-sent events until the job finishes."""
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    def stream():
+        cursor = 0
+        while True:
+            events = job.wait_for_events(cursor, timeout=15)
+            if not events:
+                # Comment line keeps proxies from closing an idle connection
+                yield ": keep-alive\n\n"
+            for event, data in events:
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+            cursor += len(events)
+            if any(event in ("done", "failed") for event, _ in events):
+                break
+
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
 
-@app.route('/cache/stats', methods=['GET'])
+@bp.route('/jobs/<job_id>/view', methods=['GET'])
+def job_page(job_id):
+    """Render a page that follows a background job and shows its summary when done."""
+    job = get_job_queue().get(job_id)
+    if job is None:
+        flash('Job not found or expired')
+        return redirect(url_for('main.index'))
+    return render_template('job.html', job=job.to_dict())
+
+@bp.route('/cache/stats', methods=['GET'])
 def cache_stats():
     """View cache statistics."""
     try:
-        if not os.path.exists(CACHE_DIR):
-            return jsonify({"error": "Cache directory does not exist"}), 404
-
-        cache_files = [f for f in os.listdir(CACHE_DIR) if f.endswith('.json')]
-        total_size = sum(os.path.getsize(os.path.join(CACHE_DIR, f)) for f in cache_files)
-
-        stats = {
-            "cache_entries": len(cache_files),
-            "total_size_bytes": total_size,
-            "total_size_mb": round(total_size / (1024 * 1024), 2),
-            "cache_directory": CACHE_DIR
-        }
+        stats = get_cache_store().stats()
+        # The database can live outside CACHE_DIR (CACHE_DB_PATH); report where it actually is
+        stats["database"] = os.path.abspath(CACHE_DB_PATH)
+        stats["cache_directory"] = os.path.dirname(stats["database"])
 
-        logging.info(f"Cache stats: {len(cache_files)} entries, {stats['total_size_mb']} MB")
+        logging.info(f"Cache stats: {stats['cache_entries']} entries, {stats['total_size_mb']} MB")
         return jsonify(stats)
     except Exception as e:
         logging.error(f"Error getting cache stats: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
-@app.route('/cache/clear', methods=['POST'])
-def clear_cache():
-    """Clear the cache."""
+@bp.route('/search', methods=['GET'])
+def search_transcripts():
+    """Full-text search over cached transcripts: ranked files with the begin time of each matching segment."""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"error": "Missing search query parameter 'q'"}), 400
     try:
-        if not os.path.exists(CACHE_DIR):
-            return jsonify({"error": "Cache directory does not exist"}), 404
+        limit = min(max(int(request.args.get('limit', 20)), 1), SEARCH_MAX_RESULTS)
+    except ValueError:
+        return jsonify({"error": "'limit' must be a number"}), 400
 
-        cache_files = [f for f in os.listdir(CACHE_DIR) if f.endswith('.json')]
-        for file in cache_files:
-            os.remove(os.path.join(CACHE_DIR, file))
+    try:
+        started = time.perf_counter()
+        with CACHE_LOOKUP_SECONDS.time(kind="search"):
+            results = get_cache_store().search(query, limit)
+        return jsonify({
+            "query": query,
+            "results": results,
+            "took_ms": round((time.perf_counter() - started) * 1000, 2)
+        })
+    except Exception as e:
+        logging.error(f"Error searching transcripts: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
-        # Also clear the in-memory cache
-        get_cached_summary_memory.cache_clear()
+@bp.route('/cache/clear', methods=['POST'])
+def clear_cache():
+    """Clear the cache."""
+    try:
+        # Clears the in-memory tier, transcripts and chunk summaries too,
+        # otherwise re-processing would just reuse them
+        cleared = get_cache_store().clear()
 
-        logging.info(f"Cleared {len(cache_files)} cache entries")
-        return jsonify({"message": f"Cleared {len(cache_files)} cache entries"})
+        logging.info(f"Cleared {cleared} cache entries")
+        return jsonify({"message": f"Cleared {cleared} cache entries"})
     except Exception as e:
         logging.error(f"Error clearing cache: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
-@app.errorhandler(413)
+@bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Expose request, parse, API and cache metrics in the Prometheus text format."""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+@bp.app_errorhandler(413)
 def request_entity_too_large(error):
     """Handle file too large error."""
     logging.warning("File upload too large")
     return jsonify({"error": "File too large"}), 413
 
-@app.errorhandler(500)
+@bp.app_errorhandler(500)
 def internal_server_error(error):
     """Handle internal server errors."""
     logging.error(f"Internal server error: {str(error)}")
     return jsonify({"error": "Internal server error"}), 500
 
-@app.route('/health')
+@bp.route('/health')
 def health_check():
     """Simple health check endpoint."""
     try:
         # Check OpenAI API
-        client.models.list()
+        get_client().models.list()
         api_status = "ok"
+        from openai_client import pool_stats
+        api_pool = pool_stats()
     except Exception as e:
         logging.error(f"Health check - OpenAI API error: {str(e)}")
         api_status = "error"
+        api_pool = None
 
     # Check cache directory
     cache_status = "ok" if os.path.exists(CACHE_DIR) else "error"
@@ -448,21 +742,43 @@ def health_check():
         "timestamp": datetime.now().isoformat(),
         "components": {
             "openai_api": api_status,
+            "openai_pool": api_pool,
             "cache": cache_status
         }
     })
 
-if __name__ == "__main__":
-    # Start the file watcher for the uploads directory
-    event_handler = UploadsHandler()
+def start_watchers():
+    """Start the ingest pipeline and watch the uploads folder and INGEST_DIRS; returns the observer."""
+    # Only processes that watch directories need the observer machinery
+    from watchdog.observers import Observer
+
+    uploads_pipeline.start()
+    event_handler = UploadsHandler(uploads_pipeline)
     observer = Observer()
-    observer.schedule(event_handler, app.config['UPLOAD_FOLDER'], recursive=False)
+    observer.schedule(event_handler, UPLOAD_FOLDER, recursive=False)
     observer.start()
-    logging.info(f"Started file watcher for directory: {app.config['UPLOAD_FOLDER']}")
+    logging.info(f"Started file watcher for directory: {UPLOAD_FOLDER}")
+    for ingest_dir in INGEST_DIRS:
+        if not os.path.isdir(ingest_dir):
+            logging.warning(f"Ingest directory does not exist: {ingest_dir}")
+            continue
+        observer.schedule(event_handler, ingest_dir, recursive=True)
+        logging.info(f"Started file watcher for directory: {ingest_dir} (processed in place)")
+
+    # Pick up files dropped while the app was not running
+    uploads_pipeline.rescan(UPLOAD_FOLDER)
+    for ingest_dir in INGEST_DIRS:
+        uploads_pipeline.rescan(ingest_dir, recursive=True)
+    return observer
+
+if __name__ == "__main__":
+    app = create_app()
+    observer = start_watchers()
 
     try:
         logging.info("Starting Flask application")
         app.run(debug=True)
     except KeyboardInterrupt:
         observer.stop()
-    observer.join()
\ No newline at end of file
+    observer.join()
+    uploads_pipeline.stop()
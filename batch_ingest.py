@@ -0,0 +1,243 @@
+# batch_ingest.py
+"""
+Batch ingestion of whole directories of TTML files.
+
+Files are hashed and, unless already cached, extracted in a process pool
+across all cores. Summaries are
+produced by a small thread pool that shares the app's rate limiter, so the
+API quota is respected however many files are in flight. Progress is
+appended to a JSON-lines manifest; re-running the same command skips every
+file already recorded as done, so an interrupted backfill resumes where it
+stopped.
+
+Usage:
+    python batch_ingest.py /path/to/ttml/archive [--timestamps] [--dry-run]
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from summarizer import is_complete
+from ttml_parser import hash_file, iter_paragraphs, render_transcript
+
+DEFAULT_MANIFEST = "batch_manifest.jsonl"
+
+
+def find_ttml_files(directory):
+    """Return every .ttml file below directory, sorted for a stable processing order."""
+    paths = []
+    for root, _, filenames in os.walk(directory):
+        for filename in filenames:
+            if filename.endswith(".ttml"):
+                paths.append(os.path.join(root, filename))
+    return sorted(paths)
+
+
+def load_manifest(manifest_path):
+    """Read the checkpoint manifest; the last record for a path wins."""
+    records = {}
+    if not os.path.exists(manifest_path):
+        return records
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                records[record["path"]] = record
+            except (ValueError, KeyError):
+                # A line cut short by an interrupted run
+                continue
+    return records
+
+
+def append_manifest(manifest_path, record):
+    with open(manifest_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime
+
+
+def hash_ttml_file(path):
+    """Process-pool worker: hash one file without parsing it."""
+    # Same hash as uploads and the watcher, so batch and web share cache entries
+    return {"path": path, "hash": hash_file(path)}
+
+
+def extract_file(path, file_hash):
+    """Process-pool worker: extract the paragraphs of one file that is not cached yet."""
+    started = time.time()
+    # Parse errors propagate so the file is recorded as failed rather than summarized
+    with open(path, "rb") as f:
+        paragraphs = list(iter_paragraphs(f))
+    return {
+        "path": path,
+        "hash": file_hash,
+        "paragraphs": paragraphs,
+        "segments": len(paragraphs),
+        "extract_seconds": round(time.time() - started, 3),
+    }
+
+
+class ThroughputMeter:
+    """Counts processed files and reports files/min."""
+
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.started = time.time()
+
+    def tick(self):
+        self.done += 1
+
+    @property
+    def files_per_minute(self):
+        elapsed = time.time() - self.started
+        return self.done / elapsed * 60 if elapsed > 0 else 0.0
+
+    def report(self):
+        return f"{self.done}/{self.total} files ({self.files_per_minute:.1f} files/min)"
+
+
+def summarize_file(app_module, result, include_timestamps):
+    """Summarize an extracted transcript through the app's shared rate-limited pipeline and cache it."""
+    app_module.save_transcript_to_cache(result["hash"], result["paragraphs"])
+    transcript = render_transcript(result["paragraphs"], include_timestamps)
+    summary = app_module.summarize_transcript(transcript, file_hash=result["hash"])
+    if not is_complete(summary):
+        # Recorded as failed in the manifest, so the next run retries the file
+        raise RuntimeError("some chunks could not be summarized")
+    app_module.save_to_cache(result["hash"], summary, include_timestamps)
+    return result
+
+
+def run_batch(directory, include_timestamps=False, dry_run=False, workers=None, summary_jobs=2,
+              manifest_path=DEFAULT_MANIFEST, limit=None):
+    """Process every TTML file below directory; return a dict of counts and throughput."""
+    manifest = load_manifest(manifest_path)
+    pending = []
+    for path in find_ttml_files(directory):
+        size, mtime = file_signature(path)
+        record = manifest.get(path)
+        if (record and record.get("status") == "done" and record.get("size") == size
+                and record.get("mtime") == mtime and record.get("include_timestamps") == include_timestamps):
+            continue
+        pending.append((path, size, mtime))
+    if limit:
+        pending = pending[:limit]
+
+    counts = {"found": len(pending), "extracted": 0, "cached": 0, "summarized": 0, "failed": 0}
+    print(f"{len(pending)} files to process ({len(manifest)} already in manifest)")
+    if not pending:
+        return counts
+
+    # The app (and its OpenAI client) is only needed once summaries are requested
+    app_module = None
+    if not dry_run:
+        import app as app_module
+        app_module.configure_logging()
+
+    meter = ThroughputMeter(len(pending))
+    signatures = {path: (size, mtime) for path, size, mtime in pending}
+    queue = list(reversed(pending))
+    workers = workers or os.cpu_count() or 1
+    # Bound the number of extracted transcripts held in memory at once
+    max_in_flight = workers * 2 + summary_jobs
+
+    def record(result, status, error=None):
+        size, mtime = signatures[result["path"]]
+        entry = {
+            "path": result["path"],
+            "hash": result.get("hash"),
+            "size": size,
+            "mtime": mtime,
+            "include_timestamps": include_timestamps,
+            "segments": result.get("segments"),
+            "status": status,
+            "finished_at": time.time(),
+        }
+        if error:
+            entry["error"] = error
+        if not dry_run:
+            append_manifest(manifest_path, entry)
+        meter.tick()
+        if meter.done % 25 == 0 or meter.done == meter.total:
+            print(f"Progress: {meter.report()}")
+
+    with ProcessPoolExecutor(max_workers=workers) as extractors, \
+            ThreadPoolExecutor(max_workers=summary_jobs, thread_name_prefix="batch-summarize") as summarizers:
+        in_flight = {}
+        while queue or in_flight:
+            while queue and len(in_flight) < max_in_flight:
+                path, _, _ = queue.pop()
+                in_flight[extractors.submit(hash_ttml_file, path)] = ("hash", path)
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, path = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logging.error(f"Batch {stage} failed for {path}: {str(e)}")
+                    counts["failed"] += 1
+                    record({"path": path}, "failed", str(e))
+                    continue
+
+                if stage == "summarize":
+                    counts["summarized"] += 1
+                    record(result, "done")
+                    continue
+
+                if stage == "hash":
+                    # Cached files are never parsed
+                    if not dry_run and app_module.get_from_cache(result["hash"], include_timestamps):
+                        counts["cached"] += 1
+                        record(result, "done")
+                    else:
+                        in_flight[extractors.submit(extract_file, path, result["hash"])] = ("extract", path)
+                    continue
+
+                counts["extracted"] += 1
+                if dry_run:
+                    record(result, "extracted")
+                else:
+                    in_flight[summarizers.submit(summarize_file, app_module, result, include_timestamps)] = (
+                        "summarize", path
+                    )
+
+    counts["files_per_minute"] = round(meter.files_per_minute, 1)
+    counts["elapsed_seconds"] = round(time.time() - meter.started, 1)
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract and summarize a directory of TTML files.")
+    parser.add_argument("directory", help="Directory to scan recursively for .ttml files")
+    parser.add_argument("--timestamps", action="store_true", help="Include timestamps in transcripts")
+    parser.add_argument("--dry-run", action="store_true", help="Only extract transcripts; no API calls or cache writes")
+    parser.add_argument("--workers", type=int, default=None, help="Extraction processes (default: CPU count)")
+    parser.add_argument("--summary-jobs", type=int, default=2,
+                        help="Files summarized concurrently; all share the app's rate limiter (default: 2)")
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST, help=f"Checkpoint manifest (default: {DEFAULT_MANIFEST})")
+    parser.add_argument("--limit", type=int, default=None, help="Process at most this many files")
+    args = parser.parse_args(argv)
+
+    counts = run_batch(
+        args.directory,
+        include_timestamps=args.timestamps,
+        dry_run=args.dry_run,
+        workers=args.workers,
+        summary_jobs=args.summary_jobs,
+        manifest_path=args.manifest,
+        limit=args.limit
+    )
+    print(json.dumps(counts, indent=2))
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,642 @@
+# benchmark.py
+"""
+Benchmarks for extraction, chunking, caching, pre-summarization and the end-to-end upload path.
+
+Synthetic TTML episodes of configurable length are generated on the fly.
+The upload benchmark drives /upload through the Flask test client against
+a local fake OpenAI server with configurable latency and 429 rate, so no
+API key or network access is needed. Results are written as JSON so runs
+can be compared between releases.
+
+Usage:
+    python benchmark.py [--durations 1,60,600] [--cache-entries 10000]
+                        [--latency 0.05] [--rate-limit-ratio 0.1] [--output results.json]
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from chunking import chunk_transcript, tiktoken
+from cache_codec import CODEC_NAMES, Codec, decode_segments, encode_segments, zstandard
+from cache_store import MemoryLRUCache, SQLiteCacheStore, TieredCacheStore, variant_key
+from presummarize import BoilerplateIndex, np, presummarize
+from ttml_parser import iter_paragraphs, render_transcript
+
+BENCHMARKS = ("startup", "extract", "chunk", "cache", "storage", "search", "presummarize", "upload")
+# Modules whose cumulative import time is reported by the startup benchmark
+STARTUP_MODULES = ("app", "flask", "openai", "watchdog.observers")
+WORDS = (
+    "the a and of to in that it is was for on with as we you this they be at so but about what "
+    "podcast episode really think know people just like going actually thing right because "
+    "question interesting story time world years different important something remember"
+).split()
+
+
+def generate_ttml(duration_minutes, seed=0, seconds_per_paragraph=6.0):
+    """Return a synthetic Apple Podcasts style TTML document covering duration_minutes of speech."""
+    rng = random.Random(seed)
+    out = [
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        '<tt xmlns="http://www.w3.org/ns/ttml" '
+        'xmlns:podcasts="http://podcasts.apple.com/transcript-ttml-internal" xml:lang="en">'
+        '<head><metadata/></head><body dur="{:.3f}"><div>'.format(duration_minutes * 60)
+    ]
+    t = 0.0
+    end = duration_minutes * 60
+    while t < end:
+        length = rng.uniform(0.5, 1.5) * seconds_per_paragraph
+        out.append(f'<p begin="{t:.3f}" end="{t + length:.3f}" podcasts:speaker="SPEAKER_{rng.randint(1, 2)}">')
+        # Roughly 2.5 words per second, grouped into sentences of word spans
+        words = max(1, int(length * 2.5))
+        while words > 0:
+            sentence = min(words, rng.randint(5, 15))
+            words -= sentence
+            out.append('<span podcasts:unit="sentence">')
+            for _ in range(sentence):
+                out.append(f'<span podcasts:unit="word">{rng.choice(WORDS)}</span> ')
+            out.append('</span>')
+        out.append('</p>')
+        t += length
+    out.append('</div></body></tt>')
+    return "".join(out)
+
+
+def usage_for(prompt, content):
+    """Token usage as the API reports it, estimated at ~4 characters per token."""
+    prompt_tokens, completion_tokens = len(prompt) // 4, len(content) // 4
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+
+def timed(func, repeat=1):
+    """Run func repeat times; return (best seconds, last result)."""
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+class FakeOpenAIServer:
+    """
+    Minimal OpenAI-compatible HTTP server for chat completions.
+
+    Each request sleeps `latency` seconds; a `rate_limit_ratio` fraction of
+    completion requests is answered with 429 and a retry-after-ms header (or
+    a Retry-After header in seconds, with retry_after_header="retry-after").
+    The first completion requests can be given fixed status codes with
+    `statuses`, e.g. (429, 500) to test retries. Streaming (stream=true)
+    responses are sent as server-sent events.
+    """
+
+    def __init__(self, latency=0.05, rate_limit_ratio=0.0, retry_after_ms=50, seed=0, statuses=(),
+                 retry_after_header="retry-after-ms"):
+        self.latency = latency
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after_ms = retry_after_ms
+        self.retry_after_header = retry_after_header
+        self._statuses = list(statuses)
+        self.requests = 0
+        self.rate_limited = 0
+        self.connections = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-openai", daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self):
+        with self._lock:
+            return {"requests": self.requests, "rate_limited": self.rate_limited, "connections": self.connections}
+
+    def _next_status(self):
+        """Status code for the next completion request: scripted, 429 at rate_limit_ratio, otherwise 200."""
+        with self._lock:
+            self.requests += 1
+            if self._statuses:
+                status = self._statuses.pop(0)
+            else:
+                status = 429 if self._rng.random() < self.rate_limit_ratio else 200
+            if status == 429:
+                self.rate_limited += 1
+            return status
+
+    def _retry_after(self):
+        if self.retry_after_header == "retry-after-ms":
+            return {"retry-after-ms": str(self.retry_after_ms)}
+        return {self.retry_after_header: f"{self.retry_after_ms / 1000:g}"}
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                # One handler per TCP connection; fewer connections than requests means keep-alive works
+                super().setup()
+                with fake._lock:
+                    fake.connections += 1
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, body, headers=None):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path.rstrip("/").endswith("/models"):
+                    self._send_json(200, {"object": "list", "data": [{"id": "fake", "object": "model"}]})
+                else:
+                    self._send_json(404, {"error": {"message": "not found"}})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if not self.path.endswith("/chat/completions"):
+                    self._send_json(404, {"error": {"message": "not found"}})
+                    return
+
+                time.sleep(fake.latency)
+                status = fake._next_status()
+                if status == 429:
+                    self._send_json(429, {"error": {"message": "Rate limit reached", "type": "requests"}},
+                                    fake._retry_after())
+                    return
+                if status != 200:
+                    self._send_json(status, {"error": {"message": f"Fake error {status}", "type": "server_error"}})
+                    return
+
+                prompt = body.get("messages", [{}])[-1].get("content", "")
+                content = f"Summary of {len(prompt.split())} words: " + " ".join(prompt.split()[-20:])
+                completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+                base = {"id": completion_id, "created": int(time.time()), "model": body.get("model", "fake")}
+                if not body.get("stream"):
+                    self._send_json(200, dict(base, object="chat.completion", choices=[{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }], usage=usage_for(prompt, content)))
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                pieces = content.split(" ")
+                for i, piece in enumerate(pieces):
+                    chunk = dict(base, object="chat.completion.chunk", choices=[{
+                        "index": 0,
+                        "delta": {"content": piece + (" " if i < len(pieces) - 1 else "")},
+                        "finish_reason": None,
+                    }])
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                done = dict(base, object="chat.completion.chunk",
+                            choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}])
+                self.wfile.write(f"data: {json.dumps(done)}\n\n".encode("utf-8"))
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    usage = dict(base, object="chat.completion.chunk", choices=[], usage=usage_for(prompt, content))
+                    self.wfile.write(f"data: {json.dumps(usage)}\n\n".encode("utf-8"))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.close_connection = True
+
+        return Handler
+
+
+STARTUP_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app()
+created = time.perf_counter()
+print(json.dumps({
+    "import_seconds": imported - started,
+    "create_app_seconds": created - imported,
+    "openai_imported": "openai" in sys.modules,
+}))
+"""
+
+
+def bench_startup(repeat=3):
+    """
+    Time `import app` and create_app() in fresh interpreters, as a pre-fork worker would.
+
+    Also reports the cumulative `-X importtime` figures of the heaviest
+    dependencies, to show which imports are (or are no longer) paid at startup.
+    """
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    best = None
+    importtime = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, CACHE_DB_PATH=os.path.join(tmp, "cache.db"), UPLOAD_FOLDER=os.path.join(tmp, "uploads"),
+                   PYTHONPATH=package_dir + os.pathsep + os.environ.get("PYTHONPATH", ""))
+        for _ in range(repeat):
+            run = subprocess.run([sys.executable, "-X", "importtime", "-c", STARTUP_SCRIPT], cwd=tmp, env=env,
+                                 capture_output=True, text=True, check=True)
+            timing = json.loads(run.stdout.strip().splitlines()[-1])
+            if best is None or timing["import_seconds"] < best["import_seconds"]:
+                best = timing
+                importtime = {}
+                for line in run.stderr.splitlines():
+                    parts = line.split("|")
+                    if len(parts) == 3 and parts[2].strip() in STARTUP_MODULES:
+                        importtime[parts[2].strip()] = int(parts[1]) / 1e6
+    return dict(
+        {key: round(value, 4) if isinstance(value, float) else value for key, value in best.items()},
+        importtime_seconds={name: round(importtime.get(name, 0.0), 4) for name in STARTUP_MODULES}
+    )
+
+
+def bench_extract(durations, repeat=3):
+    results = []
+    for minutes in durations:
+        ttml = generate_ttml(minutes, seed=minutes)
+        size = len(ttml.encode("utf-8"))
+        seconds, transcript = timed(lambda: render_transcript(iter_paragraphs(ttml.encode("utf-8"))), repeat)
+        results.append({
+            "duration_minutes": minutes,
+            "ttml_bytes": size,
+            "segments": transcript.count("\n\n") + 1 if transcript else 0,
+            "seconds": round(seconds, 6),
+            "mb_per_second": round(size / 1024 / 1024 / seconds, 2) if seconds else None,
+        })
+    return results
+
+
+def bench_chunk(durations, repeat=3, max_tokens=3000, overlap_tokens=100):
+    results = []
+    for minutes in durations:
+        transcript = render_transcript(iter_paragraphs(generate_ttml(minutes, seed=minutes).encode("utf-8")))
+        seconds, chunks = timed(lambda: chunk_transcript(transcript, max_tokens, overlap_tokens), repeat)
+        results.append({
+            "duration_minutes": minutes,
+            "transcript_chars": len(transcript),
+            "chunks": len(chunks),
+            "seconds": round(seconds, 6),
+        })
+    return results
+
+
+def bench_cache(entries=10000, summary_bytes=2000):
+    """Time puts and gets against the SQLite store and the tiered store in a temporary database."""
+    rng = random.Random(0)
+    summary = "".join(rng.choice(WORDS) + " " for _ in range(summary_bytes // 6))[:summary_bytes]
+    keys = [variant_key(f"{i:032x}", {"include_timestamps": False}) for i in range(entries)]
+
+    def rate(seconds):
+        return round(entries / seconds, 1) if seconds else None
+
+    results = {"entries": entries, "summary_bytes": len(summary)}
+    with tempfile.TemporaryDirectory() as tmp:
+        disk = SQLiteCacheStore(os.path.join(tmp, "cache.db"), max_bytes=None)
+        seconds, _ = timed(lambda: [disk.put(key, key[:32], summary) for key in keys])
+        results["sqlite_put_per_second"] = rate(seconds)
+        seconds, _ = timed(lambda: [disk.get(key) for key in keys])
+        results["sqlite_get_per_second"] = rate(seconds)
+        seconds, _ = timed(lambda: [disk.put_chunk(key, summary) for key in keys])
+        results["sqlite_chunk_put_per_second"] = rate(seconds)
+        seconds, _ = timed(lambda: [disk.get_chunk(key) for key in keys])
+        results["sqlite_chunk_get_per_second"] = rate(seconds)
+
+        tiered = TieredCacheStore(disk, MemoryLRUCache(max_bytes=entries * (summary_bytes + 1024)))
+        seconds, _ = timed(lambda: [tiered.get(key) for key in keys])
+        results["tiered_cold_get_per_second"] = rate(seconds)
+        seconds, _ = timed(lambda: [tiered.get(key) for key in keys])
+        results["tiered_warm_get_per_second"] = rate(seconds)
+        stats = disk.stats()
+        results["database_mb"] = round(os.path.getsize(os.path.join(tmp, "cache.db")) / 1024 / 1024, 2)
+        results["cache_entries"] = stats["cache_entries"]
+    return results
+
+
+def bench_storage(durations, repeat=3, training_episodes=30):
+    """
+    Compression ratio and encode/decode latency of cached transcripts and summaries.
+
+    Each episode is compared with its two rendered transcripts stored as
+    plain text, as the cache did before; the dictionary is trained on other
+    synthetic episodes, as the store trains it on earlier ones.
+    """
+    rng = random.Random(1)
+    summary = "".join(rng.choice(WORDS) + " " for _ in range(300)).encode("utf-8")
+    training = [
+        encode_segments(list(iter_paragraphs(generate_ttml(10, seed=1000 + i).encode("utf-8"))))
+        for i in range(training_episodes)
+    ]
+
+    results = []
+    for codec_id, name in CODEC_NAMES.items():
+        if name == "zstd" and zstandard is None:
+            continue
+        codec = Codec(codec=codec_id)
+        codec.add_dictionary(1, codec.codec, codec.train(training))
+        for minutes in durations:
+            segments = list(iter_paragraphs(generate_ttml(minutes, seed=minutes).encode("utf-8")))
+            raw_bytes = sum(len(render_transcript(segments, ts).encode("utf-8")) for ts in (False, True))
+            data = encode_segments(segments)
+            encode_seconds, blob = timed(lambda: codec.compress(data, 1), repeat)
+            decode_seconds, _ = timed(lambda: decode_segments(codec.decompress(blob)), repeat)
+            render_seconds, _ = timed(lambda: render_transcript(decode_segments(codec.decompress(blob)), True), repeat)
+            results.append({
+                "codec": name,
+                "duration_minutes": minutes,
+                "text_bytes": raw_bytes,
+                "stored_bytes": len(blob),
+                "ratio": round(raw_bytes / len(blob), 2),
+                "ratio_without_dictionary": round(raw_bytes / len(codec.compress(data)), 2),
+                "encode_seconds": round(encode_seconds, 6),
+                "decode_seconds": round(decode_seconds, 6),
+                "decode_and_render_seconds": round(render_seconds, 6),
+            })
+        blob = codec.compress(summary, 1)
+        results.append({
+            "codec": name,
+            "summary_bytes": len(summary),
+            "ratio": round(len(summary) / len(blob), 2),
+            "ratio_without_dictionary": round(len(summary) / len(codec.compress(summary)), 2),
+            "decode_seconds": round(timed(lambda: codec.decompress(blob), repeat)[0], 6),
+        })
+    return results
+
+
+def synthetic_segments(minutes, seed, topic):
+    """(begin, text) segments like iter_paragraphs yields, with `topic` mentioned once, without TTML parsing."""
+    rng = random.Random(seed)
+    segments = []
+    t = 0.0
+    while t < minutes * 60:
+        segments.append((f"{t:.3f}", " ".join(rng.choice(WORDS) for _ in range(15))))
+        t += 6.0
+    index = rng.randrange(len(segments))
+    segments[index] = (segments[index][0], segments[index][1] + f" {topic}")
+    return segments
+
+
+def bench_search(episodes=10000, minutes=10, repeat=5):
+    """
+    Index synthetic episodes into a temporary cache and time /search queries against it.
+
+    Each episode mentions one of 1000 topics once, so "topic7" matches about
+    episodes/1000 of them; "podcast" is in most segments of every episode.
+    """
+    queries = {
+        "rare": "topic7",
+        "rare_phrase": '"topic7"',
+        "two_words": "topic7 podcast",
+        "common": "podcast",
+    }
+    results = {"episodes": episodes, "minutes_per_episode": minutes}
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteCacheStore(os.path.join(tmp, "cache.db"), max_bytes=None)
+        indexed = 0
+        started = time.perf_counter()
+        for i in range(episodes):
+            segments = synthetic_segments(minutes, seed=i, topic=f"topic{i % 1000}")
+            store.put_segments(f"{i:032x}", segments)
+            indexed += len(segments)
+        elapsed = time.perf_counter() - started
+        results["index_episodes_per_second"] = round(episodes / elapsed, 1)
+        results["segments_indexed"] = indexed
+        results["database_mb"] = round(os.path.getsize(os.path.join(tmp, "cache.db")) / 1024 / 1024, 2)
+
+        seconds, _ = timed(lambda: store.put_segments("f" * 32, synthetic_segments(60, seed=-1, topic="topic7")), repeat)
+        results["update_one_episode_seconds"] = round(seconds, 6)
+        for name, query in queries.items():
+            seconds, found = timed(lambda: store.search(query, limit=20), repeat)
+            results[f"{name}_query_ms"] = round(seconds * 1000, 3)
+            results[f"{name}_results"] = len(found)
+    return results
+
+
+def synthetic_episode(minutes, seed, show_segments=()):
+    """
+    A rendered transcript with a show's recurring segments (intro, sponsor reads) spread through it.
+
+    Most paragraphs stay on one of a few topics so they share vocabulary,
+    and about a fifth are short filler, as in real conversations.
+    """
+    rng = random.Random(seed)
+    topic = rng.sample(WORDS, 8)
+    paragraphs = []
+    for _, text in synthetic_segments(minutes, seed, topic="podcast"):
+        if rng.random() < 0.2:
+            paragraphs.append(rng.choice(("Yeah.", "Right, right.", "Mm-hmm.", "Exactly.", "Oh, interesting.")))
+        else:
+            words = text.split()
+            paragraphs.append(" ".join(rng.choice(topic) if rng.random() < 0.3 else word for word in words) + ".")
+    for i, segment in enumerate(show_segments):
+        paragraphs.insert(i * len(paragraphs) // max(len(show_segments), 1), segment)
+    return "\n\n".join(paragraphs)
+
+
+def bench_presummarize(durations, repeat=3, keep_ratio=0.5, history=5, max_tokens=3000, overlap_tokens=100):
+    """
+    Time the local pre-summarization pass and report how many tokens and chunks it saves.
+
+    `history` earlier episodes of the same synthetic show are seen first, so
+    its intro and sponsor reads are recognized as boilerplate.
+    """
+    if np is None:
+        return {"skipped": "numpy is not installed"}
+    show_segments = [
+        "Welcome back to the show, where every week we sit down with people doing interesting work "
+        "and ask them the questions nobody else does. I'm your host, and this is episode {}.",
+        "This episode is brought to you by Acme, the easiest way to back up everything you care about. "
+        "Go to acme dot com slash podcast for a free month and twenty percent off your first year.",
+        "Thanks for listening. If you enjoyed this conversation, please rate and review the show "
+        "wherever you get your podcasts, and tell a friend who might like it too.",
+    ]
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for minutes in durations:
+            index = BoilerplateIndex(os.path.join(tmp, f"boilerplate-{minutes}.db"), history=history)
+            for episode in range(history):
+                segments = [segment.format(episode) for segment in show_segments]
+                presummarize(synthetic_episode(minutes, seed=episode, show_segments=segments), keep_ratio, index, f"{episode:032x}")
+
+            transcript = synthetic_episode(minutes, seed=history, show_segments=[s.format(history) for s in show_segments])
+            seconds, (trimmed, stats) = timed(
+                lambda: presummarize(transcript, keep_ratio, index, "f" * 32, min_tokens=max_tokens), repeat
+            )
+            results.append({
+                "duration_minutes": minutes,
+                "segments": stats["segments"],
+                "kept_segments": stats["kept_segments"],
+                "boilerplate_segments": stats["boilerplate_segments"],
+                "tokens_before": stats["tokens_before"],
+                "tokens_after": stats["tokens_after"],
+                "token_reduction": round(1 - stats["tokens_after"] / max(stats["tokens_before"], 1), 3),
+                "chunks_before": len(chunk_transcript(transcript, max_tokens, overlap_tokens)),
+                "chunks_after": len(chunk_transcript(trimmed, max_tokens, overlap_tokens)) if trimmed else 0,
+                "seconds": round(seconds, 4),
+            })
+    return results
+
+
+def bench_upload(durations, latency=0.05, rate_limit_ratio=0.0, timeout=600):
+    """
+    Time /upload end to end through the Flask test client against a fake OpenAI server.
+
+    The app is configured from the environment at import time, so it is
+    pointed at the fake server and a temporary cache before it is imported.
+    """
+    server = FakeOpenAIServer(latency=latency, rate_limit_ratio=rate_limit_ratio).start()
+    tmp = tempfile.mkdtemp(prefix="benchmark-")
+    os.environ.update({
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "benchmark"),
+        "OPENAI_BASE_URL": server.base_url,
+        "CACHE_DB_PATH": os.path.join(tmp, "cache.db"),
+        "BOILERPLATE_DB_PATH": os.path.join(tmp, "boilerplate.db"),
+        "UPLOAD_FOLDER": os.path.join(tmp, "uploads"),
+    })
+    os.environ.setdefault("OPENAI_REQUESTS_PER_MINUTE", "0")
+    os.environ.setdefault("OPENAI_TOKENS_PER_MINUTE", "0")
+    import app as app_module
+    client = app_module.create_app().test_client()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = []
+    try:
+        for minutes in durations:
+            ttml = generate_ttml(minutes, seed=minutes).encode("utf-8")
+            before = server.stats()
+
+            def upload():
+                return client.post("/upload?format=json", data={"file": (io.BytesIO(ttml), f"bench-{minutes}.ttml")},
+                                   content_type="multipart/form-data")
+
+            started = time.perf_counter()
+            response = upload()
+            accepted = time.perf_counter() - started
+            job = response.get_json()
+            status = job.get("status")
+            while status not in ("done", "failed") and time.perf_counter() - started < timeout:
+                time.sleep(0.02)
+                status = client.get(f"/jobs/{job['job_id']}").get_json().get("status")
+            total = time.perf_counter() - started
+
+            cached_seconds, cached = timed(upload)
+            after = server.stats()
+            results.append({
+                "duration_minutes": minutes,
+                "ttml_bytes": len(ttml),
+                "status": status,
+                "accept_seconds": round(accepted, 4),
+                "total_seconds": round(total, 4),
+                "cached_upload_seconds": round(cached_seconds, 4),
+                "cache_hit": bool(cached.get_json().get("from_cache")),
+                "api_requests": after["requests"] - before["requests"],
+                "api_rate_limited": after["rate_limited"] - before["rate_limited"],
+                "api_connections": after["connections"] - before["connections"],
+            })
+    finally:
+        server.stop()
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "commit": commit,
+        "tiktoken": tiktoken is not None,
+        "zstandard": zstandard is not None,
+        "numpy": np is not None,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark extraction, chunking, caching and uploads.")
+    parser.add_argument("--durations", default="1,60,600",
+                        help="Episode lengths in minutes, comma separated (default: 1,60,600)")
+    parser.add_argument("--only", action="append", choices=BENCHMARKS, help="Run only these benchmarks (repeatable)")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions per timing; the best is kept (default: 3)")
+    parser.add_argument("--cache-entries", type=int, default=10000, help="Entries for the cache benchmark (default: 10000)")
+    parser.add_argument("--search-episodes", type=int, default=10000,
+                        help="Episodes indexed for the search benchmark (default: 10000)")
+    parser.add_argument("--presummarize-ratio", type=float, default=0.5,
+                        help="Fraction of tokens kept by the pre-summarization benchmark (default: 0.5)")
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake API latency in seconds (default: 0.05)")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0,
+                        help="Fraction of fake API requests answered with 429 (default: 0)")
+    parser.add_argument("--output", default=None, help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    durations = [float(d) if "." in d else int(d) for d in args.durations.split(",") if d]
+    selected = args.only or BENCHMARKS
+    results = {"environment": environment(), "config": vars(args), "results": {}}
+
+    for name in selected:
+        print(f"Running {name} benchmark...", file=sys.stderr)
+        started = time.perf_counter()
+        if name == "startup":
+            results["results"][name] = bench_startup(args.repeat)
+        elif name == "extract":
+            results["results"][name] = bench_extract(durations, args.repeat)
+        elif name == "chunk":
+            results["results"][name] = bench_chunk(durations, args.repeat)
+        elif name == "cache":
+            results["results"][name] = bench_cache(args.cache_entries)
+        elif name == "storage":
+            results["results"][name] = bench_storage(durations, args.repeat)
+        elif name == "search":
+            results["results"][name] = bench_search(args.search_episodes)
+        elif name == "presummarize":
+            results["results"][name] = bench_presummarize(durations, args.repeat, args.presummarize_ratio)
+        elif name == "upload":
+            results["results"][name] = bench_upload(durations, args.latency, args.rate_limit_ratio)
+        print(f"  {name} took {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,164 @@
+# cache_codec.py
+"""
+Compact encoding of cached transcripts and summaries.
+
+Transcripts are stored once per file as structured segments - the begin
+times and the texts in two columns, which compress better than one
+interleaved string - and rendered with or without timestamps on read.
+Every value is compressed with zstd when the zstandard package is installed
+and with zlib otherwise, optionally primed with a dictionary trained on
+stored transcripts. A dictionary mostly helps short values such as chunk
+summaries, which are too small to build up their own history.
+
+Each blob starts with a header naming its codec and dictionary, so values
+written with an older dictionary or by an install with the other codec stay
+readable.
+"""
+import json
+import struct
+import threading
+import zlib
+from collections import Counter
+
+# zstd is faster and compresses better; zlib is always available
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+CODEC_NAMES = {CODEC_ZLIB: "zlib", CODEC_ZSTD: "zstd"}
+
+# codec id, dictionary id (0 = no dictionary)
+HEADER = struct.Struct("<BI")
+
+ZLIB_LEVEL = 9
+ZSTD_LEVEL = 9
+# zlib can only reference the last 32 KB, so a larger dictionary is wasted
+ZLIB_DICTIONARY_BYTES = 32 * 1024
+ZSTD_DICTIONARY_BYTES = 112 * 1024
+# Only the start of each sample is used to train a zlib dictionary, since that is where it helps
+ZLIB_SAMPLE_CHARS = 16 * 1024
+
+
+def encode_segments(segments):
+    """Serialize (begin, text) segments as UTF-8 JSON holding a column of begin times and one of texts."""
+    begins = [begin for begin, _ in segments]
+    texts = [text for _, text in segments]
+    return json.dumps([begins, texts], ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def decode_segments(data):
+    begins, texts = json.loads(data)
+    return list(zip(begins, texts))
+
+
+def _train_zlib_dictionary(samples, size):
+    """
+    Pick the word sequences that save the most bytes across samples.
+
+    zlib has no trainer; a preset dictionary is simply text it may refer
+    back to. The most valuable phrases go last, closest to the data.
+    """
+    counts = Counter()
+    for sample in samples:
+        words = sample[:ZLIB_SAMPLE_CHARS].decode("utf-8", "ignore").split(" ")
+        for n in (1, 2, 3, 4):
+            for i in range(len(words) - n + 1):
+                counts[" ".join(words[i:i + n])] += 1
+
+    chosen = []
+    total = 0
+    for phrase, count in sorted(counts.items(), key=lambda item: item[1] * len(item[0]), reverse=True):
+        if count < 2 or len(phrase) < 4:
+            continue
+        encoded = phrase.encode("utf-8") + b" "
+        if total + len(encoded) > size:
+            break
+        chosen.append(encoded)
+        total += len(encoded)
+    return b"".join(reversed(chosen))
+
+
+class Codec:
+    """
+    Compresses and decompresses cache values, with or without a shared dictionary.
+
+    Dictionaries are registered by id with add_dictionary(); the store keeps
+    them in its database. Safe to use from several threads.
+    """
+
+    def __init__(self, codec=None):
+        self.codec = codec or (CODEC_ZSTD if zstandard is not None else CODEC_ZLIB)
+        if self.codec == CODEC_ZSTD and zstandard is None:
+            raise ValueError("zstd compression needs the zstandard package")
+        self._dictionaries = {}
+        self._local = threading.local()
+
+    @property
+    def name(self):
+        return CODEC_NAMES[self.codec]
+
+    def add_dictionary(self, dictionary_id, codec, data):
+        self._dictionaries[dictionary_id] = (codec, data)
+
+    def has_dictionary(self, dictionary_id):
+        return dictionary_id in self._dictionaries
+
+    def train(self, samples):
+        """Build a dictionary for this codec from sample values (bytes); None if there is too little data."""
+        samples = [sample for sample in samples if sample]
+        if not samples:
+            return None
+        if self.codec == CODEC_ZSTD:
+            try:
+                return zstandard.train_dictionary(ZSTD_DICTIONARY_BYTES, samples, level=ZSTD_LEVEL).as_bytes()
+            except zstandard.ZstdError:
+                return None
+        return _train_zlib_dictionary(samples, ZLIB_DICTIONARY_BYTES) or None
+
+    def _zstd(self, kind, dictionary_id):
+        # zstd (de)compressors are reusable but not thread-safe; keep one per thread
+        cache = self._local.__dict__.setdefault("zstd", {})
+        key = (kind, dictionary_id)
+        if key not in cache:
+            options = {}
+            if dictionary_id:
+                options["dict_data"] = zstandard.ZstdCompressionDict(self._dictionaries[dictionary_id][1])
+            if kind == "compress":
+                cache[key] = zstandard.ZstdCompressor(level=ZSTD_LEVEL, **options)
+            else:
+                cache[key] = zstandard.ZstdDecompressor(**options)
+        return cache[key]
+
+    def compress(self, data, dictionary_id=0):
+        """Compress bytes, using the dictionary with the given id if it matches this codec."""
+        if dictionary_id and self._dictionaries.get(dictionary_id, (None,))[0] != self.codec:
+            dictionary_id = 0
+        if self.codec == CODEC_ZSTD:
+            body = self._zstd("compress", dictionary_id).compress(data)
+        else:
+            options = {"zdict": self._dictionaries[dictionary_id][1]} if dictionary_id else {}
+            compressor = zlib.compressobj(ZLIB_LEVEL, **options)
+            body = compressor.compress(data) + compressor.flush()
+        return HEADER.pack(self.codec, dictionary_id) + body
+
+    def decompress(self, blob):
+        codec, dictionary_id = HEADER.unpack_from(blob)
+        body = memoryview(blob)[HEADER.size:]
+        if dictionary_id and dictionary_id not in self._dictionaries:
+            raise KeyError(f"Unknown compression dictionary {dictionary_id}")
+        if codec == CODEC_ZSTD:
+            if zstandard is None:
+                raise ValueError("Value was compressed with zstd but the zstandard package is not installed")
+            return self._zstd("decompress", dictionary_id).decompress(body)
+        if codec == CODEC_ZLIB:
+            options = {"zdict": self._dictionaries[dictionary_id][1]} if dictionary_id else {}
+            decompressor = zlib.decompressobj(**options)
+            return decompressor.decompress(body) + decompressor.flush()
+        raise ValueError(f"Unknown compression codec {codec}")
+
+    @staticmethod
+    def dictionary_id(blob):
+        return HEADER.unpack_from(blob)[1]
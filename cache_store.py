@@ -0,0 +1,983 @@
+# cache_store.py
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from cache_codec import Codec, decode_segments, encode_segments
+from ttml_parser import begin_seconds, format_timestamp, parse_rendered_transcript, render_transcript
+
+DEFAULT_TTL_SECONDS = 30 * 24 * 60 * 60  # 30 days
+
+SCHEMA_VERSION = 4
+
+# Tables holding cached data, with the column identifying a row
+CACHE_TABLES = ("transcripts", "summaries", "chunk_summaries")
+
+SCHEMA = """
+-- Extracted transcripts as compressed (begin, text) segments, one row per file;
+-- both renderings are produced on read. has_timestamps is 0 for rows imported
+-- from plain-text transcripts, whose begin times are unknown.
+CREATE TABLE IF NOT EXISTS transcripts (
+    file_hash TEXT PRIMARY KEY,
+    segments BLOB NOT NULL,
+    has_timestamps INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    size_bytes INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_transcripts_created_at ON transcripts(created_at);
+CREATE INDEX IF NOT EXISTS idx_transcripts_accessed_at ON transcripts(accessed_at);
+
+-- Summaries, one row per file and set of processing options (see variant_key)
+CREATE TABLE IF NOT EXISTS summaries (
+    key TEXT PRIMARY KEY,
+    file_hash TEXT NOT NULL,
+    summary BLOB NOT NULL,
+    options TEXT NOT NULL DEFAULT '{}',
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    size_bytes INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_summaries_file_hash ON summaries(file_hash);
+CREATE INDEX IF NOT EXISTS idx_summaries_created_at ON summaries(created_at);
+CREATE INDEX IF NOT EXISTS idx_summaries_accessed_at ON summaries(accessed_at);
+
+CREATE TABLE IF NOT EXISTS chunk_summaries (
+    key TEXT PRIMARY KEY,
+    summary BLOB NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    size_bytes INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_chunk_summaries_created_at ON chunk_summaries(created_at);
+CREATE INDEX IF NOT EXISTS idx_chunk_summaries_accessed_at ON chunk_summaries(accessed_at);
+
+-- Running totals kept up to date by triggers so stats never scan the tables
+CREATE TABLE IF NOT EXISTS cache_totals (
+    name TEXT PRIMARY KEY,
+    entry_count INTEGER NOT NULL DEFAULT 0,
+    total_bytes INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO cache_totals (name) VALUES ('transcripts'), ('summaries'), ('chunk_summaries');
+
+-- Bumped by clear() so processes sharing the database drop their in-memory tiers
+CREATE TABLE IF NOT EXISTS cache_meta (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO cache_meta (name, value) VALUES ('generation', 0);
+
+-- Compression dictionaries trained on stored transcripts; every value names the one it uses
+CREATE TABLE IF NOT EXISTS compression_dictionaries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    codec INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+# Full-text index of transcript segments. It is contentless - the text lives only in the
+# compressed transcripts - so rows are removed by passing their text back to 'delete'.
+# The rowid is the transcript's rowid shifted left by SEGMENT_BITS plus the segment index.
+SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS transcript_index USING fts5(
+    text, content='', tokenize='porter unicode61 remove_diacritics 2'
+);
+"""
+SEGMENT_BITS = 20
+
+TOTALS_TRIGGERS = """
+CREATE TRIGGER IF NOT EXISTS {table}_insert AFTER INSERT ON {table} BEGIN
+    UPDATE cache_totals SET entry_count = entry_count + 1, total_bytes = total_bytes + NEW.size_bytes
+    WHERE name = '{table}';
+END;
+CREATE TRIGGER IF NOT EXISTS {table}_update AFTER UPDATE OF size_bytes ON {table} BEGIN
+    UPDATE cache_totals SET total_bytes = total_bytes - OLD.size_bytes + NEW.size_bytes
+    WHERE name = '{table}';
+END;
+CREATE TRIGGER IF NOT EXISTS {table}_delete AFTER DELETE ON {table} BEGIN
+    UPDATE cache_totals SET entry_count = entry_count - 1, total_bytes = total_bytes - OLD.size_bytes
+    WHERE name = '{table}';
+END;
+"""
+
+
+@contextmanager
+def transaction(conn):
+    """Run the with-block in a write transaction, or in the caller's if one is open."""
+    if conn.in_transaction:
+        yield
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def _execute_script(conn, script):
+    """Run a script statement by statement; unlike executescript, this keeps an open transaction."""
+    statement = ""
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            conn.execute(statement)
+            statement = ""
+
+
+def search_expression(query):
+    """
+    Turn free text into an FTS5 query matching every word and "quoted phrase".
+
+    Words are quoted so FTS5 operators and punctuation in the query are
+    treated as text; returns None if the query has nothing to search for.
+    """
+    terms = []
+    for phrase, words in re.findall(r'"([^"]*)"|([^\s"]+)', query):
+        tokens = re.findall(r"\w+", phrase or words)
+        if tokens:
+            terms.append('"' + " ".join(tokens) + '"')
+    return " AND ".join(terms) or None
+
+
+def variant_key(file_hash, options):
+    """Composite cache key for one processing variant (content hash plus every option that affects the summary)."""
+    key_source = file_hash + "\0" + json.dumps(options, sort_keys=True)
+    return hashlib.sha256(key_source.encode("utf-8")).hexdigest()
+
+
+class CacheBackend:
+    """Interface for the persistent store behind the transcript, summary and chunk-summary caches."""
+
+    def get_segments(self, file_hash):
+        """Return (segments, has_timestamps) for a file, segments being (begin, text) pairs, or None."""
+        raise NotImplementedError
+
+    def put_segments(self, file_hash, segments, has_timestamps=True):
+        """Store the segments of a file; never replaces segments with timestamps by ones without."""
+        raise NotImplementedError
+
+    def get_transcript(self, file_hash, include_timestamps=False):
+        """Return the cached transcript for a file rendered with or without timestamps, or None."""
+        cached = self.get_segments(file_hash)
+        if cached is None:
+            return None
+        segments, has_timestamps = cached
+        if include_timestamps and not has_timestamps:
+            return None
+        return render_transcript(segments, include_timestamps)
+
+    def put_transcript(self, file_hash, include_timestamps, transcript, **kwargs):
+        """Store an already rendered transcript, recovering its segments from the text."""
+        self.put_segments(
+            file_hash, parse_rendered_transcript(transcript, include_timestamps), include_timestamps, **kwargs
+        )
+
+    def search(self, query, limit=20):
+        """Return the files whose transcripts best match query, each with its best matching segments."""
+        raise NotImplementedError
+
+    def get(self, key):
+        """Return the cached summary entry for a variant key, or None."""
+        raise NotImplementedError
+
+    def put(self, key, file_hash, summary, options=None):
+        """Store (or replace) the summary for a variant key."""
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def variants(self, file_hash):
+        """Return the options of every cached summary of a file."""
+        raise NotImplementedError
+
+    def get_chunk(self, key):
+        """Return a cached chunk summary, or None."""
+        raise NotImplementedError
+
+    def put_chunk(self, key, summary):
+        raise NotImplementedError
+
+    def clear(self):
+        """Remove everything; return the number of summaries removed."""
+        raise NotImplementedError
+
+    def generation(self):
+        """Counter that changes whenever the cache is cleared, possibly by another process."""
+        return 0
+
+    def stats(self):
+        raise NotImplementedError
+
+
+class SQLiteCacheStore(CacheBackend):
+    """
+    Cache backend storing everything in one SQLite database in WAL mode.
+
+    Expiry (created_at older than ttl_seconds) and LRU eviction (oldest
+    accessed_at first once max_bytes is exceeded) are done in SQL against
+    indexed columns. Entry counts and sizes are maintained by triggers, so
+    stats() is a single-row-per-table read.
+    """
+
+    # Only rewrite accessed_at when it is older than this, to keep reads cheap
+    TOUCH_INTERVAL = 60
+    # Writes look for expired rows at most this often, rather than opening a purge transaction each time
+    PURGE_INTERVAL = 60
+    # A compression dictionary is trained once this many transcripts are stored, from up to DICTIONARY_SAMPLES of them
+    DICTIONARY_MIN_SAMPLES = 20
+    DICTIONARY_SAMPLES = 200
+    # Best matching segments considered per search; results are grouped from these
+    SEARCH_CANDIDATES = 2000
+    # Ranking costs a few microseconds per matching segment, so words found almost everywhere
+    # are only ranked among their most recently indexed matches
+    SEARCH_RANK_LIMIT = 10000
+
+    def __init__(self, path, ttl_seconds=DEFAULT_TTL_SECONDS, max_bytes=None, codec=None):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.codec = codec or Codec()
+        self._dictionary_id = 0
+        self._dictionary_retry_count = 0
+        self._dictionary_lock = threading.Lock()
+        self._last_purge = 0.0
+        self.search_enabled = True
+        self._local = threading.local()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._create_schema()
+        logging.info(f"Opened SQLite cache at {path} ({self.codec.name} compression)")
+
+    def _connect(self):
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _create_schema(self):
+        """
+        Create the schema and migrate older versions, all in one write transaction.
+
+        The version is read under the write lock, so when several processes
+        open the database at once (e.g. gunicorn workers) the first one
+        migrates and the others find it already done.
+        """
+        conn = self._connect()
+        with transaction(conn):
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version < 3 and "include_timestamps" in self._columns(conn, "transcripts"):
+                self._detach_v2_transcripts(conn)
+
+            _execute_script(conn, SCHEMA)
+            for table in CACHE_TABLES:
+                _execute_script(conn, TOTALS_TRIGGERS.format(table=table))
+            try:
+                _execute_script(conn, SEARCH_SCHEMA)
+            except sqlite3.OperationalError as e:
+                # Some SQLite builds lack FTS5; caching works without search
+                logging.warning(f"Transcript search disabled: {str(e)}")
+                self.search_enabled = False
+            self._load_dictionaries()
+
+            if version < 2 and self._columns(conn, "entries"):
+                self._migrate_entries_table(conn)
+            if version < 3:
+                self._migrate_to_compressed(conn)
+            if version == 3:
+                # Transcripts from older versions are indexed as they are migrated above
+                self._index_existing_transcripts(conn)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    @staticmethod
+    def _columns(conn, table):
+        return [row["name"] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+    def _detach_v2_transcripts(self, conn):
+        """Rename the version 2 transcripts table (one text row per timestamp setting) out of the way."""
+        with transaction(conn):
+            # Triggers and indexes keep their names when a table is renamed; drop them so they are created anew
+            for trigger in ("transcripts_insert", "transcripts_update", "transcripts_delete"):
+                conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            for index in ("idx_transcripts_created_at", "idx_transcripts_accessed_at"):
+                conn.execute(f"DROP INDEX IF EXISTS {index}")
+            conn.execute("ALTER TABLE transcripts RENAME TO transcripts_v2")
+            conn.execute("UPDATE cache_totals SET entry_count = 0, total_bytes = 0 WHERE name = 'transcripts'")
+
+    def _migrate_entries_table(self, conn):
+        """
+        Move transcripts out of the version 1 `entries` table.
+
+        Version 1 keyed rows by content hash only and did not record which
+        model, prompt or chunking produced a summary, so only the transcripts
+        can be carried over.
+        """
+        rows = conn.execute(
+            "SELECT hash AS file_hash, include_timestamps, transcript, created_at, accessed_at FROM entries "
+            "ORDER BY hash, include_timestamps DESC"
+        ).fetchall()
+        with transaction(conn):
+            migrated = self._import_rendered_transcripts(conn, rows)
+            conn.execute("DROP TABLE entries")
+            conn.execute("DELETE FROM cache_totals WHERE name = 'entries'")
+        logging.info(f"Migrated {migrated} cached transcripts to the per-variant cache layout")
+
+    def _migrate_to_compressed(self, conn):
+        """
+        Convert version 2 data to compressed values.
+
+        Both renderings of a transcript are merged into one row of segments,
+        preferring the timestamped one, from which the plain rendering can be
+        rebuilt. Summaries stored as text are compressed in place.
+        """
+        if self._columns(conn, "transcripts_v2"):
+            if not self._dictionary_id:
+                samples = conn.execute(
+                    "SELECT transcript, include_timestamps FROM transcripts_v2 ORDER BY accessed_at DESC LIMIT ?",
+                    (self.DICTIONARY_SAMPLES,)
+                ).fetchall()
+                if len(samples) >= self.DICTIONARY_MIN_SAMPLES:
+                    self._add_dictionary(conn, [
+                        encode_segments(parse_rendered_transcript(row["transcript"], row["include_timestamps"]))
+                        for row in samples
+                    ])
+            rows = conn.execute(
+                "SELECT file_hash, include_timestamps, transcript, created_at, accessed_at FROM transcripts_v2 "
+                "ORDER BY file_hash, include_timestamps DESC"
+            )
+            with transaction(conn):
+                migrated = self._import_rendered_transcripts(conn, rows)
+                conn.execute("DROP TABLE transcripts_v2")
+            logging.info(f"Compressed {migrated} cached transcripts")
+
+        for table in ("summaries", "chunk_summaries"):
+            rowids = [row[0] for row in conn.execute(f"SELECT rowid FROM {table} WHERE typeof(summary) = 'text'")]
+            if not rowids:
+                continue
+            with transaction(conn):
+                for rowid in rowids:
+                    summary = conn.execute(f"SELECT summary FROM {table} WHERE rowid = ?", (rowid,)).fetchone()[0]
+                    blob = self._encode(summary.encode("utf-8"))
+                    conn.execute(f"UPDATE {table} SET summary = ?, size_bytes = ? WHERE rowid = ?", (blob, len(blob), rowid))
+            logging.info(f"Compressed {len(rowids)} cached {table.replace('_', ' ')}")
+
+    def _import_rendered_transcripts(self, conn, rows):
+        """Store rendered transcript rows ordered by file hash, timestamped first; return files imported."""
+        imported = 0
+        previous_hash = None
+        for row in rows:
+            if row["file_hash"] == previous_hash:
+                continue
+            previous_hash = row["file_hash"]
+            segments = parse_rendered_transcript(row["transcript"], row["include_timestamps"])
+            self._write_segments(
+                conn, row["file_hash"], segments, bool(row["include_timestamps"]), row["created_at"], row["accessed_at"]
+            )
+            imported += 1
+        return imported
+
+    def _load_dictionaries(self):
+        """Register every stored dictionary with the codec and use the newest one for this codec."""
+        for row in self._connect().execute("SELECT id, codec, data FROM compression_dictionaries ORDER BY id"):
+            if not self.codec.has_dictionary(row["id"]):
+                self.codec.add_dictionary(row["id"], row["codec"], row["data"])
+            if row["codec"] == self.codec.codec:
+                self._dictionary_id = row["id"]
+
+    def _add_dictionary(self, conn, samples):
+        data = self.codec.train(samples)
+        if data is None:
+            return
+        conn.execute(
+            "INSERT INTO compression_dictionaries (codec, data, created_at) VALUES (?, ?, ?)",
+            (self.codec.codec, data, time.time())
+        )
+        self._load_dictionaries()
+        logging.info(f"Trained a {len(data)} byte {self.codec.name} dictionary on {len(samples)} transcripts")
+
+    def train_dictionary(self):
+        """Train a new compression dictionary on recently used transcripts; later writes use it."""
+        conn = self._connect()
+        blobs = conn.execute(
+            "SELECT segments FROM transcripts ORDER BY accessed_at DESC LIMIT ?", (self.DICTIONARY_SAMPLES,)
+        ).fetchall()
+        self._add_dictionary(conn, [self._decode(row["segments"]) for row in blobs])
+        return self._dictionary_id
+
+    def _maybe_train_dictionary(self):
+        if self._dictionary_id or not self.DICTIONARY_MIN_SAMPLES:
+            return
+        with self._dictionary_lock:
+            # Another process may have trained one already
+            self._load_dictionaries()
+            if self._dictionary_id:
+                return
+            count = self._connect().execute(
+                "SELECT entry_count FROM cache_totals WHERE name = 'transcripts'"
+            ).fetchone()[0]
+            if count >= max(self.DICTIONARY_MIN_SAMPLES, self._dictionary_retry_count):
+                if not self.train_dictionary():
+                    # Too little to train on yet; try again once there is twice as much
+                    self._dictionary_retry_count = count * 2
+
+    def _encode(self, data):
+        return self.codec.compress(data, self._dictionary_id)
+
+    def _decode(self, blob):
+        if isinstance(blob, str):
+            # Written as text by a version 2 process sharing the database
+            return blob.encode("utf-8")
+        if not self.codec.has_dictionary(self.codec.dictionary_id(blob)):
+            self._load_dictionaries()
+        return self.codec.decompress(blob)
+
+    def _index_existing_transcripts(self, conn):
+        if not self.search_enabled:
+            return
+        indexed = 0
+        rowids = [row[0] for row in conn.execute("SELECT rowid FROM transcripts")]
+        for start in range(0, len(rowids), 500):
+            with transaction(conn):
+                for rowid in rowids[start:start + 500]:
+                    blob = conn.execute("SELECT segments FROM transcripts WHERE rowid = ?", (rowid,)).fetchone()[0]
+                    self._index_segments(conn, rowid, decode_segments(self._decode(blob)))
+                    indexed += 1
+        if indexed:
+            logging.info(f"Indexed {indexed} cached transcripts for search")
+
+    def _index_segments(self, conn, transcript_rowid, segments, command=None):
+        """Add the segments of a transcript to the search index, or remove them with command='delete'."""
+        if not self.search_enabled:
+            return
+        base = transcript_rowid << SEGMENT_BITS
+        rows = ((base + i, text) for i, (_, text) in enumerate(segments[:1 << SEGMENT_BITS]) if text)
+        if command is None:
+            conn.executemany("INSERT INTO transcript_index (rowid, text) VALUES (?, ?)", rows)
+        else:
+            conn.executemany(
+                "INSERT INTO transcript_index (transcript_index, rowid, text) VALUES (?, ?, ?)",
+                ((command, rowid, text) for rowid, text in rows)
+            )
+
+    def _unindex_transcripts(self, conn, where, params=()):
+        """Remove the transcripts matching a WHERE clause from the search index (before deleting them)."""
+        if not self.search_enabled:
+            return
+        for row in conn.execute(f"SELECT rowid, segments FROM transcripts WHERE {where}", params).fetchall():
+            self._index_segments(conn, row["rowid"], decode_segments(self._decode(row["segments"])), command="delete")
+
+    def _is_expired(self, created_at, now):
+        return self.ttl_seconds is not None and now - created_at > self.ttl_seconds
+
+    def _touch(self, table, rowid, accessed_at, now):
+        if now - accessed_at > self.TOUCH_INTERVAL:
+            self._connect().execute(f"UPDATE {table} SET accessed_at = ? WHERE rowid = ?", (now, rowid))
+
+    def get_segments(self, file_hash):
+        now = time.time()
+        row = self._connect().execute(
+            "SELECT rowid, segments, has_timestamps, created_at, accessed_at FROM transcripts WHERE file_hash = ?",
+            (file_hash,)
+        ).fetchone()
+        if row is None or self._is_expired(row["created_at"], now):
+            return None
+        self._touch("transcripts", row["rowid"], row["accessed_at"], now)
+        return decode_segments(self._decode(row["segments"])), bool(row["has_timestamps"])
+
+    def _write_segments(self, conn, file_hash, segments, has_timestamps, created_at, accessed_at):
+        blob = self._encode(encode_segments(segments))
+        with transaction(conn):
+            existing = conn.execute(
+                "SELECT has_timestamps FROM transcripts WHERE file_hash = ?", (file_hash,)
+            ).fetchone()
+            if existing is not None:
+                if existing["has_timestamps"] > has_timestamps:
+                    return
+                self._unindex_transcripts(conn, "file_hash = ?", (file_hash,))
+            conn.execute(
+                "INSERT INTO transcripts (file_hash, segments, has_timestamps, created_at, accessed_at, size_bytes) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(file_hash) DO UPDATE SET segments = excluded.segments, "
+                "has_timestamps = excluded.has_timestamps, created_at = excluded.created_at, "
+                "accessed_at = excluded.accessed_at, size_bytes = excluded.size_bytes",
+                (file_hash, blob, int(has_timestamps), created_at, accessed_at, len(blob))
+            )
+            rowid = conn.execute("SELECT rowid FROM transcripts WHERE file_hash = ?", (file_hash,)).fetchone()[0]
+            self._index_segments(conn, rowid, segments)
+
+    def put_segments(self, file_hash, segments, has_timestamps=True, created_at=None):
+        now = time.time()
+        self._write_segments(self._connect(), file_hash, segments, has_timestamps, created_at or now, now)
+        self._maybe_train_dictionary()
+        self._enforce_limits()
+
+    def search(self, query, limit=20, hits_per_file=3):
+        """
+        Rank cached transcripts by their best matching segment (BM25).
+
+        A segment matches when it contains every word of the query. The
+        best SEARCH_CANDIDATES segments are grouped by file, and each result
+        lists up to hits_per_file of them with their begin times. At most
+        SEARCH_RANK_LIMIT matches are ranked, newest first, which bounds the
+        time taken by very common words however large the archive is.
+        """
+        expression = search_expression(query)
+        if expression is None or not self.search_enabled:
+            return []
+        conn = self._connect()
+        matches = conn.execute(
+            "SELECT rowid, rank FROM ("
+            "    SELECT rowid, rank FROM transcript_index WHERE transcript_index MATCH ? ORDER BY rowid DESC LIMIT ?"
+            ") ORDER BY rank LIMIT ?",
+            (expression, self.SEARCH_RANK_LIMIT, self.SEARCH_CANDIDATES)
+        )
+        files = {}
+        for rowid, rank in matches:
+            hits = files.setdefault(rowid >> SEGMENT_BITS, [])
+            if len(hits) < hits_per_file:
+                hits.append((rowid & ((1 << SEGMENT_BITS) - 1), rank))
+        ranked = list(files.items())[:limit]
+        if not ranked:
+            return []
+
+        rows = {
+            row["rowid"]: row
+            for row in conn.execute(
+                "SELECT rowid, file_hash, segments, created_at FROM transcripts "
+                f"WHERE rowid IN ({', '.join('?' * len(ranked))})",
+                [transcript_rowid for transcript_rowid, _ in ranked]
+            )
+        }
+        now = time.time()
+        results = []
+        for transcript_rowid, hits in ranked:
+            row = rows.get(transcript_rowid)
+            if row is None or self._is_expired(row["created_at"], now):
+                continue
+            segments = decode_segments(self._decode(row["segments"]))
+            results.append({
+                "file_hash": row["file_hash"],
+                "score": round(-hits[0][1], 6),
+                "hits": [self._search_hit(segments, index) for index, _ in hits if index < len(segments)],
+            })
+        return results
+
+    @staticmethod
+    def _search_hit(segments, index):
+        begin, text = segments[index]
+        seconds = begin_seconds(begin)
+        return {
+            "segment": index,
+            "begin": seconds,
+            "timestamp": format_timestamp(seconds) if seconds is not None else None,
+            "text": text,
+        }
+
+    def get(self, key):
+        now = time.time()
+        row = self._connect().execute(
+            "SELECT rowid, file_hash, summary, options, created_at, accessed_at FROM summaries WHERE key = ?",
+            (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if self._is_expired(row["created_at"], now):
+            logging.info(f"Cache expired for key: {key}")
+            self.delete(key)
+            return None
+
+        self._touch("summaries", row["rowid"], row["accessed_at"], now)
+        options = json.loads(row["options"])
+        return {
+            "file_hash": row["file_hash"],
+            "summary": self._decode(row["summary"]).decode("utf-8"),
+            "options": options,
+            "include_timestamps": options.get("include_timestamps", False),
+            "timestamp": row["created_at"],
+        }
+
+    def put(self, key, file_hash, summary, options=None, created_at=None):
+        now = time.time()
+        blob = self._encode(summary.encode("utf-8"))
+        self._connect().execute(
+            "INSERT INTO summaries (key, file_hash, summary, options, created_at, accessed_at, size_bytes) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET file_hash = excluded.file_hash, summary = excluded.summary, "
+            "options = excluded.options, created_at = excluded.created_at, accessed_at = excluded.accessed_at, "
+            "size_bytes = excluded.size_bytes",
+            (key, file_hash, blob, json.dumps(options or {}, sort_keys=True), created_at or now, now, len(blob))
+        )
+        self._enforce_limits()
+
+    def delete(self, key):
+        self._connect().execute("DELETE FROM summaries WHERE key = ?", (key,))
+
+    def variants(self, file_hash):
+        rows = self._connect().execute(
+            "SELECT options FROM summaries WHERE file_hash = ? ORDER BY created_at", (file_hash,)
+        )
+        return [json.loads(row["options"]) for row in rows]
+
+    def get_chunk(self, key):
+        now = time.time()
+        row = self._connect().execute(
+            "SELECT rowid, summary, created_at, accessed_at FROM chunk_summaries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or self._is_expired(row["created_at"], now):
+            return None
+        self._touch("chunk_summaries", row["rowid"], row["accessed_at"], now)
+        return self._decode(row["summary"]).decode("utf-8")
+
+    def put_chunk(self, key, summary, created_at=None):
+        now = time.time()
+        blob = self._encode(summary.encode("utf-8"))
+        self._connect().execute(
+            "INSERT INTO chunk_summaries (key, summary, created_at, accessed_at, size_bytes) "
+            "VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET summary = excluded.summary, created_at = excluded.created_at, "
+            "accessed_at = excluded.accessed_at, size_bytes = excluded.size_bytes",
+            (key, blob, created_at or now, now, len(blob))
+        )
+        self._enforce_limits()
+
+    def purge_expired(self):
+        """Delete expired rows; return how many were removed."""
+        if self.ttl_seconds is None:
+            return 0
+        cutoff = time.time() - self.ttl_seconds
+        conn = self._connect()
+        removed = 0
+        with transaction(conn):
+            self._unindex_transcripts(conn, "created_at < ?", (cutoff,))
+            for table in CACHE_TABLES:
+                removed += conn.execute(f"DELETE FROM {table} WHERE created_at < ?", (cutoff,)).rowcount
+        if removed:
+            logging.info(f"Purged {removed} expired cache rows")
+        return removed
+
+    def _total_bytes(self):
+        row = self._connect().execute("SELECT SUM(total_bytes) FROM cache_totals").fetchone()
+        return row[0] or 0
+
+    def _enforce_limits(self):
+        """Expire old rows (every PURGE_INTERVAL seconds), then evict least recently used rows until under max_bytes."""
+        now = time.monotonic()
+        if now - self._last_purge >= self.PURGE_INTERVAL:
+            self._last_purge = now
+            self.purge_expired()
+        if not self.max_bytes:
+            return
+
+        conn = self._connect()
+        evicted = 0
+        oldest_first = " UNION ALL ".join(
+            f"SELECT '{table}' AS tbl, rowid AS id, size_bytes, accessed_at FROM {table}" for table in CACHE_TABLES
+        ) + " ORDER BY accessed_at LIMIT 500"
+        # Reads and deletes share one write transaction, so no other writer can get in between
+        with transaction(conn):
+            excess = self._total_bytes() - self.max_bytes
+            while excess > 0:
+                candidates = conn.execute(oldest_first).fetchall()
+                if not candidates:
+                    break
+                for victim in candidates:
+                    if victim["tbl"] == "transcripts":
+                        self._unindex_transcripts(conn, "rowid = ?", (victim["id"],))
+                    conn.execute(f"DELETE FROM {victim['tbl']} WHERE rowid = ?", (victim["id"],))
+                    evicted += 1
+                    excess -= victim["size_bytes"]
+                    if excess <= 0:
+                        break
+        if evicted:
+            logging.info(f"Evicted {evicted} least recently used cache rows (limit {self.max_bytes} bytes)")
+
+    def clear(self):
+        conn = self._connect()
+        with transaction(conn):
+            count = conn.execute("SELECT entry_count FROM cache_totals WHERE name = 'summaries'").fetchone()[0]
+            for table in CACHE_TABLES:
+                conn.execute(f"DELETE FROM {table}")
+            if self.search_enabled:
+                conn.execute("INSERT INTO transcript_index (transcript_index) VALUES ('delete-all')")
+            conn.execute("UPDATE cache_meta SET value = value + 1 WHERE name = 'generation'")
+        return count
+
+    def generation(self):
+        return self._connect().execute("SELECT value FROM cache_meta WHERE name = 'generation'").fetchone()[0]
+
+    def stats(self):
+        totals = {
+            row["name"]: row
+            for row in self._connect().execute("SELECT name, entry_count, total_bytes FROM cache_totals")
+        }
+        total_size = sum(totals[table]["total_bytes"] for table in CACHE_TABLES)
+        return {
+            "cache_entries": totals["summaries"]["entry_count"],
+            "transcript_entries": totals["transcripts"]["entry_count"],
+            "chunk_entries": totals["chunk_summaries"]["entry_count"],
+            "total_size_bytes": total_size,
+            "total_size_mb": round(total_size / (1024 * 1024), 2),
+            "max_size_bytes": self.max_bytes,
+            "compression": {"codec": self.codec.name, "dictionary": self._dictionary_id or None},
+            "database": self.path,
+        }
+
+
+class MemoryLRUCache:
+    """
+    Thread-safe in-memory LRU cache bounded by the total size of its values.
+
+    Entries expire after ttl_seconds and can be invalidated one at a time.
+    Misses are never stored, so a value written later is picked up on the
+    next lookup.
+    """
+
+    # Rough per-entry bookkeeping overhead (key, OrderedDict node, tuple)
+    ENTRY_OVERHEAD = 200
+
+    def __init__(self, max_bytes, ttl_seconds=None):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _sizeof(value):
+        if isinstance(value, str):
+            return len(value)
+        if isinstance(value, dict):
+            return sum(len(v) if isinstance(v, str) else 16 for v in value.values())
+        if isinstance(value, (list, tuple)):
+            # Transcript segments: (segments, has_timestamps) holding (begin, text) pairs
+            return sum(MemoryLRUCache._sizeof(v) for v in value) + 8 * len(value)
+        return 16
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None:
+                value, size, expires_at = item
+                if expires_at is None or expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def put(self, key, value, ttl_seconds=None):
+        size = self._sizeof(value) + self.ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+        ttl_seconds = ttl_seconds or self.ttl_seconds
+        expires_at = time.monotonic() + ttl_seconds if ttl_seconds else None
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, size, expires_at)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key):
+        item = self._entries.pop(key, None)
+        if item is not None:
+            self.current_bytes -= item[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "size_bytes": self.current_bytes,
+                "max_size_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+class TieredCacheStore(CacheBackend):
+    """
+    Two-tier cache: a MemoryLRUCache in front of a persistent backend.
+
+    Reads are served from memory when possible and fill it on a backend hit;
+    writes go through to both tiers. When several processes share the
+    backend, a clear() in one of them is noticed by the others within
+    GENERATION_CHECK_INTERVAL seconds, and they drop their memory tier.
+    """
+
+    GENERATION_CHECK_INTERVAL = 1.0
+
+    def __init__(self, backend, memory):
+        self.backend = backend
+        self.memory = memory
+        self.backend_hits = 0
+        self.backend_misses = 0
+        self._lock = threading.Lock()
+        self._generation = backend.generation()
+        self._generation_checked = time.monotonic()
+
+    def _check_generation(self):
+        now = time.monotonic()
+        if now - self._generation_checked < self.GENERATION_CHECK_INTERVAL:
+            return
+        self._generation_checked = now
+        generation = self.backend.generation()
+        if generation != self._generation:
+            self._generation = generation
+            self.memory.clear()
+            logging.info("Cache was cleared by another process; dropped the in-memory tier")
+
+    @property
+    def path(self):
+        return self.backend.path
+
+    def _read_through(self, memory_key, load):
+        self._check_generation()
+        value = self.memory.get(memory_key)
+        if value is not None:
+            return value
+        value = load()
+        with self._lock:
+            if value is None:
+                self.backend_misses += 1
+            else:
+                self.backend_hits += 1
+        if value is not None:
+            self.memory.put(memory_key, value)
+        return value
+
+    def get_segments(self, file_hash):
+        return self._read_through(("segments", file_hash), lambda: self.backend.get_segments(file_hash))
+
+    def put_segments(self, file_hash, segments, has_timestamps=True, **kwargs):
+        self.backend.put_segments(file_hash, segments, has_timestamps, **kwargs)
+        # The backend keeps timestamped segments over plain ones, so reload rather than write through
+        self.memory.invalidate(("segments", file_hash))
+
+    def get(self, key):
+        cache_data = self._read_through(("summary", key), lambda: self.backend.get(key))
+        return dict(cache_data) if cache_data is not None else None
+
+    def put(self, key, file_hash, summary, options=None, **kwargs):
+        self.backend.put(key, file_hash, summary, options, **kwargs)
+        options = options or {}
+        self.memory.put(("summary", key), {
+            "file_hash": file_hash,
+            "summary": summary,
+            "options": options,
+            "include_timestamps": options.get("include_timestamps", False),
+            "timestamp": kwargs.get("created_at") or time.time(),
+        })
+
+    def delete(self, key):
+        self.backend.delete(key)
+        self.memory.invalidate(("summary", key))
+
+    def variants(self, file_hash):
+        return self.backend.variants(file_hash)
+
+    def search(self, query, limit=20):
+        return self.backend.search(query, limit)
+
+    def get_chunk(self, key):
+        return self._read_through(("chunk", key), lambda: self.backend.get_chunk(key))
+
+    def put_chunk(self, key, summary, **kwargs):
+        self.backend.put_chunk(key, summary, **kwargs)
+        self.memory.put(("chunk", key), summary)
+
+    def clear(self):
+        self.memory.clear()
+        cleared = self.backend.clear()
+        self._generation = self.backend.generation()
+        return cleared
+
+    def stats(self):
+        stats = self.backend.stats()
+        with self._lock:
+            lookups = self.backend_hits + self.backend_misses
+            disk_stats = {
+                "hits": self.backend_hits,
+                "misses": self.backend_misses,
+                "hit_rate": round(self.backend_hits / lookups, 3) if lookups else 0.0,
+            }
+        stats["tiers"] = {"memory": self.memory.stats(), "disk": disk_stats}
+        return stats
+
+
+def migrate_json_cache(store, cache_dir):
+    """
+    Import the legacy cache/<hash>.json and cache/chunks/<key>.json files into a store.
+
+    Each file is removed once its contents are in the store, so the migration
+    can be re-run safely after an interruption. Returns the number imported.
+    """
+    imported = 0
+    for directory, is_chunk in ((cache_dir, False), (os.path.join(cache_dir, "chunks"), True)):
+        if not os.path.isdir(directory):
+            continue
+        for entry in os.scandir(directory):
+            if not entry.is_file() or not entry.name.endswith(".json"):
+                continue
+            key = entry.name[:-len(".json")]
+            try:
+                with open(entry.path, "r", encoding="utf-8") as f:
+                    cache_data = json.load(f)
+            except FileNotFoundError:
+                # Imported by another process opening the cache at the same time
+                continue
+            except Exception as e:
+                logging.error(f"Failed to migrate cache file {entry.path}: {str(e)}")
+                continue
+            try:
+                if is_chunk:
+                    store.put_chunk(key, cache_data["summary"], created_at=cache_data.get("timestamp"))
+                elif cache_data.get("transcript"):
+                    # Legacy summaries do not record the options that produced them; keep the transcript
+                    store.put_transcript(
+                        key,
+                        cache_data.get("include_timestamps", False),
+                        cache_data["transcript"],
+                        created_at=cache_data.get("timestamp")
+                    )
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+                imported += 1
+            except Exception as e:
+                logging.error(f"Failed to migrate cache file {entry.path}: {str(e)}")
+
+    if imported:
+        logging.info(f"Migrated {imported} JSON cache files into {store.path}")
+    return imported
@@ -0,0 +1,164 @@
+# chunking.py
+import logging
+import math
+import re
+
+# tiktoken gives exact counts when installed; otherwise fall back to ~4 characters per token
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+SEGMENT_SEPARATOR = "\n\n"
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+# Timestamp prefix of a rendered segment, as written by ttml_parser.render_segment
+TIMESTAMP_PREFIX = re.compile(r"\[\d+:\d{2}:\d{2}\] ")
+
+_encoders = {}
+
+
+def _get_encoder(model):
+    if tiktoken is None:
+        return None
+    if model not in _encoders:
+        try:
+            _encoders[model] = tiktoken.encoding_for_model(model)
+        except KeyError:
+            _encoders[model] = tiktoken.get_encoding("cl100k_base")
+    return _encoders[model]
+
+
+def estimate_tokens(text, model="gpt-3.5-turbo"):
+    """Count tokens exactly with tiktoken if available, otherwise estimate from the character count."""
+    encoder = _get_encoder(model)
+    if encoder is not None:
+        return len(encoder.encode(text))
+    return math.ceil(len(text) / 4)
+
+
+def strip_timestamp(segment):
+    """Segment text without its rendered timestamp prefix, if it has one."""
+    match = TIMESTAMP_PREFIX.match(segment)
+    return segment[match.end():] if match else segment
+
+
+def segment_tokens(segment, model="gpt-3.5-turbo"):
+    """
+    Tokens budgeted for a segment: its text plus a timestamp prefix, whether it has one or not.
+
+    Both renderings of a transcript are therefore packed on the same
+    boundaries, and their chunks share chunk summaries in the cache.
+    """
+    return estimate_tokens(strip_timestamp(segment), model) + estimate_tokens("[00:00:00] ", model)
+
+
+def split_segment(segment, max_tokens, model="gpt-3.5-turbo"):
+    """Split a segment that exceeds max_tokens on sentence boundaries, then on words as a last resort."""
+    pieces = []
+    current = []
+    current_tokens = 0
+
+    for sentence in SENTENCE_BOUNDARY.split(segment):
+        sentence_tokens = estimate_tokens(sentence, model)
+        if sentence_tokens > max_tokens:
+            # A single run-on sentence: fall back to word boundaries
+            parts = sentence.split()
+        else:
+            parts = [sentence]
+
+        for part in parts:
+            part_tokens = estimate_tokens(" " + part, model)
+            if current and current_tokens + part_tokens > max_tokens:
+                pieces.append(" ".join(current))
+                current, current_tokens = [], 0
+            current.append(part)
+            current_tokens += part_tokens
+
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def chunk_segments(segments, max_tokens=3000, overlap_tokens=0, model="gpt-3.5-turbo"):
+    """
+    Pack transcript segments into chunks of at most max_tokens tokens.
+
+    Segments are never cut unless a single one is larger than a chunk. The
+    trailing segments of each chunk, up to overlap_tokens, are repeated at the
+    start of the next one so the model keeps some context across chunks.
+    """
+    separator_tokens = estimate_tokens(SEGMENT_SEPARATOR, model)
+    overlap_tokens = min(overlap_tokens, max_tokens // 2)
+
+    sized = []
+    for segment in segments:
+        if not segment:
+            continue
+        tokens = segment_tokens(segment, model)
+        if tokens > max_tokens:
+            for piece in split_segment(segment, max_tokens, model):
+                sized.append((piece, segment_tokens(piece, model)))
+        else:
+            sized.append((segment, tokens))
+
+    chunks = []
+    current = []
+    current_tokens = 0
+
+    for segment, tokens in sized:
+        cost = tokens + (separator_tokens if current else 0)
+        if current and current_tokens + cost > max_tokens:
+            chunks.append(SEGMENT_SEPARATOR.join(s for s, _ in current))
+
+            # Carry the tail of the finished chunk over as overlap
+            carried = []
+            carried_tokens = 0
+            for item in reversed(current):
+                if carried_tokens + item[1] + separator_tokens > overlap_tokens:
+                    break
+                carried.insert(0, item)
+                carried_tokens += item[1] + separator_tokens
+            if carried_tokens + tokens > max_tokens:
+                carried, carried_tokens = [], 0
+
+            current = carried
+            current_tokens = carried_tokens
+            cost = tokens + (separator_tokens if current else 0)
+
+        current.append((segment, tokens))
+        current_tokens += cost
+
+    if current:
+        chunks.append(SEGMENT_SEPARATOR.join(s for s, _ in current))
+    return chunks
+
+
+def chunk_transcript(transcript, max_tokens=3000, overlap_tokens=0, model="gpt-3.5-turbo"):
+    """Chunk a transcript produced by render_transcript on its paragraph boundaries."""
+    return chunk_segments(transcript.split(SEGMENT_SEPARATOR), max_tokens, overlap_tokens, model)
+
+
+def chunk_stats(chunks, max_tokens=None, model="gpt-3.5-turbo"):
+    """Summarize chunk sizes (count, token totals and how full the chunks are)."""
+    token_counts = [estimate_tokens(chunk, model) for chunk in chunks]
+    stats = {
+        "chunks": len(chunks),
+        "total_tokens": sum(token_counts),
+        "min_tokens": min(token_counts, default=0),
+        "max_tokens": max(token_counts, default=0),
+        "mean_tokens": round(sum(token_counts) / len(token_counts), 1) if token_counts else 0,
+        "exact_token_counts": tiktoken is not None,
+    }
+    if max_tokens:
+        stats["fill_ratio"] = round(stats["mean_tokens"] / max_tokens, 3)
+    return stats
+
+
+def log_chunk_stats(stats):
+    """Write chunk statistics to the application log."""
+    logging.info(
+        f"Chunk stats: {stats['chunks']} chunks, {stats['total_tokens']} tokens "
+        f"(min {stats['min_tokens']}, max {stats['max_tokens']}, mean {stats['mean_tokens']}"
+        + (f", fill {stats['fill_ratio']:.0%}" if 'fill_ratio' in stats else "")
+        + ")"
+    )
@@ -0,0 +1,3 @@
+# conftest.py
+# test_script.py is a manual check of the OpenAI API key, not a test
+collect_ignore = ["test_script.py"]
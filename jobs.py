@@ -0,0 +1,415 @@
+# jobs.py
+import contextvars
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from cache_store import transaction
+from metrics import JOB_SECONDS, trace, trace_id_var
+
+try:
+    import fcntl
+except ImportError:  # Windows: the single-runner lock is skipped
+    fcntl = None
+
+# Finished jobs are kept this long so clients can still fetch their result
+FINISHED_JOB_RETENTION = 60 * 60
+
+
+class Job:
+    """A unit of background work with a status, progress counters and an event log for streaming."""
+
+    def __init__(self, dedup_key, filename=None):
+        self.id = uuid.uuid4().hex
+        self.dedup_key = dedup_key
+        self.filename = filename
+        # Trace id of the request that created the job, if any
+        self.trace_id = trace_id_var.get()
+        self.status = "queued"
+        self.stage = "queued"
+        self.chunks_total = 0
+        self.chunks_done = 0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.events = []
+        self._condition = threading.Condition()
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed")
+
+    def publish(self, event, data):
+        """Append an event to the job's log and wake up anyone streaming it."""
+        with self._condition:
+            self.events.append((event, data))
+            self._condition.notify_all()
+
+    def set_stage(self, stage, chunks_total=None):
+        self.stage = stage
+        if chunks_total is not None:
+            self.chunks_total = chunks_total
+            self.chunks_done = 0
+        self.publish("progress", self.to_dict())
+
+    def chunk_done(self, stage, index, total, summary):
+        """Progress callback for the summarizer, called as each chunk request completes."""
+        with self._condition:
+            if self.stage != stage:
+                self.stage = stage
+                self.chunks_total = total
+                self.chunks_done = 0
+            self.chunks_done += 1
+        self.publish("progress", self.to_dict())
+        self.publish("chunk", {"stage": stage, "index": index, "total": total, "summary": summary})
+
+    def chunk_delta(self, stage, index, text):
+        """Streaming callback for the summarizer, called with each piece of generated text."""
+        self.publish("delta", {"stage": stage, "index": index, "text": text})
+
+    def finish(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.status = "failed" if error else "done"
+        self.stage = self.status
+        self.finished_at = time.time()
+        self.publish(self.status, self.to_dict())
+
+    def wait_for_events(self, cursor, timeout):
+        """Return the events after `cursor`, blocking up to `timeout` seconds for new ones."""
+        with self._condition:
+            if cursor >= len(self.events) and not self.finished:
+                self._condition.wait(timeout)
+            return self.events[cursor:]
+
+    def to_dict(self):
+        job_info = {
+            "id": self.id,
+            "filename": self.filename,
+            "trace_id": self.trace_id,
+            "status": self.status,
+            "stage": self.stage,
+            "chunks_total": self.chunks_total,
+            "chunks_done": self.chunks_done,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+        if self.status == "done":
+            job_info["result"] = self.result
+        if self.error:
+            job_info["error"] = self.error
+        return job_info
+
+
+def run_job(job, func, args):
+    """Run func(job, *args), recording its result or error on the job."""
+    job.status = "running"
+    job.set_stage("running")
+    started = time.time()
+    try:
+        result = func(job, *args)
+        job.finish(result=result)
+        logging.info(f"Job {job.id} finished in {time.time() - started:.2f}s")
+    except Exception as e:
+        logging.error(f"Job {job.id} failed: {str(e)}")
+        logging.error(traceback.format_exc())
+        job.finish(error=str(e))
+    finally:
+        JOB_SECONDS.observe(time.time() - job.created_at, outcome=job.status)
+
+
+class JobQueue:
+    """
+    Background worker pool for long-running jobs.
+
+    Jobs are de-duplicated by key: submitting work whose key matches a job
+    that is still queued or running returns that job instead of starting a
+    second one.
+    """
+
+    def __init__(self, max_workers=2):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def submit(self, dedup_key, func, *args, filename=None):
+        """
+        Run func(job, *args) in the background and return (job, created).
+
+        `created` is False when an in-flight job with the same key was reused.
+        """
+        with self._lock:
+            self._prune()
+            existing = self._in_flight.get(dedup_key)
+            if existing is not None:
+                logging.info(f"Joining in-flight job {existing.id} for key {dedup_key}")
+                return existing, False
+
+            job = Job(dedup_key, filename)
+            self._jobs[job.id] = job
+            self._in_flight[dedup_key] = job
+
+        # The job runs in a copy of the submitting request's context, keeping its trace id
+        self._executor.submit(contextvars.copy_context().run, self._run, job, func, args)
+        logging.info(f"Queued job {job.id} for {filename or dedup_key}")
+        return job, True
+
+    def _run(self, job, func, args):
+        try:
+            run_job(job, func, args)
+        finally:
+            with self._lock:
+                if self._in_flight.get(job.dedup_key) is job:
+                    del self._in_flight[job.dedup_key]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _prune(self):
+        """Forget finished jobs past the retention period (caller holds the lock)."""
+        cutoff = time.time() - FINISHED_JOB_RETENTION
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+SHARED_JOBS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    dedup_key TEXT NOT NULL,
+    handler TEXT NOT NULL,
+    args TEXT NOT NULL,
+    filename TEXT,
+    trace_id TEXT,
+    status TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    chunks_total INTEGER NOT NULL DEFAULT 0,
+    chunks_done INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    finished_at REAL
+);
+-- At most one queued or running job per key: this de-duplicates submissions from every process
+CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_active_key ON jobs(dedup_key) WHERE status IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at);
+
+CREATE TABLE IF NOT EXISTS job_events (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    event TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (job_id, seq)
+);
+"""
+
+
+class SharedJob(Job):
+    """
+    A Job whose state and event log live in the shared jobs database.
+
+    The runner process mutates it like a regular Job and every publish() is
+    written through; web processes load it by id and poll for new events.
+    """
+
+    def __init__(self, queue, dedup_key, filename=None):
+        super().__init__(dedup_key, filename)
+        self._queue = queue
+
+    @classmethod
+    def from_row(cls, queue, row):
+        job = cls(queue, row["dedup_key"], row["filename"])
+        job.id = row["id"]
+        job._load(row)
+        return job
+
+    def _load(self, row):
+        self.trace_id = row["trace_id"]
+        self.status = row["status"]
+        self.stage = row["stage"]
+        self.chunks_total = row["chunks_total"]
+        self.chunks_done = row["chunks_done"]
+        self.result = row["result"]
+        self.error = row["error"]
+        self.created_at = row["created_at"]
+        self.finished_at = row["finished_at"]
+
+    def publish(self, event, data):
+        conn = self._queue._connect()
+        with self._condition, transaction(conn):
+            conn.execute(
+                "UPDATE jobs SET status = ?, stage = ?, chunks_total = ?, chunks_done = ?, result = ?, error = ?, "
+                "finished_at = ? WHERE id = ?",
+                (self.status, self.stage, self.chunks_total, self.chunks_done, self.result, self.error,
+                 self.finished_at, self.id)
+            )
+            conn.execute(
+                "INSERT INTO job_events (job_id, seq, event, data) "
+                "SELECT ?, COALESCE(MAX(seq) + 1, 0), ?, ? FROM job_events WHERE job_id = ?",
+                (self.id, event, json.dumps(data), self.id)
+            )
+
+    def wait_for_events(self, cursor, timeout):
+        """Return the events after `cursor`, polling the database up to `timeout` seconds for new ones."""
+        deadline = time.monotonic() + timeout
+        conn = self._queue._connect()
+        while True:
+            rows = conn.execute(
+                "SELECT event, data FROM job_events WHERE job_id = ? AND seq >= ? ORDER BY seq", (self.id, cursor)
+            ).fetchall()
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (self.id,)).fetchone()
+            if row is not None:
+                self._load(row)
+            if rows or self.finished or time.monotonic() >= deadline:
+                return [(r["event"], json.loads(r["data"])) for r in rows]
+            time.sleep(self._queue.POLL_INTERVAL)
+
+
+class SharedJobQueue:
+    """
+    Job queue shared by several processes through a SQLite database.
+
+    Any process (e.g. each web server worker) can submit() and get() jobs;
+    de-duplication of in-flight jobs is enforced by a unique index, so it
+    holds across processes. Jobs are executed by run() in exactly one runner
+    process, which also keeps API calls behind that process's rate limiter.
+    Handlers are looked up by function name in `handlers`, and their
+    arguments must be JSON-serializable.
+    """
+
+    POLL_INTERVAL = 0.25
+
+    def __init__(self, path, handlers, max_workers=2):
+        self.path = path
+        self.handlers = {func.__name__: func for func in handlers}
+        self.max_workers = max_workers
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connect().executescript(SHARED_JOBS_SCHEMA)
+
+    def _connect(self):
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def submit(self, dedup_key, func, *args, filename=None):
+        """Queue func(job, *args) for the runner and return (job, created), like JobQueue.submit."""
+        if func.__name__ not in self.handlers:
+            raise ValueError(f"{func.__name__} is not a registered job handler")
+        conn = self._connect()
+        for _ in range(3):
+            job = SharedJob(self, dedup_key, filename)
+            try:
+                conn.execute(
+                    "INSERT INTO jobs (id, dedup_key, handler, args, filename, trace_id, status, stage, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, 'queued', 'queued', ?)",
+                    (job.id, dedup_key, func.__name__, json.dumps(args), filename, job.trace_id, job.created_at)
+                )
+                logging.info(f"Queued job {job.id} for {filename or dedup_key}")
+                return job, True
+            except sqlite3.IntegrityError:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE dedup_key = ? AND status IN ('queued', 'running')", (dedup_key,)
+                ).fetchone()
+                # Otherwise the in-flight job finished in between; try inserting again
+                if row is not None:
+                    logging.info(f"Joining in-flight job {row['id']} for key {dedup_key}")
+                    return SharedJob.from_row(self, row), False
+        raise RuntimeError(f"Could not queue job for key {dedup_key}")
+
+    def get(self, job_id):
+        row = self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return SharedJob.from_row(self, row) if row is not None else None
+
+    def _acquire_runner_lock(self):
+        """Hold an exclusive lock next to the database so only one runner executes jobs."""
+        if fcntl is None:
+            return None
+        lock_file = open(f"{self.path}.runner.lock", "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            raise RuntimeError(f"Another job runner is already using {self.path}")
+        return lock_file
+
+    def _claim(self):
+        """Mark the oldest queued job as running and return it, or None if there is none."""
+        conn = self._connect()
+        with transaction(conn):
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is not None:
+                conn.execute("UPDATE jobs SET status = 'running' WHERE id = ?", (row["id"],))
+        return row
+
+    def _prune(self):
+        cutoff = time.time() - FINISHED_JOB_RETENTION
+        conn = self._connect()
+        with transaction(conn):
+            conn.execute(
+                "DELETE FROM job_events WHERE job_id IN "
+                "(SELECT id FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?)", (cutoff,)
+            )
+            conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (cutoff,))
+
+    def _execute(self, row):
+        job = SharedJob.from_row(self, row)
+        func = self.handlers.get(row["handler"])
+        # Log lines of the job carry the trace id of the request that queued it
+        with trace(job.trace_id):
+            if func is None:
+                job.finish(error=f"Unknown job handler {row['handler']}")
+                return
+            run_job(job, func, json.loads(row["args"]))
+
+    def run(self, stop_event=None):
+        """Execute queued jobs on max_workers threads until stop_event is set."""
+        lock = self._acquire_runner_lock()
+        stop_event = stop_event or threading.Event()
+        # Jobs left running by a runner that died are started again
+        requeued = self._connect().execute(
+            "UPDATE jobs SET status = 'queued', stage = 'queued' WHERE status = 'running'"
+        ).rowcount
+        if requeued:
+            logging.info(f"Requeued {requeued} jobs interrupted by a previous runner")
+        logging.info(f"Job runner started with {self.max_workers} workers on {self.path}")
+
+        slots = threading.Semaphore(self.max_workers)
+        last_prune = 0.0
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job") as executor:
+                while not stop_event.is_set():
+                    if time.monotonic() - last_prune > 60:
+                        self._prune()
+                        last_prune = time.monotonic()
+                    if not slots.acquire(timeout=self.POLL_INTERVAL):
+                        continue
+                    row = self._claim()
+                    if row is None:
+                        slots.release()
+                        stop_event.wait(self.POLL_INTERVAL)
+                        continue
+                    future = executor.submit(self._execute, row)
+                    future.add_done_callback(lambda _: slots.release())
+        finally:
+            if lock is not None:
+                lock.close()
+            logging.info("Job runner stopped")
@@ -0,0 +1,188 @@
+# manifest.py
+"""
+SQLite manifest of the files in a directory, for listings that don't walk the disk.
+
+Each file has a row with its size, mtime, content hash and segment count.
+Rows are refreshed one file at a time as the file watcher reports changes,
+and sync() reconciles the whole directory (e.g. at start-up), re-reading
+only files whose size or mtime changed. Listings are sorted, filtered and
+paginated in SQL against indexed columns.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import stat as stat_module
+import threading
+import time
+
+from cache_store import transaction
+from ttml_parser import SEGMENT_SEPARATOR, hash_and_extract_segments
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    file_hash TEXT NOT NULL,
+    segment_count INTEGER,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_files_name ON files(name);
+CREATE INDEX IF NOT EXISTS idx_files_size ON files(size);
+CREATE INDEX IF NOT EXISTS idx_files_mtime ON files(mtime);
+CREATE INDEX IF NOT EXISTS idx_files_segment_count ON files(segment_count);
+"""
+
+# Sort keys accepted by list_files, mapped to columns
+SORT_COLUMNS = {"name": "name", "path": "path", "size": "size", "mtime": "mtime", "segments": "segment_count"}
+
+
+def describe_file(path):
+    """
+    Return (content hash, segment count) of a file from a single read.
+
+    TTML files are hashed like ttml_parser.hash_file, so the hash matches the
+    episode's cache entries, and their segments are the transcript
+    paragraphs. Text files count blank-line separated segments; other files
+    are hashed as bytes and have no segment count.
+    """
+    if path.endswith(".ttml"):
+        try:
+            file_hash, segments = hash_and_extract_segments(path)
+            return file_hash, len(segments)
+        except Exception as e:
+            logging.warning(f"Could not parse {path} as TTML: {str(e)}")
+
+    with open(path, "rb") as f:
+        data = f.read()
+    try:
+        text = data.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
+    except UnicodeDecodeError:
+        return hashlib.md5(data).hexdigest(), None
+    segment_count = sum(1 for segment in text.split(SEGMENT_SEPARATOR) if segment.strip())
+    return hashlib.md5(text.encode("utf-8")).hexdigest(), segment_count
+
+
+class FileManifest:
+    """Manifest of every file below `directory`, stored in the SQLite database at `path`."""
+
+    def __init__(self, directory, path):
+        self.directory = os.path.abspath(directory)
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self):
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def relative_path(self, path):
+        """Manifest key of a path below the directory, or None for paths outside it and hidden files."""
+        relative = os.path.relpath(os.path.abspath(path), self.directory)
+        parts = relative.split(os.sep)
+        if relative.startswith("..") or any(part.startswith(".") for part in parts):
+            return None
+        return "/".join(parts)
+
+    def update(self, path, stat=None):
+        """Add or refresh the row of one file; unchanged files (same size and mtime) are not read."""
+        relative = self.relative_path(path)
+        if relative is None:
+            return False
+        try:
+            stat = stat or os.stat(path)
+        except FileNotFoundError:
+            return self.remove(path)
+        if not stat_module.S_ISREG(stat.st_mode):
+            return False
+        conn = self._connect()
+        row = conn.execute("SELECT size, mtime FROM files WHERE path = ?", (relative,)).fetchone()
+        if row is not None and row["size"] == stat.st_size and row["mtime"] == stat.st_mtime:
+            return False
+
+        file_hash, segment_count = describe_file(path)
+        conn.execute(
+            "INSERT INTO files (path, name, size, mtime, file_hash, segment_count, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(path) DO UPDATE SET size = excluded.size, mtime = excluded.mtime, "
+            "file_hash = excluded.file_hash, segment_count = excluded.segment_count, updated_at = excluded.updated_at",
+            (relative, os.path.basename(path), stat.st_size, stat.st_mtime, file_hash, segment_count, time.time())
+        )
+        return True
+
+    def remove(self, path):
+        """Drop the row of a deleted file, or of every file below a deleted directory."""
+        relative = self.relative_path(path)
+        if relative is None:
+            return False
+        escaped = relative.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        removed = self._connect().execute(
+            "DELETE FROM files WHERE path = ? OR path LIKE ? ESCAPE '\\'", (relative, escaped + "/%")
+        ).rowcount
+        return removed > 0
+
+    def sync(self):
+        """Reconcile the manifest with the directory; return counts of updated and removed rows."""
+        started = time.time()
+        seen = set()
+        updated = 0
+        for root, dirs, filenames in os.walk(self.directory):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for filename in filenames:
+                path = os.path.join(root, filename)
+                relative = self.relative_path(path)
+                if relative is None:
+                    continue
+                seen.add(relative)
+                try:
+                    if self.update(path):
+                        updated += 1
+                except (FileNotFoundError, PermissionError) as e:
+                    logging.warning(f"Skipping {path}: {str(e)}")
+
+        conn = self._connect()
+        stale = [row["path"] for row in conn.execute("SELECT path FROM files") if row["path"] not in seen]
+        with transaction(conn):
+            conn.executemany("DELETE FROM files WHERE path = ?", ((path,) for path in stale))
+        logging.info(
+            f"Manifest of {self.directory}: {len(seen)} files, {updated} updated, {len(stale)} removed "
+            f"({time.time() - started:.2f}s)"
+        )
+        return {"files": len(seen), "updated": updated, "removed": len(stale)}
+
+    def get(self, relative):
+        row = self._connect().execute("SELECT * FROM files WHERE path = ?", (relative,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def list_files(self, page=1, per_page=50, sort="name", order="asc", query=None):
+        """
+        Return (rows, total) for one page of files.
+
+        `sort` is a key of SORT_COLUMNS, `order` "asc" or "desc", and
+        `query` filters on a case-insensitive substring of the path.
+        """
+        column = SORT_COLUMNS.get(sort, "name")
+        direction = "DESC" if order == "desc" else "ASC"
+        where, params = "", []
+        if query:
+            escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            where, params = "WHERE path LIKE ? ESCAPE '\\'", [f"%{escaped}%"]
+
+        conn = self._connect()
+        total = conn.execute(f"SELECT count(*) FROM files {where}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT path, name, size, mtime, file_hash, segment_count FROM files {where} "
+            f"ORDER BY {column} {direction}, path LIMIT ? OFFSET ?",
+            params + [per_page, (max(page, 1) - 1) * per_page]
+        ).fetchall()
+        return [dict(row) for row in rows], total
@@ -0,0 +1,236 @@
+# metrics.py
+"""
+In-process metrics in the Prometheus text exposition format, plus trace ids.
+
+Counters and histograms are plain thread-safe objects registered in a
+module-level registry; render() produces the text served at /metrics. The
+trace id of the current upload is kept in a context variable so every log
+line and job for one request can be tied together; thread pools that do
+work for a request copy the context into their workers (see
+jobs.JobQueue and summarizer.summarize_chunks).
+"""
+import contextvars
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# Seconds; covers sub-millisecond cache lookups up to multi-minute summaries
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+trace_id_var = contextvars.ContextVar("trace_id", default=None)
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            items = sorted(self._values.items())
+            lines.extend(self._render_samples(items))
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, e.g. cache hits or tokens used."""
+
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _render_samples(self, items):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values (durations, sizes) in cumulative buckets."""
+
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with-block in seconds."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _render_samples(self, items):
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state["counts"]):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state['sum'])}")
+            lines.append(f"{self.name}_count{labels} {state['count']}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Value that goes up and down, either set directly or read from a function at render time."""
+
+    type = "gauge"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._functions = {}
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function, **labels):
+        """Report function() as the value, e.g. the size of a pool owned by another object."""
+        key = self._key(labels)
+        with self._lock:
+            self._functions[key] = function
+
+    def render(self):
+        with self._lock:
+            functions = list(self._functions.items())
+        for key, function in functions:
+            try:
+                value = function()
+            except Exception:
+                continue
+            with self._lock:
+                self._values[key] = value
+        return super().render()
+
+    def _render_samples(self, items):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+def render():
+    """All registered metrics in the Prometheus text exposition format."""
+    with _registry_lock:
+        metrics = list(_registry)
+    return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+def new_trace_id():
+    return uuid.uuid4().hex[:16]
+
+
+@contextmanager
+def trace(trace_id=None):
+    """Run the with-block under a trace id (a new one if not given); yields the id."""
+    trace_id = trace_id or new_trace_id()
+    token = trace_id_var.set(trace_id)
+    try:
+        yield trace_id
+    finally:
+        trace_id_var.reset(token)
+
+
+class TraceIdFilter(logging.Filter):
+    """Adds `trace_prefix` ("[<trace id>] " or "") to log records for use in handler formats."""
+
+    def filter(self, record):
+        trace_id = trace_id_var.get()
+        record.trace_prefix = f"[{trace_id}] " if trace_id else ""
+        return True
+
+
+# Metrics recorded by the app, the summarizer, the OpenAI client and the cache helpers
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by endpoint",
+    ("method", "endpoint", "status")
+)
+JOB_SECONDS = Histogram(
+    "job_duration_seconds", "Time from queueing a background job to its completion", ("outcome",)
+)
+PARSE_SECONDS = Histogram("ttml_parse_duration_seconds", "Time to extract a transcript from TTML", ("source",))
+CHUNK_COUNT = Histogram("transcript_chunks", "Chunks per summarized transcript", buckets=COUNT_BUCKETS)
+PRESUMMARIZE_SECONDS = Histogram("presummarize_duration_seconds", "Time of the local pre-summarization pass")
+PRESUMMARIZE_TOKENS = Counter(
+    "presummarize_tokens_total", "Transcript tokens kept for or removed before summarization", ("result",)
+)
+API_REQUEST_SECONDS = Histogram(
+    "openai_request_duration_seconds", "Latency of individual chat completion requests", ("outcome",)
+)
+API_RETRIES = Counter("openai_retries_total", "Chat completion requests retried", ("reason",))
+API_TOKENS = Counter("openai_tokens_total", "Tokens reported used by the API", ("type",))
+RATE_LIMIT_WAIT_SECONDS = Histogram(
+    "rate_limiter_wait_seconds", "Time spent waiting on the shared rate limiter before a request"
+)
+CACHE_LOOKUP_SECONDS = Histogram(
+    "cache_lookup_duration_seconds", "Cache lookup latency", ("kind",),
+    buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1)
+)
+API_POOL_CONNECTIONS = Gauge(
+    "openai_pool_connections", "Connections held by the OpenAI HTTP pool (active, idle, max)", ("state",)
+)
+API_REQUESTS_IN_FLIGHT = Gauge(
+    "openai_requests_in_flight", "OpenAI HTTP requests sent and not yet fully read"
+)
+CACHE_REQUESTS = Counter("cache_requests_total", "Cache lookups by result", ("kind", "result"))
@@ -3,9 +3,10 @@ import os
 import time
 import shutil
 from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
 import logging
 
+from watcher import IngestPipeline, PipelineEventHandler
+
 # Configure logging
 logging.basicConfig(
     filename='monitor.log',
@@ -15,38 +16,75 @@ logging.basicConfig(
 
 # Directory to monitor for new TTML files
 SOURCE_DIR = os.path.expanduser("~/Library/Group Containers/243LU875E5.groups.com.apple.podcasts/Library/Cache/Assets/TTML")
-# Directory to copy files to for processing
+# Directory to hand files to for processing
 TARGET_DIR = "./uploads"
+# Seconds a file must stay unchanged before it is handed off, so partial downloads are skipped
+SETTLE_SECONDS = float(os.getenv("MONITOR_SETTLE_SECONDS", 2))
+# "link" hard-links files into TARGET_DIR (no data is copied); "copy" always copies.
+# Linking falls back to a copy when the two directories are on different filesystems.
+# To skip the hand-off entirely, set INGEST_DIRS for app.py to SOURCE_DIR instead.
+MODE = os.getenv("MONITOR_MODE", "link")
+
+
+def copy_to_uploads(source_path, file_hash=None, payload=None):
+    """Hand a settled TTML file to the uploads directory for app.py to process."""
+    filename = os.path.basename(source_path)
+    target_path = os.path.join(TARGET_DIR, filename)
 
-class TTMLHandler(FileSystemEventHandler):
-    def on_created(self, event):
-        if event.is_directory:
+    # Already handed off on an earlier run (links and copy2 both preserve size and mtime)
+    source_stat = os.stat(source_path)
+    if os.path.exists(target_path):
+        target_stat = os.stat(target_path)
+        if (target_stat.st_size, int(target_stat.st_mtime)) == (source_stat.st_size, int(source_stat.st_mtime)):
             return
-        if event.src_path.endswith(".ttml"):
-            filename = os.path.basename(event.src_path)
-            target_path = os.path.join(TARGET_DIR, filename)
 
+    try:
+        # Stage under a temporary name and rename into place, so the app never sees a partial file
+        temp_path = os.path.join(TARGET_DIR, f".{filename}.part")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        if MODE == "link":
             try:
-                # Copy file to uploads directory for app.py to process
-                shutil.copy2(event.src_path, target_path)
-                logging.info(f"Copied new TTML file to uploads: {filename}")
-            except Exception as e:
-                logging.error(f"Error copying file {filename}: {str(e)}")
+                os.link(source_path, temp_path)
+                os.replace(temp_path, target_path)
+                logging.info(f"Linked new TTML file into uploads: {filename}")
+                return
+            except OSError as e:
+                # EXDEV (different filesystem) or a filesystem without hard links
+                logging.info(f"Could not link {filename} ({str(e)}), copying instead")
+        shutil.copy2(source_path, temp_path)
+        os.replace(temp_path, target_path)
+        logging.info(f"Copied new TTML file to uploads: {filename}")
+    except Exception as e:
+        logging.error(f"Error copying file {filename}: {str(e)}")
+
+
+class TTMLHandler(PipelineEventHandler):
+    """Hands new TTML files in the Podcasts cache to the hand-off pipeline."""
+
 
 if __name__ == "__main__":
     # Create target directory if it doesn't exist
     if not os.path.exists(TARGET_DIR):
         os.makedirs(TARGET_DIR)
 
-    event_handler = TTMLHandler()
+    # Files are handed off unread; the app's uploads pipeline hashes each one in the same read that parses it
+    pipeline = IngestPipeline(copy_to_uploads, workers=1, settle_seconds=SETTLE_SECONDS, name="monitor")
+    pipeline.start()
+
+    event_handler = TTMLHandler(pipeline)
     observer = Observer()
     observer.schedule(event_handler, SOURCE_DIR, recursive=True)
     observer.start()
-    logging.info(f"Monitoring directory: {SOURCE_DIR}")
+    logging.info(f"Monitoring directory: {SOURCE_DIR} (mode: {MODE})")
+
+    # Catch episodes downloaded while the monitor was not running
+    pipeline.rescan(SOURCE_DIR, recursive=True)
 
     try:
         while True:
             time.sleep(1)
     except KeyboardInterrupt:
         observer.stop()
-    observer.join()
\ No newline at end of file
+    observer.join()
+    pipeline.stop()
@@ -0,0 +1,151 @@
+# openai_client.py
+"""
+OpenAI client with a tuned, observable HTTP connection pool.
+
+All summarization requests share one pooled httpx client: connections are
+kept alive between chunks so each request skips the TCP and TLS handshake,
+the pool is capped so bursts queue for a connection instead of opening an
+unbounded number, and HTTP/2 (when the h2 package is installed) multiplexes
+concurrent requests over a single connection. Pool utilization is published
+through the metrics module and pool_stats().
+
+Importing this module loads httpx and openai; app.get_client imports it on
+first use so the web app starts without them.
+"""
+import logging
+import threading
+
+import httpx
+from openai import DefaultHttpxClient, OpenAI
+
+from metrics import API_POOL_CONNECTIONS, API_REQUESTS_IN_FLIGHT
+
+# HTTP/2 needs the optional h2 package (pip install "httpx[http2]")
+try:
+    import h2  # noqa: F401
+except ImportError:
+    h2 = None
+
+
+class _TrackedStream(httpx.SyncByteStream):
+    """Response body that reports when it has been read and closed, i.e. the connection is released."""
+
+    def __init__(self, stream, on_close):
+        self._stream = stream
+        self._on_close = on_close
+        self._closed = False
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            if not self._closed:
+                self._closed = True
+                self._on_close()
+
+
+class PooledTransport(httpx.BaseTransport):
+    """
+    HTTP transport with a bounded keep-alive pool that counts requests in flight.
+
+    A request is in flight from the moment it is sent until its response
+    body is closed, so streamed completions count for as long as they hold
+    their connection.
+    """
+
+    def __init__(self, max_connections=10, max_keepalive_connections=None, keepalive_expiry=30.0, http2=False):
+        if http2 and h2 is None:
+            logging.warning("OPENAI_HTTP2 is set but the h2 package is not installed; using HTTP/1.1")
+            http2 = False
+        self.http2 = http2
+        self.max_connections = max_connections
+        self._transport = httpx.HTTPTransport(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections if max_keepalive_connections is not None else max_connections,
+                keepalive_expiry=keepalive_expiry
+            ),
+            http2=http2
+        )
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def handle_request(self, request):
+        self._add_in_flight(1)
+        try:
+            response = self._transport.handle_request(request)
+        except BaseException:
+            self._add_in_flight(-1)
+            raise
+        response.stream = _TrackedStream(response.stream, lambda: self._add_in_flight(-1))
+        return response
+
+    def _add_in_flight(self, amount):
+        with self._lock:
+            self._in_flight += amount
+        API_REQUESTS_IN_FLIGHT.inc(amount)
+
+    def stats(self):
+        """Open connections by state, the pool limit and requests in flight."""
+        # httpx keeps its httpcore pool private; without it only the request count is known
+        pool = getattr(self._transport, "_pool", None)
+        connections = list(getattr(pool, "connections", []))
+        idle = sum(1 for connection in connections if connection.is_idle())
+        active = sum(1 for connection in connections if not connection.is_idle() and not connection.is_closed())
+        return {
+            "active": active,
+            "idle": idle,
+            "max": self.max_connections,
+            "in_flight": self._in_flight,
+            "http2": self.http2,
+        }
+
+    def close(self):
+        self._transport.close()
+
+
+_transport = None
+
+
+def create_client(api_key, base_url=None, max_connections=10, max_keepalive_connections=None, keepalive_expiry=30.0,
+                  http2=False, connect_timeout=10.0, read_timeout=120.0, pool_timeout=60.0):
+    """
+    Build an OpenAI client on a pooled transport.
+
+    read_timeout bounds the wait for each read from the server (for a
+    streamed completion, the gap between tokens), not the whole request;
+    pool_timeout bounds the wait for a free connection when all
+    max_connections are busy. base_url points the client at any
+    OpenAI-compatible server.
+    """
+    global _transport
+    transport = PooledTransport(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive_connections,
+        keepalive_expiry=keepalive_expiry,
+        http2=http2
+    )
+    timeout = httpx.Timeout(connect=connect_timeout, read=read_timeout, write=read_timeout, pool=pool_timeout)
+    client = OpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        timeout=timeout,
+        http_client=DefaultHttpxClient(transport=transport, timeout=timeout)
+    )
+
+    _transport = transport
+    for state in ("active", "idle", "max"):
+        API_POOL_CONNECTIONS.set_function(lambda state=state: pool_stats()[state], state=state)
+    logging.info(
+        f"OpenAI client using {'HTTP/2' if transport.http2 else 'HTTP/1.1'} with up to {max_connections} connections"
+        f"{f' to {base_url}' if base_url else ''}"
+    )
+    return client
+
+
+def pool_stats():
+    """Utilization of the pool behind the most recently created client, or None before one exists."""
+    return _transport.stats() if _transport is not None else None
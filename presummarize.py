@@ -0,0 +1,345 @@
+# presummarize.py
+"""
+Local extractive pre-pass that trims a transcript before it is summarized.
+
+Runs on the CPU in three steps over the transcript's segments:
+
+1. Boilerplate: each segment gets a MinHash signature of its word pairs,
+   hashed into BANDS locality-sensitive band keys. Segments sharing at
+   least MIN_BAND_MATCHES band keys with a segment of `min_episodes` other
+   recently seen episodes - intros, sponsor reads, calls to subscribe,
+   even with an episode number or promo code changed - are dropped. Band
+   keys of the last `history` episodes are kept in a SQLite
+   BoilerplateIndex; a show's boilerplate recurs across its episodes, so
+   no show id is needed.
+2. Repeats: later near-duplicates of a segment in the same episode are dropped.
+3. Salience: the remaining segments are ranked with TextRank over the
+   TF-IDF cosine similarity of their words, and the highest ranked ones are
+   kept, in their original order, until `keep_ratio` of the transcript's
+   tokens are used. Short filler ("Yeah.", "Right.") shares few words with
+   anything and ranks last.
+
+Scoring is vectorized with NumPy, which is optional; callers check `np`.
+Neither the term matrix nor the pairwise similarity matrix is materialized
+densely, so memory grows with the number of words in the transcript.
+"""
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+from cache_store import transaction
+from chunking import estimate_tokens
+from ttml_parser import RENDERED_TIMESTAMP, SEGMENT_SEPARATOR
+
+# NumPy does the scoring; without it the pre-pass is unavailable
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+WORD = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+STOPWORDS = frozenset((
+    "a about after again all also am an and any are as at be because been before being but by can could did do "
+    "does doing don't down for from get got had has have having he her here hers him his how i i'm if in into is "
+    "it it's its just know like me more most my no not now of off oh ok okay on once one only or other our out "
+    "over really right so some such than that that's the their them then there these they this those through "
+    "to too um uh up very was we we're well were what when where which while who why will with would yeah yes "
+    "you you're your"
+).split())
+
+# MinHash near-duplicate detection: BANDS bands of BAND_ROWS hashes each. Two
+# segments with word-pair Jaccard similarity s share Binomial(BANDS, s ** BAND_ROWS)
+# band keys, so MIN_BAND_MATCHES of 8 accepts s = 0.8 in 97% and s = 0.3 in 3% of cases
+SHINGLE_WORDS = 2
+MIN_FINGERPRINT_WORDS = 8  # shorter segments are too generic to call boilerplate
+BANDS = 8
+BAND_ROWS = 2
+MIN_BAND_MATCHES = 3
+
+# TF-IDF / TextRank
+MAX_DOCUMENT_FREQUENCY = 0.5  # terms in more than half the segments carry no signal
+DAMPING = 0.85
+ITERATIONS = 50
+TOLERANCE = 1e-6
+
+BOILERPLATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS episodes (
+    file_hash TEXT PRIMARY KEY,
+    added_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_episodes_added_at ON episodes(added_at);
+CREATE TABLE IF NOT EXISTS bands (
+    key INTEGER NOT NULL,
+    file_hash TEXT NOT NULL,
+    segment INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_bands_key ON bands(key);
+CREATE INDEX IF NOT EXISTS idx_bands_file_hash ON bands(file_hash);
+"""
+
+
+def tokenize(text):
+    """Lower-cased words of a segment without stopwords and without a rendered timestamp prefix."""
+    match = RENDERED_TIMESTAMP.match(text)
+    if match:
+        text = text[match.end():]
+    return [word for word in WORD.findall(text.lower()) if word not in STOPWORDS]
+
+
+def _mix64(x):
+    """splitmix64 finalizer on a uint64 array; products wrap around as intended."""
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _term_ids(token_lists):
+    """Flat arrays (segment index, term id) of every token, and the vocabulary as a list."""
+    vocabulary = {}
+    segments, terms = [], []
+    for i, tokens in enumerate(token_lists):
+        for token in tokens:
+            segments.append(i)
+            terms.append(vocabulary.setdefault(token, len(vocabulary)))
+    return np.array(segments, dtype=np.int64), np.array(terms, dtype=np.int64), list(vocabulary)
+
+
+def minhash_band_keys(token_lists):
+    """
+    BANDS band keys (signed 64-bit ints) of each segment, or None for segments under MIN_FINGERPRINT_WORDS.
+
+    Word hashes come from blake2b, so keys are stable across processes and
+    can be compared with ones stored earlier.
+    """
+    band_keys = [None] * len(token_lists)
+    segment_ids, term_ids, vocabulary = _term_ids(token_lists)
+    if not vocabulary:
+        return band_keys
+    word_hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little") for word in vocabulary],
+        dtype=np.uint64
+    )[term_ids]
+
+    # Shingle i is words i..i+SHINGLE_WORDS-1, valid when all of them are in the same segment
+    n = len(word_hashes) - SHINGLE_WORDS + 1
+    if n <= 0:
+        return band_keys
+    shingles = word_hashes[:n]
+    for offset in range(1, SHINGLE_WORDS):
+        shingles = _mix64(shingles ^ np.uint64(offset)) ^ word_hashes[offset:offset + n]
+    owners = segment_ids[:n]
+    lengths = np.array([len(tokens) for tokens in token_lists])
+    valid = (owners == segment_ids[SHINGLE_WORDS - 1:SHINGLE_WORDS - 1 + n]) & (lengths[owners] >= MIN_FINGERPRINT_WORDS)
+    shingles, owners = shingles[valid], owners[valid]
+    if not len(shingles):
+        return band_keys
+
+    # One hash function per signature row: the shingle hash mixed with the row number
+    rows = np.arange(1, BANDS * BAND_ROWS + 1, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+    hashes = _mix64(shingles[:, None] ^ rows[None, :])
+    starts = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]])
+    signatures = np.minimum.reduceat(hashes, starts, axis=0)
+    keys = signatures[:, 0::BAND_ROWS]
+    for row in range(1, BAND_ROWS):
+        keys = _mix64(keys) ^ signatures[:, row::BAND_ROWS]
+    keys = _mix64(keys).view(np.int64)
+    for segment, segment_keys in zip(owners[starts], keys):
+        band_keys[int(segment)] = segment_keys.tolist()
+    return band_keys
+
+
+def repeated_segments(band_keys):
+    """Indexes of segments that nearly duplicate an earlier segment of the same episode."""
+    seen = defaultdict(list)  # band key -> earlier segments with it
+    repeated = set()
+    for i, keys in enumerate(band_keys):
+        if keys is None:
+            continue
+        matches = defaultdict(int)
+        for key in keys:
+            for j in seen[key]:
+                matches[j] += 1
+        if any(count >= MIN_BAND_MATCHES for count in matches.values()):
+            repeated.add(i)
+            continue
+        for key in keys:
+            seen[key].append(i)
+    return repeated
+
+
+def textrank_scores(token_lists):
+    """
+    TextRank centrality of each segment over the TF-IDF cosine similarity graph.
+
+    The row-normalized TF-IDF matrix X is kept sparse, as one (segment,
+    term, weight) entry per distinct word of each segment. The similarity
+    matrix is X @ X.T minus its diagonal; each power iteration multiplies
+    by X.T and then X with bincount instead of building it, so time and
+    memory are linear in the number of words.
+    """
+    n = len(token_lists)
+    segment_ids, term_ids, vocabulary = _term_ids(token_lists)
+    if n == 0 or not vocabulary:
+        return np.full(n, 1.0 / max(n, 1))
+
+    # Term counts per segment, then document frequencies; keep terms shared by some but not most segments
+    size = len(vocabulary)
+    pairs, counts = np.unique(segment_ids * size + term_ids, return_counts=True)
+    rows, terms = pairs // size, pairs % size
+    document_frequency = np.bincount(terms, minlength=size)
+    useful = (document_frequency >= 2) & (document_frequency <= max(2, MAX_DOCUMENT_FREQUENCY * n))
+    kept = useful[terms]
+    rows, terms, counts = rows[kept], terms[kept], counts[kept]
+    if not len(rows):
+        return np.full(n, 1.0 / n)
+
+    weights = np.log1p(counts) * (np.log(n / document_frequency[terms]) + 1)
+    norms = np.sqrt(np.bincount(rows, weights=weights ** 2, minlength=n))
+    weights /= norms[rows]
+
+    def similarity_times(vector):
+        """(X @ X.T - diagonal) @ vector."""
+        column_sums = np.bincount(terms, weights=weights * vector[rows], minlength=size)
+        return np.bincount(rows, weights=weights * column_sums[terms], minlength=n) - self_similarity * vector
+
+    self_similarity = (norms > 0).astype(np.float64)
+    degree = similarity_times(np.ones(n))
+    inverse_degree = np.where(degree > 1e-9, 1 / np.maximum(degree, 1e-9), 0)
+    scores = np.full(n, 1.0 / n)
+    for _ in range(ITERATIONS):
+        updated = (1 - DAMPING) / n + DAMPING * similarity_times(scores * inverse_degree)
+        converged = np.abs(updated - scores).sum() < TOLERANCE
+        scores = updated
+        if converged:
+            break
+    return scores
+
+
+class BoilerplateIndex:
+    """
+    MinHash band keys of the segments of the last `history` episodes, stored in SQLite at `path`.
+
+    Only segments sharing a band key are ever compared, so a lookup reads
+    the rows of near-duplicates and little else. Safe to share between
+    threads and processes.
+    """
+
+    def __init__(self, path, history=500):
+        self.path = path
+        self.history = history
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connect().executescript(BOILERPLATE_SCHEMA)
+
+    def _connect(self):
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def episode_counts(self, band_keys, file_hash=None):
+        """For each segment's band keys (or None), the number of other episodes with a near-duplicate segment."""
+        queries = defaultdict(list)  # band key -> segments with that key
+        for i, keys in enumerate(band_keys):
+            for key in keys or ():
+                queries[key].append(i)
+        matches = defaultdict(int)  # (segment, other episode, other segment) -> shared band keys
+        keys = list(queries)
+        conn = self._connect()
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            rows = conn.execute(
+                f"SELECT key, file_hash, segment FROM bands WHERE key IN ({','.join('?' * len(batch))}) "
+                f"AND file_hash != ?",
+                batch + [file_hash or ""]
+            )
+            for key, other_hash, other_segment in rows:
+                for i in queries[key]:
+                    matches[(i, other_hash, other_segment)] += 1
+
+        episodes = [set() for _ in band_keys]
+        for (i, other_hash, _), count in matches.items():
+            if count >= MIN_BAND_MATCHES:
+                episodes[i].add(other_hash)
+        return [len(others) for others in episodes]
+
+    def add(self, file_hash, band_keys):
+        """Record (or replace) an episode's band keys and forget episodes beyond the history limit."""
+        rows = [(key, file_hash, i) for i, keys in enumerate(band_keys) for key in keys or ()]
+        conn = self._connect()
+        with transaction(conn):
+            conn.execute("DELETE FROM bands WHERE file_hash = ?", (file_hash,))
+            conn.execute("INSERT OR REPLACE INTO episodes (file_hash, added_at) VALUES (?, ?)", (file_hash, time.time()))
+            conn.executemany("INSERT INTO bands (key, file_hash, segment) VALUES (?, ?, ?)", rows)
+            expired = [row[0] for row in conn.execute(
+                "SELECT file_hash FROM episodes ORDER BY added_at DESC LIMIT -1 OFFSET ?", (self.history,)
+            )]
+            for old_hash in expired:
+                conn.execute("DELETE FROM bands WHERE file_hash = ?", (old_hash,))
+                conn.execute("DELETE FROM episodes WHERE file_hash = ?", (old_hash,))
+
+
+def presummarize(transcript, keep_ratio=0.5, boilerplate=None, file_hash=None, min_episodes=2, min_tokens=0,
+                 model="gpt-3.5-turbo"):
+    """
+    Return (trimmed transcript, stats) keeping the most salient `keep_ratio` of the transcript's tokens.
+
+    Segments are the transcript's paragraphs (rendered timestamps are kept
+    with them). With a BoilerplateIndex, segments repeated in `min_episodes`
+    other episodes are dropped and this episode is recorded under
+    `file_hash`. Transcripts of at most `min_tokens` tokens only lose
+    boilerplate and repeats. A keep_ratio of 1 disables salience trimming.
+    """
+    started = time.perf_counter()
+    segments = [segment for segment in transcript.split(SEGMENT_SEPARATOR) if segment.strip()]
+    token_lists = [tokenize(segment) for segment in segments]
+    token_counts = [estimate_tokens(segment, model) for segment in segments]
+    tokens_before = sum(token_counts)
+
+    band_keys = minhash_band_keys(token_lists)
+    dropped_boilerplate = set()
+    if boilerplate is not None:
+        counts = boilerplate.episode_counts(band_keys, file_hash)
+        dropped_boilerplate = {i for i, count in enumerate(counts) if count >= min_episodes}
+        if file_hash:
+            boilerplate.add(file_hash, band_keys)
+    dropped_repeats = repeated_segments(band_keys) - dropped_boilerplate
+
+    remaining = [i for i in range(len(segments)) if i not in dropped_boilerplate and i not in dropped_repeats]
+    budget = keep_ratio * tokens_before
+    if keep_ratio < 1 and tokens_before > min_tokens and sum(token_counts[i] for i in remaining) > budget:
+        scores = textrank_scores([token_lists[i] for i in remaining])
+        kept = []
+        used = 0
+        for position in np.argsort(-scores, kind="stable"):
+            i = remaining[position]
+            if used + token_counts[i] <= budget:
+                kept.append(i)
+                used += token_counts[i]
+        remaining = sorted(kept)
+
+    result = SEGMENT_SEPARATOR.join(segments[i] for i in remaining)
+    stats = {
+        "segments": len(segments),
+        "kept_segments": len(remaining),
+        "boilerplate_segments": len(dropped_boilerplate),
+        "repeated_segments": len(dropped_repeats),
+        "tokens_before": tokens_before,
+        "tokens_after": sum(token_counts[i] for i in remaining),
+        "seconds": time.perf_counter() - started,
+    }
+    logging.info(
+        f"Pre-summarization kept {stats['kept_segments']}/{stats['segments']} segments "
+        f"({stats['tokens_after']}/{stats['tokens_before']} tokens; {stats['boilerplate_segments']} boilerplate, "
+        f"{stats['repeated_segments']} repeated) in {stats['seconds']:.3f}s"
+    )
+    return result, stats
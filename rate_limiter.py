@@ -0,0 +1,85 @@
+# rate_limiter.py
+import logging
+import threading
+import time
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `rate_per_minute`; a rate of 0 or None means unlimited."""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate_per_minute = rate_per_minute or 0
+        self.capacity = capacity or self.rate_per_minute
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+
+    @property
+    def unlimited(self):
+        return self.rate_per_minute <= 0
+
+    def refill(self, now):
+        """Add the tokens accrued since the last refill, up to capacity."""
+        if self.unlimited:
+            return
+        elapsed = now - self.updated_at
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate_per_minute / 60.0)
+        self.updated_at = now
+
+    def wait_time(self, amount):
+        """Seconds until `amount` tokens are available (0 if they already are)."""
+        if self.unlimited:
+            return 0.0
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) * 60.0 / self.rate_per_minute
+
+    def consume(self, amount):
+        if not self.unlimited:
+            self.tokens -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    """
+    Thread-safe limiter combining a requests/min and a tokens/min bucket.
+
+    Workers call acquire() before each API request. A rate-limit response can
+    pause the whole limiter with pause(), so every worker honours the
+    server's retry-after hint rather than only the one that was rejected.
+    """
+
+    def __init__(self, requests_per_minute=0, tokens_per_minute=0):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.paused_until = 0.0
+        self.total_wait = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=0):
+        """Block until one request carrying `tokens` tokens fits in both budgets; return seconds waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.requests.refill(now)
+                self.tokens.refill(now)
+                wait = max(
+                    self.paused_until - now,
+                    self.requests.wait_time(1),
+                    self.tokens.wait_time(tokens),
+                )
+                if wait <= 0:
+                    self.requests.consume(1)
+                    self.tokens.consume(tokens)
+                    self.total_wait += waited
+                    return waited
+            time.sleep(wait)
+            waited += wait
+
+    def pause(self, seconds):
+        """Hold back all callers for `seconds`, e.g. after a 429 with a retry-after header."""
+        with self._lock:
+            resume_at = time.monotonic() + seconds
+            if resume_at > self.paused_until:
+                self.paused_until = resume_at
+                logging.info(f"Rate limiter paused for {seconds:.2f}s")
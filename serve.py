@@ -0,0 +1,149 @@
+# serve.py
+"""
+Production entry point: several web worker processes plus one job runner.
+
+The web workers run under gunicorn (threaded workers, so server-sent event
+streams don't block other requests) and only hash, look up and queue
+uploads. Everything that calls the API - queued jobs and files picked up by
+the watcher - runs in a single runner process, so there is one rate
+limiter budget and the file watcher runs exactly once. Jobs and their
+progress events are shared through a SQLite database (JOBS_DB_PATH), the
+cache through the usual cache database.
+
+Metrics are kept per process, so the runner serves its own (API requests,
+rate limiter waits, job and watcher timings) on RUNNER_METRICS_BIND; the
+web workers' /metrics only covers what happens in the worker that answers.
+
+Usage:
+    python serve.py [--workers 4] [--threads 8] [--bind 127.0.0.1:5000]
+    python serve.py --runner-only     # only the job runner and file watcher
+"""
+import argparse
+import logging
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Every process started from here shares jobs through the database
+os.environ["JOB_QUEUE"] = "shared"
+
+RUNNER_METRICS_BIND = os.getenv("RUNNER_METRICS_BIND", "127.0.0.1:9101")
+
+
+def parse_bind(bind):
+    host, _, port = bind.rpartition(":")
+    return host or "0.0.0.0", int(port)
+
+
+def start_metrics_server(bind):
+    """Serve this process's metrics at /metrics on a daemon thread; return the server."""
+    from metrics import render
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(parse_bind(bind), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="runner-metrics", daemon=True).start()
+    logging.info(f"Serving runner metrics on http://{bind}/metrics")
+    return server
+
+
+def run_runner():
+    """Run queued jobs and the file watcher until SIGTERM or SIGINT."""
+    import app
+
+    app.configure_logging()
+    queue = app.get_job_queue()
+    metrics_server = start_metrics_server(RUNNER_METRICS_BIND) if RUNNER_METRICS_BIND else None
+    stop = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stop.set())
+
+    observer = app.start_watchers()
+    try:
+        queue.run(stop)
+    finally:
+        observer.stop()
+        observer.join()
+        app.uploads_pipeline.stop()
+        if metrics_server is not None:
+            metrics_server.shutdown()
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the app with multiple worker processes.")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_WORKERS", os.cpu_count() or 2)),
+                        help="Web worker processes (default: WEB_WORKERS or CPU count)")
+    parser.add_argument("--threads", type=int, default=int(os.getenv("WEB_THREADS", 8)),
+                        help="Threads per web worker; each open progress stream holds one (default: 8)")
+    parser.add_argument("--bind", default=os.getenv("BIND", "127.0.0.1:5000"), help="Address to listen on")
+    parser.add_argument("--runner-only", action="store_true", help="Run only the job runner and file watcher")
+    args = parser.parse_args(argv)
+
+    if args.runner_only:
+        return run_runner()
+
+    # Create or migrate the cache once, before the runner and every web worker open it
+    import app
+    app.configure_logging()
+    app.get_cache_store()
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    runner = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--runner-only"], cwd=here)
+    web = subprocess.Popen([
+        sys.executable, "-m", "gunicorn",
+        "--workers", str(args.workers),
+        "--worker-class", "gthread",
+        "--threads", str(args.threads),
+        "--bind", args.bind,
+        "app:create_app()",
+    ], cwd=here)
+    processes = [runner, web]
+    print(f"Serving on http://{args.bind} with {args.workers} web workers (runner PID {runner.pid}, "
+          f"web PID {web.pid})")
+    if RUNNER_METRICS_BIND:
+        print(f"Runner metrics on http://{RUNNER_METRICS_BIND}/metrics")
+
+    def shutdown(*_):
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    # If either side exits, stop the other rather than serving half an app
+    try:
+        while all(process.poll() is None for process in processes):
+            time.sleep(0.5)
+    finally:
+        shutdown()
+        for process in processes:
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                logging.warning(f"Process {process.pid} did not stop; killing it")
+                process.kill()
+    return max(process.returncode or 0 for process in processes)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
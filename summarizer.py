@@ -0,0 +1,264 @@
+# summarizer.py
+import contextvars
+import email.utils
+import hashlib
+import logging
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from chunking import chunk_segments, estimate_tokens, strip_timestamp, SEGMENT_SEPARATOR
+from metrics import API_REQUEST_SECONDS, API_RETRIES, API_TOKENS, RATE_LIMIT_WAIT_SECONDS
+
+# Bump when the prompts change so cached chunk summaries are not reused
+PROMPT_VERSION = "1"
+SYSTEM_PROMPT = "You are a helpful assistant that summarizes podcast transcripts."
+CHUNK_PROMPT = "Summarize the following podcast transcript in bullet points:\n\n{chunk}"
+REDUCE_PROMPT = (
+    "The following bullet-point summaries cover consecutive parts of one podcast episode. "
+    "Merge them into a single bullet-point summary of the whole episode, removing repetition:\n\n{chunk}"
+)
+FAILED_CHUNK_PLACEHOLDER = "*[This section could not be summarized due to API limitations]*"
+
+
+def is_complete(summary):
+    """False if any part of the summary is the failure placeholder; such summaries must not be cached."""
+    return FAILED_CHUNK_PLACEHOLDER not in summary
+
+
+def estimate_request_tokens(text, max_tokens, model="gpt-3.5-turbo"):
+    """Token cost of one request: system prompt, chunk and the completion budget."""
+    return estimate_tokens(SYSTEM_PROMPT, model) + estimate_tokens(text, model) + max_tokens
+
+
+def chunk_cache_key(text, prompt, model, max_tokens):
+    """
+    Content hash identifying the summary of `text` under a given model and prompt.
+
+    Timestamp prefixes are left out, so a chunk summarized with timestamps
+    is reused when the same file is summarized without them, and vice versa.
+    """
+    text = SEGMENT_SEPARATOR.join(strip_timestamp(segment) for segment in text.split(SEGMENT_SEPARATOR))
+    key_source = "\0".join([PROMPT_VERSION, model, str(max_tokens), SYSTEM_PROMPT, prompt, text])
+    return hashlib.sha256(key_source.encode("utf-8")).hexdigest()
+
+
+def get_retry_after(error):
+    """Return the server's retry-after hint in seconds for a rate-limit error, or None."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    try:
+        return float(headers.get("retry-after-ms")) / 1000
+    except (TypeError, ValueError):
+        pass
+
+    retry_after = headers.get("retry-after")
+    try:
+        return float(retry_after)
+    except (TypeError, ValueError):
+        pass
+
+    # Retry-After may also be an HTTP date
+    retry_date = email.utils.parsedate_tz(retry_after) if retry_after else None
+    if retry_date is None:
+        return None
+    return max(0.0, email.utils.mktime_tz(retry_date) - time.time())
+
+
+def _record_usage(usage):
+    if usage is not None:
+        API_TOKENS.inc(usage.prompt_tokens or 0, type="prompt")
+        API_TOKENS.inc(usage.completion_tokens or 0, type="completion")
+
+
+def _stream_completion(response, on_delta):
+    """Collect a streamed chat completion, passing each piece of text to on_delta as it arrives."""
+    parts = []
+    for event in response:
+        # The final event carries usage and no choices (stream_options include_usage)
+        _record_usage(getattr(event, "usage", None))
+        if not event.choices:
+            continue
+        text = event.choices[0].delta.content
+        if text:
+            parts.append(text)
+            on_delta(text)
+    return "".join(parts)
+
+
+def summarize_chunk(client, chunk, index, total, limiter, model="gpt-3.5-turbo", max_tokens=300, max_retries=8,
+                    prompt=CHUNK_PROMPT, on_delta=None):
+    """
+    Summarize one chunk, retrying on rate limits and transient errors; return the placeholder text if it never succeeds.
+
+    With on_delta the completion is streamed and on_delta(text) is called for each token batch.
+    """
+    # Imported here so that importing this module (and the app) doesn't load the openai package
+    from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+
+    chunk_start_time = time.time()
+    logging.info(f"Processing chunk {index+1}/{total} (size: {len(chunk)} characters)")
+    request_tokens = estimate_request_tokens(chunk, max_tokens, model)
+
+    retry_count = 0
+    while retry_count < max_retries:
+        RATE_LIMIT_WAIT_SECONDS.observe(limiter.acquire(request_tokens))
+        request_started = time.perf_counter()
+        try:
+            stream_options = {"stream_options": {"include_usage": True}} if on_delta is not None else {}
+            response = client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt.format(chunk=chunk)}
+                ],
+                max_tokens=max_tokens,
+                stream=on_delta is not None,
+                **stream_options
+            )
+            if on_delta is not None:
+                summary_text = _stream_completion(response, on_delta).strip()
+            else:
+                _record_usage(response.usage)
+                summary_text = response.choices[0].message.content.strip()
+            API_REQUEST_SECONDS.observe(time.perf_counter() - request_started, outcome="ok")
+            logging.info(f"Successfully summarized chunk {index+1} (took {time.time() - chunk_start_time:.2f}s)")
+            return summary_text
+        except RateLimitError as e:
+            API_REQUEST_SECONDS.observe(time.perf_counter() - request_started, outcome="rate_limited")
+            API_RETRIES.inc(reason="rate_limit")
+            retry_count += 1
+            retry_after = get_retry_after(e)
+            wait_time = retry_after if retry_after is not None else min(60, 2 ** retry_count)  # Cap at 60 seconds max wait
+            logging.warning(f"Rate limit exceeded on chunk {index+1}. Retrying in {wait_time:.2f} seconds... (Attempt {retry_count}/{max_retries})")
+            # Pause the shared limiter so the other workers back off too
+            limiter.pause(wait_time)
+        except (APIConnectionError, APITimeoutError, InternalServerError) as e:
+            # Timeouts, dropped connections and 5xx responses: back off this chunk only
+            API_REQUEST_SECONDS.observe(time.perf_counter() - request_started, outcome="error")
+            API_RETRIES.inc(reason="transient_error")
+            retry_count += 1
+            wait_time = min(60, 2 ** retry_count)
+            logging.warning(f"Transient error on chunk {index+1}: {str(e)}. Retrying in {wait_time:.2f} seconds... (Attempt {retry_count}/{max_retries})")
+            time.sleep(wait_time)
+        except Exception as e:
+            API_REQUEST_SECONDS.observe(time.perf_counter() - request_started, outcome="error")
+            error_msg = f"Error summarizing chunk {index+1}: {str(e)}"
+            logging.error(error_msg)
+            logging.error(traceback.format_exc())
+            break
+
+    logging.error(f"Failed to summarize chunk {index+1} after {retry_count} attempts")
+    return FAILED_CHUNK_PLACEHOLDER
+
+
+def _summarize_chunk_cached(client, chunk, index, total, limiter, cache_get, cache_save, progress, stage,
+                            delta, **options):
+    """Return (summary, cache hit): a cached summary for the chunk if there is one, otherwise summarize and store it."""
+    key = chunk_cache_key(
+        chunk,
+        options.get("prompt", CHUNK_PROMPT),
+        options.get("model", "gpt-3.5-turbo"),
+        options.get("max_tokens", 300)
+    )
+    summary_text = cache_get(key) if cache_get is not None else None
+    hit = summary_text is not None
+    if hit:
+        logging.info(f"Chunk {index+1}/{total} served from cache")
+    else:
+        on_delta = (lambda text: delta(stage, index, text)) if delta is not None else None
+        summary_text = summarize_chunk(client, chunk, index, total, limiter, on_delta=on_delta, **options)
+        # Never cache the failure placeholder so the chunk is retried next time
+        if cache_save is not None and summary_text != FAILED_CHUNK_PLACEHOLDER:
+            cache_save(key, summary_text)
+
+    if progress is not None:
+        progress(stage, index, total, summary_text)
+    return summary_text, hit
+
+
+def summarize_chunks(client, chunks, limiter, max_workers=4, cache_get=None, cache_save=None, stats=None,
+                     progress=None, stage="map", delta=None, **options):
+    """
+    Summarize chunks concurrently on a bounded thread pool, returning summaries in chunk order.
+
+    If given, progress(stage, index, total, summary) is called from the worker
+    threads as each chunk completes, in completion order. If delta is given,
+    completions are streamed and delta(stage, index, text) receives the text
+    of each chunk as it is generated.
+    """
+    if not chunks:
+        return []
+    if stats is None:
+        stats = {"hits": 0, "misses": 0}
+
+    # Retries (of rate limits and transient errors) happen in summarize_chunk, paced by the shared limiter,
+    # not in the client's own backoff
+    client = client.with_options(max_retries=0)
+    total = len(chunks)
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, total)), thread_name_prefix="summarize") as executor:
+        # Each worker runs in a copy of the caller's context so log lines keep its trace id
+        futures = [
+            executor.submit(
+                contextvars.copy_context().run, _summarize_chunk_cached, client, chunk, i, total, limiter, cache_get, cache_save,
+                progress, stage, delta, **options
+            )
+            for i, chunk in enumerate(chunks)
+        ]
+        results = [future.result() for future in futures]
+    # Counted here rather than in the workers, which would race on the shared dict
+    hits = sum(1 for _, hit in results if hit)
+    stats["hits"] += hits
+    stats["misses"] += len(results) - hits
+    return [summary for summary, _ in results]
+
+
+def map_reduce_summarize(client, chunks, limiter, max_workers=4, cache_get=None, cache_save=None,
+                         model="gpt-3.5-turbo", max_tokens=300, reduce_max_tokens=600, reduce_input_tokens=3000,
+                         progress=None, delta=None):
+    """
+    Summarize chunks (map) and merge the chunk summaries into one summary (reduce).
+
+    Both passes go through the per-chunk cache, so re-running an episode only
+    pays for chunks whose text changed. When the chunk summaries do not fit in
+    one reduce request they are grouped and reduced level by level.
+    """
+    stats = {"hits": 0, "misses": 0}
+    summaries = summarize_chunks(
+        client, chunks, limiter, max_workers, cache_get, cache_save, stats, progress, "map", delta,
+        model=model, max_tokens=max_tokens
+    )
+
+    level = 0
+    merged = None
+    usable = [summary for summary in summaries if summary != FAILED_CHUNK_PLACEHOLDER]
+    while len(usable) > 1:
+        level += 1
+        groups = chunk_segments(usable, max_tokens=reduce_input_tokens, model=model)
+        if len(groups) >= len(usable):
+            # Each summary fills a reduce request on its own; merge pairs so every level shrinks
+            groups = [SEGMENT_SEPARATOR.join(usable[i:i + 2]) for i in range(0, len(usable), 2)]
+        logging.info(f"Reduce level {level}: merging {len(usable)} summaries in {len(groups)} requests")
+        reduced = summarize_chunks(
+            client, groups, limiter, max_workers, cache_get, cache_save, stats, progress, f"reduce-{level}", delta,
+            model=model, max_tokens=reduce_max_tokens, prompt=REDUCE_PROMPT
+        )
+        if FAILED_CHUNK_PLACEHOLDER in reduced:
+            logging.warning(f"Reduce level {level} failed, returning the chunk summaries unmerged")
+            break
+        usable = reduced
+    else:
+        if usable:
+            merged = usable[0]
+
+    logging.info(f"Chunk cache: {stats['hits']} hits, {stats['misses']} misses")
+
+    if merged is None:
+        return SEGMENT_SEPARATOR.join(summaries)
+    if FAILED_CHUNK_PLACEHOLDER in summaries:
+        # Keep flagging the sections that could not be summarized
+        return SEGMENT_SEPARATOR.join([merged, FAILED_CHUNK_PLACEHOLDER])
+    return merged
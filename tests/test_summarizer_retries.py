@@ -0,0 +1,100 @@
+import time
+
+import pytest
+
+import summarizer
+from benchmark import FakeOpenAIServer
+from openai_client import create_client
+from rate_limiter import RateLimiter
+from summarizer import FAILED_CHUNK_PLACEHOLDER, summarize_chunks
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def start(**kwargs):
+        server = FakeOpenAIServer(latency=0.0, **kwargs).start()
+        servers.append(server)
+        return server, create_client("test-key", base_url=server.base_url)
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+class RecordingTime:
+    """Stands in for summarizer's time module, recording sleeps instead of sleeping."""
+
+    def __init__(self):
+        self.sleeps = []
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+class RecordingLimiter(RateLimiter):
+    def __init__(self):
+        super().__init__()
+        self.pauses = []
+
+    def pause(self, seconds):
+        self.pauses.append(seconds)
+        super().pause(seconds)
+
+
+def test_rate_limits_wait_for_retry_after_ms(serve):
+    server, client = serve(statuses=(429, 429), retry_after_ms=300)
+    limiter = RateLimiter()
+    started = time.monotonic()
+    summaries = summarize_chunks(client, ["some transcript text"], limiter)
+    elapsed = time.monotonic() - started
+
+    assert summaries[0] != FAILED_CHUNK_PLACEHOLDER
+    # The client's own retries are off: every attempt is one of ours
+    stats = server.stats()
+    assert (stats["requests"], stats["rate_limited"]) == (3, 2)
+    # Two waits of the server's 0.3s, not the 2s + 4s exponential fallback
+    assert 0.6 <= elapsed < 2.0
+    assert limiter.total_wait >= 0.5
+
+
+def test_rate_limits_wait_for_retry_after_seconds(serve):
+    server, client = serve(statuses=(429,), retry_after_ms=1000, retry_after_header="retry-after")
+    started = time.monotonic()
+    summaries = summarize_chunks(client, ["some transcript text"], RateLimiter())
+    elapsed = time.monotonic() - started
+
+    assert summaries[0] != FAILED_CHUNK_PLACEHOLDER
+    assert server.stats()["requests"] == 2
+    assert 1.0 <= elapsed < 2.0
+
+
+def test_retry_after_pauses_the_shared_limiter(serve):
+    server, client = serve(statuses=(429,), retry_after_ms=250)
+    limiter = RecordingLimiter()
+    summarize_chunks(client, ["some transcript text"], limiter)
+    # Every worker sharing the limiter is held back, not only the rejected one
+    assert limiter.pauses == [0.25]
+
+
+def test_server_errors_back_off_exponentially(serve, monkeypatch):
+    server, client = serve(statuses=(500, 503))
+    clock = RecordingTime()
+    monkeypatch.setattr(summarizer, "time", clock)
+    summaries = summarize_chunks(client, ["some transcript text"], RateLimiter())
+
+    assert summaries[0] != FAILED_CHUNK_PLACEHOLDER
+    assert server.stats()["requests"] == 3
+    assert clock.sleeps == [2, 4]
+
+
+def test_gives_up_after_max_retries(serve):
+    server, client = serve(rate_limit_ratio=1.0, retry_after_ms=10)
+    summaries = summarize_chunks(client, ["some transcript text"], RateLimiter(), max_retries=3)
+
+    assert summaries == [FAILED_CHUNK_PLACEHOLDER]
+    assert server.stats()["requests"] == 3
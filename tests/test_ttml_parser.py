@@ -0,0 +1,56 @@
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from ttml_parser import TTML_NS, hash_and_extract_segments, hash_file, iter_paragraphs, render_transcript
+
+
+def findall_transcript(ttml, include_timestamps=False):
+    """The original ET.fromstring + findall extraction, which the streaming parser must match."""
+    segments = []
+    for paragraph in ET.fromstring(ttml).findall(f".//{{{TTML_NS}}}p"):
+        text = ""
+        for span in paragraph.findall(f".//{{{TTML_NS}}}span"):
+            if span.text:
+                text += span.text.strip() + " "
+        if text.strip():
+            segments.append((paragraph.attrib.get("begin"), text.strip()))
+    return render_transcript(segments, include_timestamps)
+
+
+def ttml(body):
+    return f'<tt xmlns="{TTML_NS}"><body><div>{body}</div></body></tt>'
+
+
+@pytest.mark.parametrize("body", [
+    '<p begin="1.5s"><span>Hello</span> <span> world </span></p><p begin="62s"><span>Again</span></p>',
+    '<p><span>a<span>b</span></span><span>c</span></p>',
+    '<p><span/></p><p><span>   </span></p><p><span>kept</span></p>',
+    '<p><span>o</span><p><span>i</span></p></p>',
+    '<p begin="1s"><span>x</span><p begin="2s"><span>y</span><p><span>z</span></p></p><span>w</span></p>',
+    '<p begin="bad"><span>odd begin</span></p>',
+])
+@pytest.mark.parametrize("include_timestamps", [False, True])
+def test_matches_findall_extraction(body, include_timestamps):
+    document = ttml(body)
+    expected = findall_transcript(document, include_timestamps)
+    assert render_transcript(iter_paragraphs(document), include_timestamps) == expected
+    # Fed in tiny chunks, as when streaming an upload
+    assert render_transcript(iter_paragraphs(document.encode("utf-8"), chunk_size=7), include_timestamps) == expected
+
+
+def test_nested_paragraphs_are_separate_segments():
+    assert render_transcript(iter_paragraphs(ttml('<p><span>o</span><p><span>i</span></p></p>'))) == "o i\n\ni"
+
+
+def test_malformed_document_raises():
+    with pytest.raises(ET.ParseError):
+        list(iter_paragraphs(ttml("<p><span>unclosed</p>")))
+
+
+def test_hash_matches_single_pass_hash(tmp_path):
+    path = tmp_path / "episode.ttml"
+    path.write_bytes(ttml('<p begin="1s"><span>café</span></p>').encode("utf-8").replace(b"<body>", b"\r\n<body>"))
+    file_hash, segments = hash_and_extract_segments(str(path))
+    assert file_hash == hash_file(str(path))
+    assert segments == [("1s", "café")]
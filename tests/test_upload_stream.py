@@ -0,0 +1,47 @@
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from ttml_parser import TTML_NS, hash_and_extract_segments, hash_file
+from upload_stream import HashingUploadStream
+
+EPISODE = (
+    '﻿<?xml version="1.0" encoding="UTF-8"?>\r\n'
+    f'<tt xmlns="{TTML_NS}"><body>\r\n'
+    + "".join(f'<p begin="{i}s"><span>Café {i}</span> <span>naïve</span></p>\r\n' for i in range(200))
+    + "</body></tt>"
+).encode("utf-8")
+
+
+def receive(data, chunk_size):
+    stream = HashingUploadStream(max_memory=1024)
+    for start in range(0, len(data), chunk_size):
+        stream.write(data[start:start + chunk_size])
+    stream.seek(0)
+    return stream
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 4096, len(EPISODE)])
+def test_hash_and_segments_match_reading_the_file(tmp_path, chunk_size):
+    path = tmp_path / "episode.ttml"
+    path.write_bytes(EPISODE)
+    stream = receive(EPISODE, chunk_size)
+
+    assert stream.hexdigest() == hash_file(str(path))
+    assert (stream.hexdigest(), stream.segments()) == hash_and_extract_segments(str(path))
+    assert stream.size == len(EPISODE)
+    # The raw bytes are still readable
+    assert stream.read() == EPISODE
+
+
+def test_malformed_upload_still_has_a_hash():
+    stream = receive(EPISODE[:-10], 64)
+    assert len(stream.hexdigest()) == 32
+    with pytest.raises(ET.ParseError):
+        stream.segments()
+
+
+def test_non_utf8_upload_is_rejected():
+    stream = receive(EPISODE.decode("utf-8").encode("latin-1", errors="replace"), 64)
+    with pytest.raises(UnicodeDecodeError):
+        stream.hexdigest()
@@ -0,0 +1,62 @@
+import time
+
+from ttml_parser import TTML_NS, hash_and_extract_segments, hash_file
+from watcher import IngestPipeline
+
+EPISODE = f'<tt xmlns="{TTML_NS}"><body><p begin="1s"><span>Hello</span></p></body></tt>'
+
+
+def run_pipeline(paths, is_done=None, timeout=5):
+    reads = []
+    processed = []
+
+    def extract(path):
+        reads.append(path)
+        return hash_and_extract_segments(path)
+
+    def process(path, file_hash, segments):
+        processed.append((path, file_hash, segments))
+
+    pipeline = IngestPipeline(process, workers=1, settle_seconds=0.05, poll_interval=0.01, is_done=is_done,
+                              extract=extract)
+    pipeline.start()
+    try:
+        for path in paths:
+            pipeline.submit(str(path))
+        deadline = time.monotonic() + timeout
+        while len(reads) < len(paths) and time.monotonic() < deadline:
+            time.sleep(0.02)
+        # Let the last file reach process()
+        time.sleep(0.1)
+    finally:
+        pipeline.stop(timeout=2)
+    return reads, processed
+
+
+def test_each_file_is_read_once_and_hashed_as_parsed(tmp_path):
+    path = tmp_path / "episode.ttml"
+    path.write_text(EPISODE, encoding="utf-8")
+    reads, processed = run_pipeline([path])
+
+    assert reads == [str(path)]
+    assert processed == [(str(path), hash_file(str(path)), [("1s", "Hello")])]
+
+
+def test_duplicate_content_is_processed_once(tmp_path):
+    first, second = tmp_path / "a.ttml", tmp_path / "b.ttml"
+    first.write_text(EPISODE, encoding="utf-8")
+    second.write_text(EPISODE, encoding="utf-8")
+    done = set()
+    reads, processed = run_pipeline([first], is_done=done.__contains__)
+    done.update(file_hash for _, file_hash, _ in processed)
+
+    reads, processed = run_pipeline([second], is_done=done.__contains__)
+    assert reads == [str(second)]
+    assert processed == []
+
+
+def test_other_extensions_are_ignored(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_text("not a transcript", encoding="utf-8")
+    reads, processed = run_pipeline([path], timeout=0.3)
+    assert reads == [] and processed == []
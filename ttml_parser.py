@@ -0,0 +1,197 @@
+# ttml_parser.py
+import hashlib
+import io
+import logging
+import re
+import xml.etree.ElementTree as ET
+
+# Namespace used by Apple Podcasts TTML transcripts
+TTML_NS = "http://www.w3.org/ns/ttml"
+P_TAG = f"{{{TTML_NS}}}p"
+SPAN_TAG = f"{{{TTML_NS}}}span"
+READ_CHUNK_SIZE = 64 * 1024
+SEGMENT_SEPARATOR = "\n\n"
+RENDERED_TIMESTAMP = re.compile(r"\[(\d+):(\d{2}):(\d{2})\] ")
+
+
+def format_timestamp(seconds):
+    """Format seconds into HH:MM:SS format."""
+    try:
+        h = int(seconds // 3600)
+        m = int((seconds % 3600) // 60)
+        s = int(seconds % 60)
+        return f"{h:02}:{m:02}:{s:02}"
+    except Exception as e:
+        logging.error(f"Error formatting timestamp {seconds}: {str(e)}")
+        return "00:00:00"  # Return default on error
+
+
+def open_ttml_source(source):
+    """Wrap TTML content (str or bytes) in a file object; pass paths and file objects through."""
+    if isinstance(source, str) and source.lstrip("\ufeff \t\r\n").startswith("<"):
+        return io.StringIO(source)
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+    return source
+
+
+class StreamingTTMLParser:
+    """
+    Incremental TTML paragraph extractor fed with chunks of text or bytes.
+
+    feed() returns the (begin, text) pairs completed by each chunk. Elements
+    are cleared and detached as soon as their paragraph closes, so memory
+    stays flat regardless of document length. `begin` is the raw attribute
+    value, or None when the paragraph has no begin attribute.
+    """
+
+    def __init__(self):
+        self._parser = ET.XMLPullParser(events=("start", "end"))
+        self._stack = []
+        # Like findall(".//p"), a <p> nested in another is a paragraph of its own
+        # and its spans also count towards the outer one. Paragraphs are kept
+        # until the outermost one closes so they come out in document order.
+        self._paragraphs = []  # [begin, span slot indexes] of the current outermost <p> and its nested ones
+        self._open_paragraphs = []
+        # Text slots for the spans of the open paragraphs, in document order.
+        # Spans are assigned a slot when they open and filled when they close so
+        # nested spans come out in the same order as findall(".//span").
+        self._slots = []
+        self._open_spans = []
+
+    def feed(self, data):
+        self._parser.feed(data)
+        return list(self._drain())
+
+    def close(self):
+        self._parser.close()
+        return list(self._drain())
+
+    def _drain(self):
+        for event, elem in self._parser.read_events():
+            if event == "start":
+                self._stack.append(elem)
+                if elem.tag == P_TAG:
+                    self._open_paragraphs.append(len(self._paragraphs))
+                    self._paragraphs.append((elem.attrib.get("begin"), []))
+                elif elem.tag == SPAN_TAG and self._open_paragraphs:
+                    for i in self._open_paragraphs:
+                        self._paragraphs[i][1].append(len(self._slots))
+                    self._open_spans.append(len(self._slots))
+                    self._slots.append(None)
+                continue
+
+            self._stack.pop()
+            if elem.tag == SPAN_TAG and self._open_spans:
+                text = elem.text
+                self._slots[self._open_spans.pop()] = text.strip() + " " if text else ""
+            elif elem.tag == P_TAG:
+                self._open_paragraphs.pop()
+                if self._open_paragraphs:
+                    continue
+                for begin, slots in self._paragraphs:
+                    paragraph_text = "".join(self._slots[i] for i in slots).strip()
+                    if paragraph_text:
+                        yield begin, paragraph_text
+                self._paragraphs = []
+                self._slots = []
+                elem.clear()
+                if self._stack:
+                    self._stack[-1].remove(elem)
+
+
+def iter_paragraphs(source, hasher=None, chunk_size=READ_CHUNK_SIZE):
+    """
+    Stream (begin, text) pairs for every non-empty <p> in a TTML document.
+
+    `source` may be a path, a file object or the document itself. When a
+    hashlib object is given as `hasher`, every chunk read is also fed to it
+    (text is hashed as UTF-8), so the file is hashed and parsed in one read.
+    """
+    source = open_ttml_source(source)
+    should_close = not hasattr(source, "read")
+    f = open(source, "rb") if should_close else source
+    try:
+        parser = StreamingTTMLParser()
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                break
+            if hasher is not None:
+                hasher.update(data.encode("utf-8") if isinstance(data, str) else data)
+            yield from parser.feed(data)
+        yield from parser.close()
+    finally:
+        if should_close:
+            f.close()
+
+
+def begin_seconds(begin):
+    """Seconds from a begin attribute such as "12.5s" or "12.5"; None if missing or malformed."""
+    if begin is None:
+        return None
+    try:
+        return float(begin.replace("s", ""))
+    except ValueError:
+        return None
+
+
+def render_segment(begin, paragraph_text, include_timestamps=False):
+    """Render a single transcript segment, optionally prefixed with its timestamp."""
+    if include_timestamps and begin is not None:
+        try:
+            timestamp = format_timestamp(float(begin.replace("s", "")))
+            return f"[{timestamp}] {paragraph_text}"
+        except ValueError:
+            logging.warning(f"Invalid timestamp format: {begin}")
+    return paragraph_text
+
+
+def render_transcript(segments, include_timestamps=False):
+    """Render (begin, text) segments as a transcript, with or without timestamps."""
+    return SEGMENT_SEPARATOR.join(render_segment(begin, text, include_timestamps) for begin, text in segments)
+
+
+def parse_rendered_transcript(transcript, include_timestamps=False):
+    """
+    Recover (begin, text) segments from a transcript rendered by render_transcript.
+
+    Begin times are only known to the second (as "<seconds>s") and only if
+    the transcript was rendered with timestamps; otherwise they are None.
+    Rendering the result again gives back the same transcript.
+    """
+    segments = []
+    for segment in transcript.split(SEGMENT_SEPARATOR) if transcript else []:
+        match = RENDERED_TIMESTAMP.match(segment) if include_timestamps else None
+        if match:
+            hours, minutes, seconds = (int(group) for group in match.groups())
+            segments.append((f"{hours * 3600 + minutes * 60 + seconds}s", segment[match.end():]))
+        else:
+            segments.append((None, segment))
+    return segments
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    """MD5 of a file's UTF-8 text content (universal newlines), the key of its cache entries, read in chunks."""
+    digest = hashlib.md5()
+    with open(path, "r", encoding="utf-8") as f:
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                break
+            digest.update(data.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def hash_and_extract_segments(path):
+    """
+    Read a TTML file once, returning (md5 hex digest, (begin, text) segments).
+
+    The file is read as UTF-8 text and each chunk is hashed as it is parsed,
+    so the digest matches hash_file without a second pass over the file.
+    Parse errors propagate instead of being returned as text.
+    """
+    hasher = hashlib.md5()
+    with open(path, "r", encoding="utf-8") as f:
+        segments = list(iter_paragraphs(f, hasher=hasher))
+    return hasher.hexdigest(), segments
@@ -0,0 +1,103 @@
+# upload_stream.py
+import codecs
+import hashlib
+import io
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+
+from flask import Request
+
+from ttml_parser import StreamingTTMLParser
+
+# Uploads up to this size stay in memory; larger ones spill to a temporary file
+SPOOL_MAX_MEMORY = 512 * 1024
+
+
+class HashingUploadStream:
+    """
+    Spool for an uploaded file that hashes and parses the content as it is received.
+
+    Werkzeug writes each multipart chunk here while parsing the request
+    body. Chunks are decoded as UTF-8 with universal newlines, exactly like
+    open(path, "r", encoding="utf-8"), fed to MD5, so hexdigest() matches
+    ttml_parser.hash_file of the same file, and fed to a StreamingTTMLParser,
+    so the transcript segments are ready when the body has arrived. The raw
+    bytes are also kept in a SpooledTemporaryFile, so the upload still reads
+    like a file.
+    """
+
+    def __init__(self, max_memory=SPOOL_MAX_MEMORY):
+        self._spool = tempfile.SpooledTemporaryFile(max_size=max_memory)
+        self._digest = hashlib.md5()
+        self._decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder("utf-8")(), translate=True)
+        self._parser = StreamingTTMLParser()
+        self._segments = []
+        self._error = None
+        self._parse_error = None
+        self._hexdigest = None
+        self.size = 0
+        # Time spent parsing, spread over the upload
+        self.parse_seconds = 0.0
+
+    def write(self, data):
+        self.size += len(data)
+        if self._error is None:
+            try:
+                self._consume(self._decoder.decode(data))
+            except UnicodeDecodeError as e:
+                # Raised from hexdigest() so the upload view can report it
+                self._error = e
+        return self._spool.write(data)
+
+    def _consume(self, text):
+        self._digest.update(text.encode("utf-8"))
+        if self._parse_error is None and text:
+            started = time.perf_counter()
+            try:
+                self._segments.extend(self._parser.feed(text))
+            except ET.ParseError as e:
+                # Raised from segments(); the hash is still needed to look up the cache
+                self._parse_error = e
+            self.parse_seconds += time.perf_counter() - started
+
+    def hexdigest(self):
+        """Content hash of everything written; raises UnicodeDecodeError for non-UTF-8 uploads."""
+        if self._hexdigest is None:
+            if self._error is None:
+                try:
+                    self._consume(self._decoder.decode(b"", final=True))
+                except UnicodeDecodeError as e:
+                    self._error = e
+            if self._error is not None:
+                raise self._error
+            self._hexdigest = self._digest.hexdigest()
+            if self._parse_error is None:
+                started = time.perf_counter()
+                try:
+                    self._segments.extend(self._parser.close())
+                except ET.ParseError as e:
+                    self._parse_error = e
+                self.parse_seconds += time.perf_counter() - started
+        return self._hexdigest
+
+    def segments(self):
+        """The (begin, text) segments parsed during the upload; raises the parse error for malformed TTML."""
+        self.hexdigest()
+        if self._parse_error is not None:
+            raise self._parse_error
+        return self._segments
+
+    def __getattr__(self, name):
+        # read, seek, tell, close, ... go to the spooled bytes
+        return getattr(self._spool, name)
+
+    def __iter__(self):
+        return iter(self._spool)
+
+
+class HashingRequest(Request):
+    """Flask request whose file uploads are hashed while the body is received."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingUploadStream()
@@ -1,28 +1,168 @@
-from flask import Flask, render_template, send_from_directory
+from flask import Flask, abort, jsonify, render_template, request, send_from_directory
+import atexit
+import logging
+import math
 import os
+import threading
+
+from manifest import SORT_COLUMNS, FileManifest
+from watcher import IngestPipeline, PipelineEventHandler
 
 app = Flask(__name__)
 
 # Path to the folder containing transcripts and summaries
-TRANSCRIPTS_DIR = "./transcripts"
+TRANSCRIPTS_DIR = os.getenv("TRANSCRIPTS_DIR", "./transcripts")
+# Listing index of TRANSCRIPTS_DIR, kept up to date by the watcher
+MANIFEST_PATH = os.getenv("VIEWER_MANIFEST_PATH", "cache/viewer_manifest.db")
+PAGE_SIZE = int(os.getenv("VIEWER_PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = 500
+
+_manifest = None
+_manifest_lock = threading.Lock()
+_watcher = None
+
+def get_manifest():
+    """Return the shared manifest, opening it on first use."""
+    global _manifest
+    if _manifest is None:
+        with _manifest_lock:
+            if _manifest is None:
+                os.makedirs(TRANSCRIPTS_DIR, exist_ok=True)
+                _manifest = FileManifest(TRANSCRIPTS_DIR, MANIFEST_PATH)
+    return _manifest
+
+def _int_arg(name, default, minimum, maximum=None):
+    try:
+        value = int(request.args.get(name, default))
+    except ValueError:
+        abort(400, f"{name} must be an integer")
+    return max(minimum, min(value, maximum) if maximum is not None else value)
 
 @app.route("/")
 def index():
     """
-    List all transcript and summary files in the transcripts directory.
+    List transcript and summary files one page at a time, from the manifest.
+
+    Query parameters: page, per_page, sort (name, path, size, mtime or
+    segments), order (asc or desc) and q (substring of the path). Returns
+    JSON with ?format=json or an Accept header preferring JSON.
     """
-    files = []
-    for root, _, filenames in os.walk(TRANSCRIPTS_DIR):
-        for filename in filenames:
-            files.append(os.path.relpath(os.path.join(root, filename), TRANSCRIPTS_DIR))
-    return render_template("index.html", files=files)
+    page = _int_arg("page", 1, 1)
+    per_page = _int_arg("per_page", PAGE_SIZE, 1, MAX_PAGE_SIZE)
+    sort = request.args.get("sort", "name")
+    if sort not in SORT_COLUMNS:
+        abort(400, f"sort must be one of {', '.join(SORT_COLUMNS)}")
+    order = "desc" if request.args.get("order") == "desc" else "asc"
+    query = request.args.get("q", "").strip()
 
-@app.route("/transcripts/<path:filename")
+    files, total = get_manifest().list_files(page=page, per_page=per_page, sort=sort, order=order, query=query or None)
+    listing = {
+        "files": files,
+        "total": total,
+        "page": page,
+        "per_page": per_page,
+        "pages": max(1, math.ceil(total / per_page)),
+        "sort": sort,
+        "order": order,
+        "q": query,
+    }
+    wants_json = request.args.get("format") == "json" or (
+        request.accept_mimetypes.best_match(["text/html", "application/json"]) == "application/json"
+    )
+    if wants_json:
+        return jsonify(listing)
+    return render_template("viewer.html", **listing)
+
+@app.route("/transcripts/<path:filename>")
 def download_file(filename):
     """
     Serve a specific transcript or summary file for download or viewing.
+
+    Responses carry Last-Modified, an ETag from the manifest's content hash
+    and Cache-Control: no-cache, so repeat views are revalidated with a 304
+    instead of a new download; Range requests get partial content.
+    """
+    path = os.path.join(TRANSCRIPTS_DIR, filename)
+    etag = True
+    row = get_manifest().get(filename)
+    if row is not None:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            stat = None
+        # Only trust the stored hash while the file is the one it was computed from
+        if stat is not None and (stat.st_size, stat.st_mtime) == (row["size"], row["mtime"]):
+            etag = row["file_hash"]
+    response = send_from_directory(TRANSCRIPTS_DIR, filename, etag=etag, conditional=True)
+    # Werkzeug only sets this on responses to Range requests
+    response.headers.setdefault("Accept-Ranges", "bytes")
+    return response
+
+class ManifestHandler(PipelineEventHandler):
+    """Keeps the manifest in step with TRANSCRIPTS_DIR: changes go through the pipeline, deletions apply at once."""
+
+    def __init__(self, pipeline, manifest):
+        super().__init__(pipeline)
+        self.manifest = manifest
+
+    def on_deleted(self, event):
+        self.manifest.remove(event.src_path)
+
+    def on_moved(self, event):
+        self.manifest.remove(event.src_path)
+        if event.is_directory:
+            # A renamed directory's files are not reported one by one
+            self.pipeline.rescan(event.dest_path, recursive=True)
+        else:
+            super().on_moved(event)
+
+def start_watcher():
+    """Reconcile the manifest in the background and watch TRANSCRIPTS_DIR; returns (observer, pipeline)."""
+    from watchdog.observers import Observer
+
+    manifest = get_manifest()
+    pipeline = IngestPipeline(
+        process=lambda path, file_hash, payload: manifest.update(path),
+        workers=1,
+        extract=None,
+        extensions=("",),  # every file, not only TTML
+        name="viewer-manifest"
+    )
+    pipeline.start()
+    observer = Observer()
+    observer.schedule(ManifestHandler(pipeline, manifest), TRANSCRIPTS_DIR, recursive=True)
+    observer.start()
+    threading.Thread(target=manifest.sync, name="viewer-manifest-sync", daemon=True).start()
+    logging.info(f"Started file watcher for directory: {TRANSCRIPTS_DIR}")
+    return observer, pipeline
+
+def stop_watcher():
+    global _watcher
+    with _manifest_lock:
+        watcher, _watcher = _watcher, None
+    if watcher is not None:
+        observer, pipeline = watcher
+        observer.stop()
+        observer.join()
+        pipeline.stop()
+
+@app.before_request
+def ensure_watcher():
+    """
+    Start the manifest sync and watcher once per process, on its first request.
+
+    This also covers the viewer served by gunicorn or another WSGI server,
+    where the __main__ block never runs.
     """
-    return send_from_directory(TRANSCRIPTS_DIR, filename)
+    global _watcher
+    if _watcher is None:
+        get_manifest()
+        with _manifest_lock:
+            if _watcher is None:
+                _watcher = start_watcher()
+                atexit.register(stop_watcher)
 
 if __name__ == "__main__":
-    app.run(debug=True)
\ No newline at end of file
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    # The reloader would start a second watcher
+    app.run(debug=True, use_reloader=False)
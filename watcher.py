@@ -0,0 +1,178 @@
+# watcher.py
+import logging
+import os
+import queue
+import threading
+import time
+import traceback
+
+from watchdog.events import FileSystemEventHandler
+
+from metrics import trace
+
+
+class IngestPipeline:
+    """
+    Non-blocking file ingestion: settle, de-duplicate, then process on a worker pool.
+
+    submit() only records the path, so it is safe to call from a watchdog
+    observer thread. A settle thread waits until a file's size and mtime have
+    stopped changing for `settle_seconds` (so half-copied files are never
+    read) and queues it for the `workers` threads.
+
+    Each worker runs `extract(path)`, which reads the file once and returns
+    (file_hash, payload) - e.g. the hash and the transcript segments, hashed
+    as they are parsed, so both describe the same bytes. Content that is
+    already being processed or reported as done by `is_done(file_hash)` is
+    dropped; everything else goes to `process(path, file_hash, payload)`.
+    With `extract=None` files are passed on unread, with a hash and payload
+    of None.
+    """
+
+    def __init__(self, process, workers=2, settle_seconds=2.0, poll_interval=0.5, is_done=None,
+                 extract=None, extensions=(".ttml",), name="ingest"):
+        self.process = process
+        self.workers = workers
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.is_done = is_done
+        self.extract = extract
+        self.extensions = extensions
+        self.name = name
+
+        self._settling = {}  # path -> (size, mtime, unchanged since)
+        self._in_flight = set()
+        self._work = queue.Queue()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self._threads.append(threading.Thread(target=self._settle_loop, name=f"{self.name}-settle", daemon=True))
+        for i in range(self.workers):
+            self._threads.append(threading.Thread(target=self._worker_loop, name=f"{self.name}-worker-{i}", daemon=True))
+        for thread in self._threads:
+            thread.start()
+        logging.info(f"Started {self.name} pipeline with {self.workers} workers")
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        for _ in range(self.workers):
+            self._work.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def accepts(self, path):
+        return path.endswith(self.extensions)
+
+    def submit(self, path):
+        """Queue a path for settling; repeated events for the same path restart its settle timer."""
+        if not self.accepts(path):
+            return
+        with self._lock:
+            self._settling[path] = (None, None, time.monotonic())
+
+    def rescan(self, directory, recursive=False):
+        """Submit every matching file already in directory, e.g. ones dropped while the app was down."""
+        if not os.path.isdir(directory):
+            return 0
+        count = 0
+        for root, dirs, filenames in os.walk(directory):
+            for filename in filenames:
+                path = os.path.join(root, filename)
+                if self.accepts(path):
+                    self.submit(path)
+                    count += 1
+            if not recursive:
+                break
+        logging.info(f"Rescan of {directory} found {count} files")
+        return count
+
+    def _settle_loop(self):
+        while not self._stopping.is_set():
+            now = time.monotonic()
+            settled = []
+            with self._lock:
+                paths = list(self._settling.items())
+            for path, (size, mtime, since) in paths:
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    with self._lock:
+                        self._settling.pop(path, None)
+                    continue
+                with self._lock:
+                    if path not in self._settling:
+                        continue
+                    if (stat.st_size, stat.st_mtime) != (size, mtime):
+                        self._settling[path] = (stat.st_size, stat.st_mtime, now)
+                    elif now - since >= self.settle_seconds and self._settling[path][2] == since:
+                        del self._settling[path]
+                        settled.append(path)
+
+            for path in settled:
+                self._work.put(path)
+            self._stopping.wait(self.poll_interval)
+
+    def _claim(self, path):
+        """Read a settled file and claim its content; return (file_hash, payload), or None to skip it."""
+        file_hash, payload = self.extract(path)
+        with self._lock:
+            if file_hash in self._in_flight:
+                logging.info(f"Skipping {path}: identical content is already being processed")
+                return None
+        if self.is_done is not None and self.is_done(file_hash):
+            logging.info(f"Skipping {path}: already processed")
+            return None
+        with self._lock:
+            if file_hash in self._in_flight:
+                return None
+            self._in_flight.add(file_hash)
+        return file_hash, payload
+
+    def _worker_loop(self):
+        while True:
+            path = self._work.get()
+            if path is None:
+                return
+            file_hash = None
+            try:
+                # One trace id per file ties its log lines together
+                with trace():
+                    payload = None
+                    if self.extract is not None:
+                        claimed = self._claim(path)
+                        if claimed is None:
+                            continue
+                        file_hash, payload = claimed
+                    self.process(path, file_hash, payload)
+            except FileNotFoundError:
+                logging.info(f"Skipping {path}: removed before it was processed")
+            except Exception as e:
+                logging.error(f"Error processing file {path}: {str(e)}")
+                logging.error(traceback.format_exc())
+            finally:
+                if file_hash is not None:
+                    with self._lock:
+                        self._in_flight.discard(file_hash)
+
+
+class PipelineEventHandler(FileSystemEventHandler):
+    """Watchdog handler that hands new and changed files to an IngestPipeline."""
+
+    def __init__(self, pipeline):
+        super().__init__()
+        self.pipeline = pipeline
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.pipeline.submit(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.pipeline.submit(event.src_path)
+
+    def on_moved(self, event):
+        # Files written to a temporary name and renamed into place
+        if not event.is_directory:
+            self.pipeline.submit(event.dest_path)